@@ -0,0 +1,277 @@
+#! /usr/bin/env python3
+'''
+Benchmarks for py3dephell.
+
+Generates reproducible synthetic corpus (packages with deep subpackages, relative imports,
+.pth files, extension modules and installed distributions) and measures wall time, CPU time
+and peak memory (tracemalloc) of generate_requirements, generate_provides, genprov_from_env
+and standard library scan. Results are written as json, so they can be compared between releases:
+
+    python3 benchmarks/bench.py --files 10000 --output new.json --compare old.json
+'''
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import sysconfig
+import tempfile
+import tracemalloc
+from pathlib import Path
+from statistics import median
+from shutil import rmtree
+from contextlib import redirect_stderr
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.joinpath('src').as_posix())
+
+from py3dephell import py3prov, py3req  # noqa: E402
+
+
+BENCH_VERSION = 1
+STDLIB_MODULES = ['os', 'sys', 're', 'json', 'ast', 'typing', 'collections', 'functools', 'itertools',
+                  'pathlib', 'subprocess', 'logging', 'os.path', 'importlib', 'dataclasses']
+EXT_SUFFIX = sysconfig.get_config_var('EXT_SUFFIX') or '.so'
+
+
+def _module_text(rnd, pkg, level, siblings, externals):
+    lines = ['"""Generated module"""']
+    for mod in rnd.sample(STDLIB_MODULES, 4):
+        lines.append(f'import {mod}')
+    for mod in rnd.sample(externals, min(2, len(externals))):
+        lines.append(f'from {mod} import func')
+    for sibling in rnd.sample(siblings, min(2, len(siblings))):
+        lines.append(f'from . import {sibling}')
+    if level > 0:
+        lines.append(f'from {"." * (level + 1)} import {pkg}_mod_0')
+    lines.append('try:\n    import ujson as json_impl\nexcept ImportError:\n    json_impl = None')
+    lines.append(f'importlib.import_module("{rnd.choice(STDLIB_MODULES)}")')
+    lines.append('\n\ndef func(arg):\n    import pickle\n    return arg\n')
+    lines.append(f'\nclass Generated{level}:\n    value = {rnd.randrange(1 << 16)}\n')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_record(site, name, version, files):
+    dist_info = site.joinpath(f'{name}-{version}.dist-info')
+    dist_info.mkdir()
+    with open(dist_info.joinpath('RECORD'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        for file in files:
+            writer.writerow([file.relative_to(site).as_posix(), '', ''])
+        writer.writerow([f'{dist_info.name}/RECORD', '', ''])
+
+
+def generate_corpus(root, files=1000, depth=4, modules_per_pkg=8, dists=50, seed=0):
+    '''
+    Generate synthetic corpus
+
+    :param root: directory, where corpus is created
+    :type root: str or pathlib.Path
+    :param files: approximate number of python files
+    :type files: int
+    :param depth: depth of subpackages
+    :type depth: int
+    :param modules_per_pkg: number of modules in each (sub)package
+    :type modules_per_pkg: int
+    :param dists: number of installed distributions in environment
+    :type dists: int
+    :param seed: seed for random generator
+    :type seed: int
+    :return: description of corpus
+    :rtype: dict
+    '''
+    rnd = random.Random(seed)
+    root = Path(root)
+    project = root.joinpath('project')
+    site = root.joinpath('site-packages')
+    project.mkdir(parents=True)
+    site.mkdir(parents=True)
+
+    externals = [f'dist_{i}' for i in range(dists)]
+    for i, name in enumerate(externals):
+        pkg = site.joinpath(name)
+        pkg.mkdir()
+        dist_files = [pkg.joinpath('__init__.py'), pkg.joinpath('core.py'), pkg.joinpath(f'_speedups{EXT_SUFFIX}')]
+        dist_files[0].write_text('def func():\n    pass\n')
+        dist_files[1].write_text('import os\n')
+        dist_files[2].write_bytes(b'\x7fELF\x02')
+        _write_record(site, name, f'{i}.0', dist_files)
+
+    count = 0
+    pkg_num = 0
+    pth_num = 0
+    while count < files:
+        top = f'pkg_{pkg_num}'
+        path = project.joinpath(top)
+        for level in range(depth):
+            path.mkdir()
+            mods = [f'{top}_mod_{i}' for i in range(modules_per_pkg)]
+            path.joinpath('__init__.py').write_text(_module_text(rnd, top, level, mods, externals))
+            for mod in mods:
+                path.joinpath(f'{mod}.py').write_text(_module_text(rnd, top, level, mods, externals))
+            path.joinpath(f'_ext{EXT_SUFFIX}').write_bytes(b'\x7fELF\x02')
+            count += modules_per_pkg + 1
+            if count >= files:
+                break
+            path = path.joinpath(f'sub_{level}')
+        if pkg_num % 10 == 0:
+            project.joinpath(f'extra_{pth_num}.pth').write_text(f'{top}\nimport os\n# comment\n')
+            pth_num += 1
+        pkg_num += 1
+
+    return {'files': count, 'packages': pkg_num, 'pth': pth_num, 'depth': depth,
+            'modules_per_pkg': modules_per_pkg, 'dists': dists, 'seed': seed}
+
+
+def list_files(path):
+    '''
+    List all files in directory in stable order
+    '''
+    result = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        result.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+    return result
+
+
+def measure(func, repeat=3, memory=True):
+    '''
+    Measure function: minimal and median wall time, CPU time and peak memory of separate run
+
+    :param func: function without arguments
+    :type func: callable
+    :param repeat: number of timed runs
+    :type repeat: int
+    :param memory: measure peak memory with tracemalloc (in additional run)
+    :type memory: Bool
+    :return: measurements
+    :rtype: dict
+    '''
+    wall = []
+    cpu = []
+    with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+        for _ in range(repeat):
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            func()
+            wall.append(time.perf_counter() - start_wall)
+            cpu.append(time.process_time() - start_cpu)
+
+    result = {'wall_min': min(wall), 'wall_median': median(wall),
+              'cpu_min': min(cpu), 'cpu_median': median(cpu), 'runs': repeat}
+    if memory:
+        tracemalloc.start()
+        try:
+            with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+                func()
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(root, corpus, repeat=3, memory=True, only=None):
+    '''
+    Run benchmarks on generated corpus
+
+    :return: dict {benchmark name:measurements}
+    :rtype: dict
+    '''
+    project = root.joinpath('project')
+    site = root.joinpath('site-packages')
+    files = list_files(project)
+    # Corpus is isolated from sys.path
+    prefixes = [project.as_posix(), site.as_posix()]
+
+    benchmarks = {
+        'stdlib_scan': lambda: py3req.get_std_provides(),
+        'generate_provides': lambda: py3prov.generate_provides(files, prefixes=prefixes, abs_mode=False,
+                                                               verbose=False),
+        'genprov_from_env': lambda: py3prov.genprov_from_env(paths=[site]),
+        'generate_requirements': lambda: py3req.generate_requirements(files=files, prefixes=prefixes,
+                                                                      add_prov_path=[site.as_posix()],
+                                                                      exclude_stdlib=True, verbose=False),
+        'generate_requirements_inspect_env': lambda: py3req.generate_requirements(
+            files=files, prefixes=prefixes, exclude_stdlib=True, inspect_env=True, env_path=[site],
+            verbose=False),
+    }
+
+    results = {}
+    for name, func in benchmarks.items():
+        if only and name not in only:
+            continue
+        print(f'bench: {name} ...', file=sys.stderr)
+        results[name] = measure(func, repeat=repeat, memory=memory)
+        print(f'bench: {name} {results[name]["wall_min"]:.3f}s', file=sys.stderr)
+    return results
+
+
+def compare(results, baseline):
+    '''
+    Print relative change of results against baseline
+    '''
+    for name, res in results['benchmarks'].items():
+        if (base := baseline.get('benchmarks', {}).get(name)) is None:
+            print(f'{name}: no baseline')
+            continue
+        line = [f'{name}: wall {res["wall_min"]:.3f}s ({(res["wall_min"] / base["wall_min"] - 1) * 100:+.1f}%)']
+        if 'peak_memory' in res and base.get('peak_memory'):
+            line.append(f'memory {res["peak_memory"] >> 10}KiB'
+                        f' ({(res["peak_memory"] / base["peak_memory"] - 1) * 100:+.1f}%)')
+        print(', '.join(line))
+
+
+def main():
+    args = argparse.ArgumentParser(description='Benchmark py3dephell on synthetic corpus')
+    args.add_argument('--files', type=int, default=1000, help='Approximate number of python files in corpus')
+    args.add_argument('--depth', type=int, default=4, help='Depth of subpackages')
+    args.add_argument('--modules_per_pkg', type=int, default=8, help='Number of modules in each package')
+    args.add_argument('--dists', type=int, default=50, help='Number of installed distributions')
+    args.add_argument('--seed', type=int, default=0, help='Seed for corpus generation')
+    args.add_argument('--repeat', type=int, default=3, help='Number of timed runs for each benchmark')
+    args.add_argument('--no_memory', action='store_true', help='Do not measure peak memory with tracemalloc')
+    args.add_argument('--only', action='append', default=[], help='Run only specified benchmark')
+    args.add_argument('--workdir', help='Directory for corpus (temporary directory by default)')
+    args.add_argument('--output', help='Write json results to file instead of stdout')
+    args.add_argument('--compare', help='Json results of previous run to compare with')
+    args = args.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='py3dephell-bench-'))
+    root = workdir.joinpath(f'corpus-{args.files}-{args.depth}-{args.modules_per_pkg}-{args.dists}-{args.seed}')
+    try:
+        if root.exists():
+            rmtree(root)
+        start = time.perf_counter()
+        corpus = generate_corpus(root, files=args.files, depth=args.depth, modules_per_pkg=args.modules_per_pkg,
+                                 dists=args.dists, seed=args.seed)
+        print(f'bench: corpus of {corpus["files"]} files generated in {time.perf_counter() - start:.1f}s',
+              file=sys.stderr)
+        results = {'version': BENCH_VERSION,
+                   'python': sys.version,
+                   'platform': platform.platform(),
+                   'cpus': os.cpu_count(),
+                   'corpus': corpus,
+                   'benchmarks': run_benchmarks(root, corpus, repeat=args.repeat, memory=not args.no_memory,
+                                                only=set(args.only))}
+    finally:
+        if args.workdir:
+            rmtree(root, ignore_errors=True)
+        else:
+            rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,7 +6,19 @@ py3dephell.py3req - detect dependencies, filter them through self-provides
 
 py3dephell.py3prov - detect provides, process .pth files
 
-py3dephell.py3graph - separate package to subpackages according to their dependencies (not fully implemented yet)
+py3dephell.py3cache - persistent caches, which are shared between py3dephell runs
+
+py3dephell.py3batch - generate requirements for many packages described by manifest in one process
+
+py3dephell.py3index - persistent reverse index of provides and requirements of many packages
+
+py3dephell.py3daemon - serve py3req and py3prov over UNIX socket keeping standard library and environment provides warm
+
+py3dephell.py3elf - read ELF class, required shared libraries and python init functions of extension modules
+
+py3dephell.py3stats - statistics of py3dephell run: time per phase, counters and the slowest files
+
+py3dephell.py3graph - import graph of package modules: cycles, reachability and split of package to subpackages
 
 .. include:: ../../README.md
 '''
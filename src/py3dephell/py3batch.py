@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+
+import sys
+import json
+import argparse
+import traceback
+from pathlib import Path
+from .py3req import generate_requirements, iter_requirements, expand_input, _requirements_records
+from .py3prov import write_ndjson
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+
+# Options of package, which are (lists of) pathes, they are resolved relative to the manifest directory
+LIST_PATH_OPTIONS = ('files', 'prefixes', 'add_prov_path', 'env_path')
+PATH_OPTIONS = ('read_prov_from_file', 'stdlib_cache', 'env_index', 'imports_cache')
+OPTIONS = ('add_prov_path', 'prefixes', 'ignore_list', 'read_prov_from_file', 'only_external_deps',
+           'only_top_module', 'exclude_stdlib', 'stdlib_cache', 'inspect_env', 'env_path', 'env_index',
+           'jobs', 'imports_cache', 'engine', 'shared_libs', 'read_ahead', 'read_ahead_memory')
+ENV_OPTIONS = ('inspect_env', 'env_path', 'env_index')
+
+
+def read_manifest(path):
+    '''
+    Read manifest (json or toml, chosen by suffix) and resolve pathes relative to its directory.
+    Manifest contains list "packages" of tables with "name", "files" and options of generate_requirements,
+    table "defaults" with options shared by all packages and optional "output_dir".
+
+    :param path: path to the manifest
+    :type path: str or pathlib.Path
+    :return: manifest
+    :rtype: dict
+    '''
+    path = Path(path)
+    if path.suffix == '.toml':
+        if tomllib is None:
+            raise ValueError(f'py3batch: toml manifest {path} requires python3.11 or newer')
+        with open(path, 'rb') as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(path) as f:
+            manifest = json.load(f)
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('packages'), list):
+        raise ValueError(f'py3batch: manifest {path} should contain list of packages')
+
+    base = path.absolute().parent
+    defaults = manifest.get('defaults', {})
+    packages = []
+    for num, package in enumerate(manifest['packages']):
+        package = {**defaults, **package}
+        if 'name' not in package or 'files' not in package:
+            raise ValueError(f'py3batch: package #{num} in manifest {path} should have name and files')
+        if (unknown := set(package) - set(OPTIONS) - {'name', 'files', 'include_built-in'}):
+            raise ValueError(f'py3batch: unknown options for package {package["name"]}:'
+                             f'{",".join(sorted(unknown))}')
+        for option in LIST_PATH_OPTIONS:
+            if option in package:
+                package[option] = [base.joinpath(p).as_posix() for p in package[option]]
+        for option in PATH_OPTIONS:
+            if package.get(option):
+                package[option] = base.joinpath(package[option]).as_posix()
+        packages.append(package)
+
+    output_dir = manifest.get('output_dir')
+    return {'packages': packages, 'output_dir': base.joinpath(output_dir) if output_dir else None}
+
+
+def process_package(package, output_dir, output_format='text', verbose=False):
+    '''
+    Generate requirements for package from manifest and write them to <output_dir>/<name>.txt
+    (or <name>.ndjson for ndjson format)
+
+    :param package: package from manifest
+    :type package: dict
+    :param output_dir: directory for results
+    :type output_dir: pathlib.Path
+    :param output_format: "text" (sorted list of requirements) or "ndjson" (record per file)
+    :type output_format: str
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: path to the result file
+    :rtype: pathlib.Path
+    '''
+    name = str(package['name'])
+    if Path(name).name != name or name in ('.', '..'):
+        raise ValueError(f'py3batch: package name {name!r} should be plain file name')
+    options = {option: package[option] for option in OPTIONS if option in package}
+    options.setdefault('exclude_stdlib', True)
+    if not package.get('include_built-in'):
+        options['ignore_list'] = list(options.get('ignore_list', [])) + list(sys.builtin_module_names)
+    files = expand_input(package['files'])
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    result = output_dir.joinpath(f'{name}.{"ndjson" if output_format == "ndjson" else "txt"}')
+    with open(result, 'w') as f:
+        if options.get('inspect_env'):
+            dependencies = generate_requirements(files=files, **options, verbose=verbose)
+            if output_format == 'ndjson':
+                write_ndjson(({'requirement': dep} for dep in sorted(dependencies)), stream=f)
+        else:
+            # Records are written as soon as files are processed, only union of requirements is kept
+            requirements = iter_requirements(files, **{option: value for option, value in options.items()
+                                                       if option not in ENV_OPTIONS}, verbose=verbose)
+            dependencies = set()
+            if output_format == 'ndjson':
+                write_ndjson(_requirements_records(requirements), stream=f)
+            else:
+                for file, deps in requirements:
+                    dependencies.update(*deps)
+        if output_format != 'ndjson':
+            f.writelines(f'{dep}\n' for dep in sorted(dependencies))
+    return result
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Generate requirements for many packages described by manifest '
+                                   'in one process, standard library and environment provides are shared')
+    args.add_argument('--output_dir', default=None,
+                      help='Directory for result files (one per package). By default taken from manifest '
+                      'or set to current directory')
+    args.add_argument('--format', choices=['text', 'ndjson'], default='text',
+                      help='Format of result files: sorted requirements or json record per file')
+    args.add_argument('--verbose', action='store_true', help='Turn on verbose mode')
+    args.add_argument('manifest', help='Path to the manifest (.json or .toml)')
+    args = args.parse_args(argv)
+
+    try:
+        manifest = read_manifest(args.manifest)
+    except (OSError, ValueError) as err:
+        print(f'py3batch:ERROR: Failed to read manifest:{err}', file=sys.stderr)
+        return 1
+
+    output_dir = Path(args.output_dir or manifest['output_dir'] or '.')
+    failed = []
+    for package in manifest['packages']:
+        try:
+            result = process_package(package, output_dir, args.format, verbose=args.verbose)
+        except Exception:
+            print(f'py3batch:ERROR: Failed to process package {package["name"]}', file=sys.stderr)
+            traceback.print_exc()
+            failed.append(package['name'])
+            continue
+        if args.verbose:
+            print(f'py3batch:INFO: Requirements of {package["name"]} are written to {result}', file=sys.stderr)
+
+    if failed:
+        print(f'py3batch:ERROR: Failed packages:{",".join(failed)}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+from pathlib import Path
+
+
+CACHE_VERSION = 1
+
+
+def cache_dir():
+    '''
+    Returns directory for py3dephell persistent caches.
+    It is taken from $PY3DEPHELL_CACHE_DIR, $XDG_CACHE_HOME/py3dephell or ~/.cache/py3dephell
+
+    :return: path to the cache directory (it may not exist)
+    :rtype: pathlib.Path
+    '''
+    if (path := os.getenv('PY3DEPHELL_CACHE_DIR')):
+        return Path(path)
+    if (path := os.getenv('XDG_CACHE_HOME')):
+        return Path(path).joinpath('py3dephell')
+    return Path.home().joinpath('.cache', 'py3dephell')
+
+
+def load_json_cache(path, key, verbose=False):
+    '''
+    Load data from the versioned json cache file
+
+    :param path: path to the cache file
+    :type path: str or pathlib.Path
+    :param key: key describing data in cache, data is returned only if stored key is equal to this one
+    :type key: dict
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: cached data or None if cache is missing, broken or outdated
+    :rtype: object or None
+    '''
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        if verbose:
+            print(f'py3cache:WARNING: Failed to read cache {path} due to {err}', file=sys.stderr)
+        return None
+
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION or cache.get('key') != key:
+        if verbose:
+            print(f'py3cache:INFO: Cache {path} is outdated', file=sys.stderr)
+        return None
+    return cache.get('data')
+
+
+def save_json_cache(path, key, data, verbose=False):
+    '''
+    Atomically save data to the versioned json cache file
+
+    :param path: path to the cache file
+    :type path: str or pathlib.Path
+    :param key: key describing data in cache
+    :type key: dict
+    :param data: json-serializable data
+    :type data: object
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: True if cache was saved
+    :rtype: Bool
+    '''
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'key': key, 'data': data}, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError as err:
+        if verbose:
+            print(f'py3cache:WARNING: Failed to save cache {path} due to {err}', file=sys.stderr)
+        return False
+    return True
+
+
+class ImportsCache:
+    '''
+    Persistent cache of imports extracted from files, stored in sqlite3 database.
+    Entries are keyed by hash of the file content and options, that affect extraction.
+    New entries are kept in memory and written by commit in one short transaction,
+    so several processes can share the cache without waiting for each other.
+    When database grows over max_size, least recently used entries are evicted.
+
+    :param path: path to the database
+    :type path: str or pathlib.Path
+    :param max_size: maximum size of cached data in bytes
+    :type max_size: int
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    '''
+    def __init__(self, path, max_size=256 << 20, verbose=False):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        self._used = []
+        self._pending = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS imports (key BLOB PRIMARY KEY, data BLOB NOT NULL,'
+                             ' size INTEGER NOT NULL, atime INTEGER NOT NULL) WITHOUT ROWID')
+            self._db.execute('CREATE INDEX IF NOT EXISTS imports_atime ON imports (atime)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key(code, **options):
+        '''
+        Create key for given file content and extraction options
+
+        :param code: content of file
+        :type code: bytes
+        :param options: options, which affect extraction
+        :return: key
+        :rtype: bytes
+        '''
+        digest = hashlib.blake2b(code, digest_size=20)
+        digest.update(json.dumps([CACHE_VERSION, sys.implementation.cache_tag, options],
+                                 sort_keys=True).encode())
+        return digest.digest()
+
+    def get(self, key):
+        '''
+        Get cached imports
+
+        :param key: key created by ImportsCache.key
+        :type key: bytes
+        :return: cached imports or None
+        :rtype: object or None
+        '''
+        if key in self._pending:
+            self.hits += 1
+            return json.loads(self._pending[key])
+        row = self._db.execute('SELECT data FROM imports WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.append(key)
+        return json.loads(row[0])
+
+    def put(self, key, data, flush_size=1024):
+        '''
+        Store imports in cache (entry is written to database by commit)
+
+        :param key: key created by ImportsCache.key
+        :type key: bytes
+        :param data: json-serializable imports
+        :type data: object
+        :param flush_size: commit, when so many entries are pending
+        :type flush_size: int
+        '''
+        self._pending[key] = json.dumps(data, separators=(',', ':')).encode()
+        if len(self._pending) >= flush_size:
+            self.commit()
+
+    def commit(self):
+        '''
+        Save new entries and access times of used entries in one transaction
+        '''
+        now = time.time_ns()
+        try:
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO imports VALUES (?, ?, ?, ?)',
+                                     ((key, blob, len(blob), now) for key, blob in self._pending.items()))
+                self._db.executemany('UPDATE imports SET atime = ? WHERE key = ?',
+                                     ((now, key) for key in self._used))
+        except sqlite3.Error as err:
+            if self.verbose:
+                print(f'py3cache:WARNING: Failed to save {len(self._pending)} entries to cache {self.path} '
+                      f'due to {err}', file=sys.stderr)
+        self._pending = {}
+        self._used = []
+
+    def evict(self):
+        '''
+        Remove least recently used entries, while cached data is bigger than max_size
+        '''
+        self.commit()
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM imports').fetchone()[0]
+        if total <= self.max_size:
+            return
+        evicted = []
+        for key, size in self._db.execute('SELECT key, size FROM imports ORDER BY atime'):
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        with self._db:
+            self._db.executemany('DELETE FROM imports WHERE key = ?', evicted)
+        if self.verbose:
+            print(f'py3cache:INFO: Evicted {len(evicted)} entries from {self.path}', file=sys.stderr)
+
+    def close(self, evict=True):
+        '''
+        Commit changes, evict old entries and close database
+
+        :param evict: evict old entries, it should be done once by the process, which owns the cache
+        (workers, which share it, only commit their changes)
+        :type evict: Bool
+        '''
+        if not evict:
+            self.commit()
+            self._db.close()
+            return
+        try:
+            self.evict()
+        except sqlite3.Error as err:
+            if self.verbose:
+                print(f'py3cache:WARNING: Failed to evict entries from {self.path} due to {err}', file=sys.stderr)
+        self._db.close()
+
+
+class EnvIndex:
+    '''
+    Persistent index of distributions installed to environment, stored in sqlite3 database.
+    Provides of distribution are reused while mtime of its .dist-info directory is not changed,
+    list of distributions is reused while mtime of site directory is not changed.
+
+    :param path: path to the database
+    :type path: str or pathlib.Path
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    '''
+    def __init__(self, path, verbose=False):
+        self.path = Path(path)
+        self.verbose = verbose
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER NOT NULL,'
+                             ' entries TEXT NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS dists (path TEXT PRIMARY KEY, dir TEXT NOT NULL,'
+                             ' mtime INTEGER NOT NULL, provides TEXT NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS dists_dir ON dists (dir)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def list_dir(self, path):
+        '''
+        List .dist-info directories in site directory, listing is reused while directory mtime is not changed
+
+        :param path: path to the site directory
+        :type path: str or pathlib.Path
+        :return: list of .dist-info directories
+        :rtype: list[pathlib.Path]
+        '''
+        path = Path(path)
+        if (mtime := self._mtime(path)) is None:
+            return []
+        row = self._db.execute('SELECT mtime, entries FROM dirs WHERE path = ?', (path.as_posix(),)).fetchone()
+        if row is not None and row[0] == mtime:
+            return [path.joinpath(entry) for entry in json.loads(row[1])]
+
+        entries = sorted(entry.name for entry in os.scandir(path)
+                         if entry.name.endswith('.dist-info') and entry.is_dir())
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                             (path.as_posix(), mtime, json.dumps(entries)))
+            self._db.execute('CREATE TEMP TABLE IF NOT EXISTS current (path TEXT PRIMARY KEY)')
+            self._db.execute('DELETE FROM current')
+            self._db.executemany('INSERT INTO current VALUES (?)',
+                                 ((path.joinpath(entry).as_posix(),) for entry in entries))
+            self._db.execute('DELETE FROM dists WHERE dir = ? AND path NOT IN (SELECT path FROM current)',
+                             (path.as_posix(),))
+        return [path.joinpath(entry) for entry in entries]
+
+    def get(self, dist_info):
+        '''
+        Get provides of distribution, if its .dist-info directory was not changed
+
+        :param dist_info: path to .dist-info directory
+        :type dist_info: str or pathlib.Path
+        :return: provides or None
+        :rtype: set[str] or None
+        '''
+        dist_info = Path(dist_info)
+        row = self._db.execute('SELECT mtime, provides FROM dists WHERE path = ?',
+                               (dist_info.as_posix(),)).fetchone()
+        if row is None or row[0] != self._mtime(dist_info):
+            return None
+        return set(json.loads(row[1]))
+
+    def put(self, dist_info, provides):
+        '''
+        Store provides of distribution
+
+        :param dist_info: path to .dist-info directory
+        :type dist_info: str or pathlib.Path
+        :param provides: provides of distribution
+        :type provides: set[str]
+        '''
+        dist_info = Path(dist_info)
+        if (mtime := self._mtime(dist_info)) is None:
+            return
+        try:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO dists VALUES (?, ?, ?, ?)',
+                                 (dist_info.as_posix(), dist_info.parent.as_posix(), mtime,
+                                  json.dumps(sorted(provides))))
+        except sqlite3.Error as err:
+            if self.verbose:
+                print(f'py3cache:WARNING: Failed to save index {self.path} due to {err}', file=sys.stderr)
+
+    def close(self):
+        '''
+        Close database
+        '''
+        self._db.close()
@@ -0,0 +1,241 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import sysconfig
+import traceback
+import socketserver
+from pathlib import Path
+from importlib import import_module
+from .py3cache import cache_dir
+
+
+PROGRAMS = {'py3req': 'py3dephell.py3req', 'py3prov': 'py3dephell.py3prov'}
+
+
+def default_socket():
+    '''
+    Returns path to the daemon socket.
+    It is taken from $PY3DEPHELL_SOCKET, $XDG_RUNTIME_DIR/py3dephell.sock or <cache directory>/daemon.sock
+
+    :return: path to the socket
+    :rtype: pathlib.Path
+    '''
+    if (path := os.getenv('PY3DEPHELL_SOCKET')):
+        return Path(path)
+    if (path := os.getenv('XDG_RUNTIME_DIR')):
+        return Path(path).joinpath('py3dephell.sock')
+    return cache_dir().joinpath('daemon.sock')
+
+
+def _run_program(prog, argv):
+    sys.argv = [prog] + argv
+    try:
+        code = import_module(PROGRAMS[prog]).main(argv)
+    except SystemExit as err:
+        code = err.code
+    except Exception:
+        traceback.print_exc()
+        code = 1
+
+    if code is None:
+        return 0
+    if not isinstance(code, int):
+        print(code, file=sys.stderr)
+        return 1
+    return code
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Handles one request in forked process: stdin, stdout and stderr of client are received as file descriptors,
+    so program writes directly to them, working directory, environment and sys.path are taken from client
+    '''
+    def handle(self):
+        msg, fds, flags, addr = socket.recv_fds(self.request, 1, 3)
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            request = None
+        if len(fds) != 3 or not isinstance(request, dict) or request.get('prog') not in PROGRAMS:
+            self._respond({'error': 'bad request'})
+            return
+        if request.get('python') != sys.version:
+            self._respond({'error': f'daemon runs python {sys.version}'})
+            return
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, std in zip(fds, (0, 1, 2)):
+            os.dup2(fd, std)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.path[:] = request['path']
+
+        code = _run_program(request['prog'], request['argv'])
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self._respond({'exit': code})
+
+    def _respond(self, response):
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    '''
+    UNIX socket server, which keeps standard library provides, environment index and prefix tables warm
+    and serves py3req/py3prov requests. Each request is handled in forked process, so concurrent requests
+    share warm state of the server, but do not affect each other.
+
+    :param path: path to the socket
+    :type path: str or pathlib.Path
+    :param refresh: interval in seconds between checks, that warm state is up to date
+    :type refresh: float
+    :param stdlib_cache: path to the cache file for standard library provides (None means memory only)
+    :type stdlib_cache: str or pathlib.Path or None
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    '''
+    block_on_close = False
+
+    def __init__(self, path, refresh=60, stdlib_cache=None, verbose=False):
+        self.refresh = refresh
+        self.stdlib_cache = stdlib_cache
+        self.verbose = verbose
+        self._warmed = 0
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.is_socket():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                if sock.connect_ex(path.as_posix()) == 0:
+                    raise OSError(f'py3daemon: daemon is already running on {path}')
+            path.unlink()
+        # Socket is created accessible only by owner, so other users can not connect before it is restricted
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path.as_posix(), _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.warm()
+
+    def warm(self):
+        '''
+        Load standard library provides (frozen as requests use them), installed distributions
+        and prefix tables to memory (they are reloaded only if they are outdated)
+        '''
+        py3req = import_module(PROGRAMS['py3req'])
+        py3prov = import_module(PROGRAMS['py3prov'])
+        start = time.perf_counter()
+        py3req._get_std_provides(self.stdlib_cache, verbose=self.verbose)
+        py3prov.ProvidersIndex.from_env(paths=set([sysconfig.get_paths()['purelib'],
+                                                   sysconfig.get_paths()['platlib']]), verbose=self.verbose)
+        py3prov.compile_prefixes(sys.path)
+        self._warmed = time.monotonic()
+        if self.verbose:
+            print(f'py3daemon:INFO: State is warmed up in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+
+    def service_actions(self):
+        super().service_actions()
+        if time.monotonic() - self._warmed >= self.refresh:
+            self.warm()
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def request(prog, argv, path=None):
+    '''
+    Run program in daemon with stdin, stdout and stderr, working directory and environment of current process
+
+    :param prog: program name (py3req or py3prov)
+    :type prog: str
+    :param argv: command line arguments
+    :type argv: list[str]
+    :param path: path to the socket, by default is set to default_socket()
+    :type path: str or pathlib.Path or None
+    :return: exit code or None if daemon is not available (so nothing was run)
+    :rtype: int or None
+    '''
+    path = path or default_socket()
+    payload = json.dumps({'prog': prog, 'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ),
+                          'path': sys.path, 'python': sys.version}).encode() + b'\n'
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(os.fspath(path))
+            socket.send_fds(sock, [b'\0'], [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()])
+            sock.sendall(payload)
+        except (OSError, ValueError):
+            return None
+        try:
+            with sock.makefile('rb') as f:
+                response = json.loads(f.readline())
+        except (OSError, ValueError):
+            print(f'py3daemon:ERROR: No response from daemon on {path}', file=sys.stderr)
+            return 1
+    if 'error' in response:
+        return None
+    return response.get('exit', 1)
+
+
+def _client(prog, argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if os.getenv('PY3DEPHELL_NO_DAEMON') or (code := request(prog, argv)) is None:
+        return import_module(PROGRAMS[prog]).main(argv)
+    return code
+
+
+def py3req_client(argv=None):
+    '''
+    Drop-in replacement of py3req, which runs it in daemon (or locally, if daemon is not available)
+    '''
+    return _client('py3req', argv)
+
+
+def py3prov_client(argv=None):
+    '''
+    Drop-in replacement of py3prov, which runs it in daemon (or locally, if daemon is not available)
+    '''
+    return _client('py3prov', argv)
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Serve py3req and py3prov requests over UNIX socket '
+                                   'keeping standard library and environment provides warm')
+    args.add_argument('--socket', default=None,
+                      help=f'Path to the socket. By default set to {default_socket().as_posix()}')
+    args.add_argument('--refresh', type=float, default=60,
+                      help='Interval in seconds between checks, that warm state is up to date')
+    args.add_argument('--stdlib_cache', nargs='?', default=None, const=True,
+                      help='Also cache provides of standard library in the given file (by default they are kept only '
+                      'in memory). Without value set to the default cache of py3req')
+    args.add_argument('--verbose', action='store_true', help='Turn on verbose mode')
+    args = args.parse_args(argv)
+
+    if args.stdlib_cache is True:
+        args.stdlib_cache = import_module(PROGRAMS['py3req']).default_std_cache()
+
+    # Close server and remove socket on termination
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with Server(args.socket or default_socket(), refresh=args.refresh, stdlib_cache=args.stdlib_cache,
+                verbose=args.verbose) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#! /usr/bin/env python3
+
+import mmap
+import struct
+
+
+ELF_MAGIC = b'\x7fELF'
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+DT_NULL = 0
+DT_NEEDED = 1
+SHN_UNDEF = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STT_FUNC = 2
+
+# Formats of header, section header, dynamic entry and symbol for each ELF class
+_FORMATS = {ELFCLASS32: ('16sHHIIIIIHHHHHH', 'IIIIIIIIII', 'iI', 'IIIBBH'),
+            ELFCLASS64: ('16sHHIQQQIHHHHHH', 'IIQQQQIIQQ', 'qQ', 'IBBHQQ')}
+
+
+class ElfInfo:
+    '''
+    Information about ELF file, which is important for dependencies
+
+    :param elf_class: EI_CLASS of file (ELFCLASS32 or ELFCLASS64)
+    :type elf_class: int
+    :param needed: shared libraries from DT_NEEDED entries
+    :type needed: tuple[str]
+    :param pyinit: names of python modules, which init functions (PyInit_*) are exported by file
+    :type pyinit: tuple[str]
+    '''
+    __slots__ = ('elf_class', 'needed', 'pyinit')
+
+    def __init__(self, elf_class, needed=(), pyinit=()):
+        self.elf_class = elf_class
+        self.needed = tuple(needed)
+        self.pyinit = tuple(pyinit)
+
+    def __eq__(self, other):
+        return isinstance(other, ElfInfo) and ((self.elf_class, self.needed, self.pyinit)
+                                               == (other.elf_class, other.needed, other.pyinit))
+
+    def __repr__(self):
+        return f'ElfInfo(elf_class={self.elf_class}, needed={self.needed}, pyinit={self.pyinit})'
+
+    @property
+    def is_64bit(self):
+        return self.elf_class == ELFCLASS64
+
+
+def is_elf(path):
+    '''
+    Check ELF magic of the file
+
+    :param path: path to the file
+    :type path: str or pathlib.Path
+    :return: True if file starts with ELF magic
+    :rtype: Bool
+    '''
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(ELF_MAGIC)) == ELF_MAGIC
+    except OSError:
+        return False
+
+
+def _read_str(buf, start, end):
+    if (stop := buf.find(b'\0', start, end)) < 0:
+        stop = end
+    return buf[start:stop].decode(errors='surrogateescape')
+
+
+def _table(buf, section, entry):
+    offset, size = section[4], section[5]
+    if offset + size > len(buf):
+        raise ValueError('section is out of file')
+    # Entries are unpacked directly from mapped file without copying
+    return memoryview(buf)[offset:offset + size - size % entry.size]
+
+
+def _parse(buf):
+    if (elf_class := buf[4]) not in _FORMATS:
+        raise ValueError(f'unknown ELF class {elf_class}')
+    if buf[5] not in (1, 2):
+        raise ValueError(f'unknown ELF data encoding {buf[5]}')
+    order = '<' if buf[5] == 1 else '>'
+    ehdr, shdr, dyn, sym = (struct.Struct(order + fmt) for fmt in _FORMATS[elf_class])
+
+    header = ehdr.unpack_from(buf, 0)
+    shoff, shentsize, shnum = header[6], header[11], header[12]
+    if not shoff:
+        return ElfInfo(elf_class)
+    if shentsize < shdr.size:
+        raise ValueError(f'wrong size of section header {shentsize}')
+    if shnum == 0:
+        # Number of sections does not fit into header, it is stored in the first section
+        shnum = shdr.unpack_from(buf, shoff)[5]
+    sections = [shdr.unpack_from(buf, shoff + num * shentsize) for num in range(shnum)]
+
+    needed = []
+    pyinit = []
+    for section in sections:
+        if section[1] not in (SHT_DYNAMIC, SHT_DYNSYM) or section[6] >= shnum:
+            continue
+        strtab = sections[section[6]][4]
+        strtab_end = strtab + sections[section[6]][5]
+        if strtab_end > len(buf):
+            raise ValueError('section is out of file')
+
+        if section[1] == SHT_DYNAMIC:
+            with _table(buf, section, dyn) as table:
+                for tag, value in dyn.iter_unpack(table):
+                    if tag == DT_NULL:
+                        break
+                    if tag == DT_NEEDED:
+                        needed.append(_read_str(buf, strtab + value, strtab_end))
+        else:
+            name_idx, info_idx, shndx_idx = (0, 3, 5) if elf_class == ELFCLASS32 else (0, 1, 3)
+            with _table(buf, section, sym) as table:
+                for entry in sym.iter_unpack(table):
+                    info = entry[info_idx]
+                    if (entry[shndx_idx] == SHN_UNDEF or info & 0xf != STT_FUNC
+                            or info >> 4 not in (STB_GLOBAL, STB_WEAK)):
+                        continue
+                    name = strtab + entry[name_idx]
+                    if buf[name:name + 7] == b'PyInit_':
+                        pyinit.append(_read_str(buf, name + 7, strtab_end))
+    return ElfInfo(elf_class, needed, sorted(pyinit))
+
+
+def read_elf(path):
+    '''
+    Read EI_CLASS, DT_NEEDED entries and exported PyInit_* functions from ELF file in one pass.
+    File is mapped to memory, so only headers, dynamic section and dynamic symbols are actually read.
+
+    :param path: path to the file or file opened in binary mode (it is not reopened then)
+    :type path: str or pathlib.Path or io.BufferedReader
+    :return: information about ELF or None if file is not ELF
+    :rtype: ElfInfo or None
+    :raises ValueError: if ELF is broken
+    :raises OSError: if file can not be read
+    '''
+    if not hasattr(path, 'fileno'):
+        with open(path, 'rb') as f:
+            return read_elf(f)
+
+    path.seek(0)
+    if path.read(len(ELF_MAGIC)) != ELF_MAGIC:
+        return None
+    try:
+        with mmap.mmap(path.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _parse(buf)
+    except (struct.error, IndexError) as err:
+        raise ValueError(f'truncated ELF:{err}') from None
+
@@ -0,0 +1,411 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import argparse
+from array import array
+from bisect import bisect_left
+from collections import deque
+from .py3prov import generate_provides, write_ndjson
+from .py3req import expand_input, _extract_imports, _jobs
+
+
+class ModuleGraph:
+    '''
+    Import graph of modules with integer node ids. Edges are kept in compressed sparse rows:
+    successors of node are targets[offsets[node]:offsets[node + 1]], so memory is linear in the number of edges
+    and all algorithms are iterative, so they do not depend on recursion limit.
+
+    :param names: names of modules, node id is index in this list
+    :type names: list[str]
+    :param edges: pairs of node ids (importing module, imported module), duplicates and loops are dropped
+    :type edges: iterable[tuple[int, int]]
+    :param files: files of modules (in the same order as names)
+    :type files: list[str] or None
+    '''
+    __slots__ = ('names', 'files', '_ids', '_offsets', '_targets')
+
+    def __init__(self, names, edges=(), files=None):
+        self.names = list(names)
+        self.files = list(files) if files is not None else [None] * len(self.names)
+        self._ids = None
+        size = len(self.names)
+        # Edge (src, dst) is encoded as single int, so sorting groups edges by source
+        keys = sorted({src * size + dst for src, dst in edges if src != dst})
+        self._offsets = array('L', (bisect_left(keys, node * size) for node in range(size + 1)))
+        self._targets = array('L', [key % size for key in keys])
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def edge_count(self):
+        return len(self._targets)
+
+    def node(self, name):
+        '''
+        Get id of module
+
+        :param name: name of module
+        :type name: str
+        :return: node id or None if module is not in graph
+        :rtype: int or None
+        '''
+        if self._ids is None:
+            self._ids = {}
+            for node, module in enumerate(self.names):
+                self._ids.setdefault(module, node)
+        return self._ids.get(name)
+
+    def successors(self, node):
+        '''
+        Get modules imported by module
+
+        :param node: node id
+        :type node: int
+        :return: node ids of imported modules
+        :rtype: memoryview
+        '''
+        return memoryview(self._targets)[self._offsets[node]:self._offsets[node + 1]]
+
+    def edges(self):
+        '''
+        Iterate over edges sorted by source
+
+        :return: pairs of node ids
+        :rtype: Iterator[tuple[int, int]]
+        '''
+        offsets, targets = self._offsets, self._targets
+        for src in range(len(self)):
+            for dst in targets[offsets[src]:offsets[src + 1]]:
+                yield src, dst
+
+    def transpose(self):
+        '''
+        Build graph with reversed edges (module -> modules, which import it)
+
+        :rtype: ModuleGraph
+        '''
+        return ModuleGraph(self.names, ((dst, src) for src, dst in self.edges()), self.files)
+
+    def reachable(self, sources, reverse=False):
+        '''
+        Find modules reachable from sources by breadth-first search (sources are included)
+
+        :param sources: node ids
+        :type sources: iterable[int]
+        :param reverse: follow edges backwards, so modules which (transitively) import sources are found
+        :type reverse: Bool
+        :return: sorted node ids
+        :rtype: list[int]
+        '''
+        graph = self.transpose() if reverse else self
+        offsets, targets = graph._offsets, graph._targets
+        visited = bytearray(len(self))
+        queue = deque()
+        for node in sources:
+            if not visited[node]:
+                visited[node] = 1
+                queue.append(node)
+        while queue:
+            node = queue.popleft()
+            for succ in targets[offsets[node]:offsets[node + 1]]:
+                if not visited[succ]:
+                    visited[succ] = 1
+                    queue.append(succ)
+        return [node for node in range(len(self)) if visited[node]]
+
+    def strongly_connected_components(self):
+        '''
+        Find strongly connected components (import cycles) by iterative Tarjan's algorithm
+
+        :return: components in reverse topological order: component is listed after all components,
+        which it imports
+        :rtype: list[list[int]]
+        '''
+        offsets, targets = self._offsets, self._targets
+        index = array('l', [-1]) * len(self)
+        low = array('l', [0]) * len(self)
+        # Position of the next successor to visit for each node on the work stack
+        position = array('L', offsets[:-1]) if len(self) else array('L')
+        on_stack = bytearray(len(self))
+        stack = []
+        components = []
+        counter = 0
+        for root in range(len(self)):
+            if index[root] >= 0:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [root]
+            while work:
+                node = work[-1]
+                pos, end = position[node], offsets[node + 1]
+                while pos < end:
+                    succ = targets[pos]
+                    pos += 1
+                    if index[succ] < 0:
+                        break
+                    if on_stack[succ] and index[succ] < low[node]:
+                        low[node] = index[succ]
+                else:
+                    succ = None
+                position[node] = pos
+                if succ is not None:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack[succ] = 1
+                    work.append(succ)
+                    continue
+
+                work.pop()
+                if work and low[node] < low[work[-1]]:
+                    low[work[-1]] = low[node]
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+        return components
+
+    def condensation(self):
+        '''
+        Build acyclic graph of strongly connected components
+
+        :return: components in topological order (importing component goes first),
+        component id of each node and graph of components named by their first module
+        :rtype: tuple[list[list[int]], array, ModuleGraph]
+        '''
+        components = self.strongly_connected_components()[::-1]
+        component_of = array('L', bytes(array('L').itemsize * len(self)))
+        for num, component in enumerate(components):
+            for node in component:
+                component_of[node] = num
+        dag = ModuleGraph([self.names[component[0]] for component in components],
+                          ((component_of[src], component_of[dst]) for src, dst in self.edges()))
+        return components, component_of, dag
+
+    def weakly_connected_components(self):
+        '''
+        Find groups of modules, which are not connected by imports in any direction
+
+        :return: components ordered by their first node
+        :rtype: list[list[int]]
+        '''
+        parent = array('L', range(len(self)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        offsets, targets = self._offsets, self._targets
+        for src in range(len(self)):
+            for dst in targets[offsets[src]:offsets[src + 1]]:
+                if (root := find(src)) != (dst := find(dst)):
+                    parent[max(root, dst)] = min(root, dst)
+        components = {}
+        for node in range(len(self)):
+            components.setdefault(find(node), []).append(node)
+        return list(components.values())
+
+    def propose_splits(self):
+        '''
+        Propose subpackages: modules are split so, that no module of subpackage is imported from outside of it.
+        First modules are grouped by weakly connected components, then inside each of them by entry points
+        (components of condensation, which are not imported by others): modules reachable only from entry points
+        of one parent package (e.g. all tests in pkg.tests) form subpackage, modules shared by entry points
+        of different parent packages stay in the core subpackage.
+
+        :return: subpackages with name (common prefix of modules), modules, files, names of required
+        subpackages and flag, whether it is shared core
+        :rtype: list[dict]
+        '''
+        # Everything is computed on condensation, which is usually much smaller than graph
+        components, component_of, dag = self.condensation()
+        weak_of = array('L', bytes(array('L').itemsize * len(components)))
+        for num, weak in enumerate(dag.weakly_connected_components()):
+            for component in weak:
+                weak_of[component] = num
+
+        # Label of component is parent package of entry points, which reach it, or None if they are different.
+        # Components are processed in topological order, so all importers are labeled before component
+        shared = object()
+        labels = [None] * len(components)
+        for num, component in enumerate(components):
+            if labels[num] is None:
+                labels[num] = min(self.names[node] for node in component).rpartition('.')[0]
+            for succ in dag.successors(num):
+                if labels[succ] is None:
+                    labels[succ] = labels[num]
+                elif labels[succ] != labels[num]:
+                    labels[succ] = shared
+
+        groups = {}
+        for num, component in enumerate(components):
+            key = (weak_of[num], None if labels[num] is shared else labels[num])
+            groups.setdefault(key, []).append(num)
+        group_of = array('L', bytes(array('L').itemsize * len(components)))
+        for num, group in enumerate(groups.values()):
+            for component in group:
+                group_of[component] = num
+        groups = {key: [node for component in group for node in components[component]]
+                  for key, group in groups.items()}
+
+        names = [_common_name([self.names[node] for node in nodes]) for nodes in groups.values()]
+        requires = [set() for _ in groups]
+        for src, dst in dag.edges():
+            if group_of[src] != group_of[dst]:
+                requires[group_of[src]].add(names[group_of[dst]])
+
+        return [{'name': names[num], 'modules': sorted(self.names[node] for node in nodes),
+                 'files': sorted(self.files[node] for node in nodes if self.files[node] is not None),
+                 'requires': sorted(requires[num]), 'shared': key[1] is None}
+                for num, (key, nodes) in enumerate(groups.items())]
+
+
+def _common_name(modules):
+    parts = os.path.commonprefix([module.split('.') for module in modules])
+    return '.'.join(parts) if parts else min(modules)
+
+
+def _resolve_module(name, ids):
+    # Import of name requires the longest provided module from its prefixes (from A import B gives A.B)
+    while name:
+        if (node := ids.get(name)) is not None:
+            return node
+        name = name.rpartition('.')[0]
+    return None
+
+
+def build_graph(files, prefixes=sys.path, only_external_deps=False, engine='ast', jobs=1, read_ahead=16,
+                read_ahead_memory=64 << 20, stderr=sys.stderr, verbose=False):
+    '''
+    Build import graph of modules from given files: nodes are modules provided by files
+    (see py3dephell.py3prov.generate_provides), edges are imports between them
+    (see py3dephell.py3req.process_file). Imports of other modules are skipped.
+    Each module also imports its parent package, since it is executed on import.
+    Module of file is the first of its absolute provides (package for __init__ file).
+
+    :param files: list of files
+    :type files: list[str]
+    :param prefixes: list of prefixes by which the path will be trimmed
+    :type prefixes: list[str]
+    :param only_external_deps: skip capsulated import statements
+    :type only_external_deps: Bool
+    :param engine: "ast" or "tokenize" (see py3dephell.py3req.process_file)
+    :type engine: str
+    :param jobs: number of processes used to parse files (0 means number of CPUs)
+    :type jobs: int
+    :param read_ahead: number of files read in background threads ahead of parser (0 turns it off)
+    :type read_ahead: int
+    :param read_ahead_memory: maximum size in bytes of files read ahead
+    :type read_ahead_memory: int
+    :param stderr: error stream
+    :type stderr: io
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: import graph
+    :rtype: ModuleGraph
+    '''
+    files = [file for file in files if os.path.isfile(file)]
+    provides = generate_provides(files, prefixes=prefixes, skip_pth=True, abs_mode=True, verbose=verbose)
+    names = []
+    node_files = []
+    ids = {}
+    for file in files:
+        # The first absolute provide is module of file itself, the others are its packages
+        if (module := next(iter(provides.get(file, {}).get('provides', [])), None)) is None:
+            continue
+        module = module.removesuffix('.__init__')
+        ids.setdefault(module, len(names))
+        names.append(module)
+        node_files.append(file)
+
+    nodes = {file: node for node, file in enumerate(node_files)}
+    edges = []
+    for node, module in enumerate(names):
+        if (parent := _resolve_module(module.rpartition('.')[0], ids)) is not None:
+            edges.append((node, parent))
+    extracted = _extract_imports(node_files, jobs or os.cpu_count(), prefixes=prefixes,
+                                 only_external_deps=only_external_deps, skip_subs=False, engine=engine,
+                                 read_ahead_options=(read_ahead, read_ahead_memory), stderr=stderr, verbose=verbose,
+                                 skip_lines=True)
+    for file, elf_deps, deps in extracted:
+        targets = {node for dep_type in deps[:3] for dep in dep_type
+                   if (node := _resolve_module(dep, ids)) is not None}
+        edges += ((nodes[file], target) for target in targets)
+
+    if verbose:
+        print(f'py3graph:INFO: Graph has {len(names)} modules and {len(edges)} imports', file=stderr)
+    return ModuleGraph(names, edges, node_files)
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Build import graph of package modules and propose '
+                                   'subpackages according to their dependencies')
+    args.add_argument('--prefixes', help='List of prefixes separated by ":"')
+    args.add_argument('--exclude_hidden_deps', action='store_true',
+                      help='Exclude dependencies, that are hidden in functions, classes or conditions')
+    args.add_argument('--cycles', action='store_true',
+                      help='List import cycles (strongly connected components) instead of subpackages')
+    args.add_argument('--reachable', action='append', default=[],
+                      help='List modules imported (transitively) by module instead of subpackages '
+                      '(can be repeated)')
+    args.add_argument('--reverse', action='store_true',
+                      help='With --reachable list modules, which import (transitively) module')
+    args.add_argument('--jobs', type=_jobs, default=1,
+                      help='Number of processes used to parse files ("auto" or 0 means number of CPUs)')
+    args.add_argument('--format', choices=['text', 'ndjson'], default='text', help='Output format')
+    args.add_argument('--verbose', action='store_true', help='Turn on verbose mode')
+    args.add_argument('input', nargs='*', default=[], help='List of files and directories of package')
+    args = args.parse_args(argv)
+
+    if not args.input:
+        args.input = sys.stdin.read().split()
+    prefixes = args.prefixes.split(':') if args.prefixes else sys.path
+
+    graph = build_graph(expand_input(args.input, verbose=args.verbose), prefixes=prefixes,
+                        only_external_deps=args.exclude_hidden_deps, jobs=args.jobs, verbose=args.verbose)
+
+    if args.reachable:
+        sources = []
+        for module in args.reachable:
+            if (node := graph.node(module)) is None:
+                print(f'py3graph:WARNING: Module {module} is not in graph', file=sys.stderr)
+            else:
+                sources.append(node)
+        records = [{'module': graph.names[node], 'file': graph.files[node]}
+                   for node in graph.reachable(sources, reverse=args.reverse)]
+    elif args.cycles:
+        records = [{'modules': [graph.names[node] for node in component]}
+                   for component in graph.strongly_connected_components() if len(component) > 1]
+    else:
+        records = graph.propose_splits()
+
+    if args.format == 'ndjson':
+        write_ndjson(records)
+        return 0
+
+    for record in records:
+        if 'module' in record:
+            print(f'{record["module"]}:{record["file"]}' if args.verbose else record['module'])
+        elif 'name' not in record:
+            print(' '.join(record['modules']))
+        elif args.verbose:
+            print(f'{record["name"]}:{" ".join(record["modules"])} (requires:{" ".join(record["requires"])})')
+        else:
+            print(f'{record["name"]}:{" ".join(record["modules"])}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#! /usr/bin/env python3
+
+import sys
+import json
+import sqlite3
+import argparse
+from pathlib import Path
+from .py3cache import cache_dir
+from .py3prov import write_ndjson
+
+
+INDEX_VERSION = 1
+KINDS = ('provides', 'requires')
+
+
+def default_index():
+    '''
+    Returns path to the default reverse index: <cache directory>/index.sqlite
+
+    :return: path to the index
+    :rtype: pathlib.Path
+    '''
+    return cache_dir().joinpath('index.sqlite')
+
+
+def _prefix_range(module):
+    # Submodules of "foo.bar" are exactly names in ("foo.bar.", "foo.bar/"), since "/" follows "." in ASCII
+    return module + '.', module + '/'
+
+
+class ReverseIndex:
+    '''
+    Persistent reverse index of provides and requirements of many packages, stored in sqlite3 database.
+    Names of packages, files and modules are stored once and referenced by integer ids, so index stays
+    compact for whole repository. Module names are indexed, so all modules under dotted prefix
+    are found by one range query.
+
+    :param path: path to the database
+    :type path: str or pathlib.Path
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    '''
+    def __init__(self, path, verbose=False):
+        self.path = Path(path)
+        self.verbose = verbose
+        self._modules = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] not in (0, INDEX_VERSION):
+            raise ValueError(f'py3index: index {self.path} has unsupported version')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS packages (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY,'
+                             ' package INTEGER NOT NULL REFERENCES packages (id) ON DELETE CASCADE,'
+                             ' path TEXT NOT NULL, UNIQUE (package, path))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS modules (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
+            for kind in KINDS:
+                self._db.execute(f'CREATE TABLE IF NOT EXISTS {kind} ('
+                                 'module INTEGER NOT NULL REFERENCES modules (id),'
+                                 ' file INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,'
+                                 ' PRIMARY KEY (module, file)) WITHOUT ROWID')
+                self._db.execute(f'CREATE INDEX IF NOT EXISTS {kind}_file ON {kind} (file)')
+            self._db.execute(f'PRAGMA user_version={INDEX_VERSION}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _module_id(self, name):
+        if (module_id := self._modules.get(name)) is None:
+            row = self._db.execute('SELECT id FROM modules WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                module_id = self._db.execute('INSERT INTO modules (name) VALUES (?)', (name,)).lastrowid
+            else:
+                module_id = row[0]
+            self._modules[name] = module_id
+        return module_id
+
+    def _package_id(self, name):
+        self._db.execute('INSERT OR IGNORE INTO packages (name) VALUES (?)', (name,))
+        return self._db.execute('SELECT id FROM packages WHERE name = ?', (name,)).fetchone()[0]
+
+    def add(self, package, kind, records):
+        '''
+        Replace provides or requirements of package in the index
+
+        :param package: name of package
+        :type package: str
+        :param kind: "provides" or "requires"
+        :type kind: str
+        :param records: pairs of file and its provides or requirements
+        :type records: Iterable[tuple[str, Iterable[str]]]
+        :return: number of indexed files
+        :rtype: int
+        '''
+        if kind not in KINDS:
+            raise ValueError(f'py3index: unknown kind of records:{kind}')
+        with self._db:
+            package_id = self._package_id(package)
+            self._db.execute(f'DELETE FROM {kind} WHERE file IN (SELECT id FROM files WHERE package = ?)',
+                             (package_id,))
+            count = 0
+            for file, modules in records:
+                self._db.execute('INSERT OR IGNORE INTO files (package, path) VALUES (?, ?)', (package_id, file))
+                file_id = self._db.execute('SELECT id FROM files WHERE package = ? AND path = ?',
+                                           (package_id, file)).fetchone()[0]
+                self._db.executemany(f'INSERT OR IGNORE INTO {kind} VALUES (?, ?)',
+                                     ((self._module_id(module), file_id) for module in modules
+                                      if isinstance(module, str)))
+                count += 1
+            self._cleanup(package_id)
+        return count
+
+    def add_ndjson(self, path, package=None):
+        '''
+        Add ndjson output of py3prov, py3req or py3batch to the index.
+        Kind of records is detected by their fields, all previous records of this kind for package are replaced.
+
+        :param path: path to the ndjson file
+        :type path: str or pathlib.Path
+        :param package: name of package, by default it is taken from file name (as py3batch names results)
+        :type package: str or None
+        :return: kind of records and number of indexed files
+        :rtype: tuple[str, int]
+        '''
+        path = Path(path)
+        package = package or path.name.removesuffix('.ndjson')
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+
+        if any('provides' in record for record in records):
+            kind = 'provides'
+            pairs = ((record['file'], record['provides']) for record in records)
+        else:
+            kind = 'requires'
+            pairs = ((record.get('file', ''), record['requires'] if 'requires' in record else [record['requirement']])
+                     for record in records)
+        return kind, self.add(package, kind, pairs)
+
+    def remove(self, package):
+        '''
+        Remove package with all its provides and requirements from the index
+
+        :param package: name of package
+        :type package: str
+        :return: True if package was in the index
+        :rtype: Bool
+        '''
+        with self._db:
+            removed = self._db.execute('DELETE FROM packages WHERE name = ?', (package,)).rowcount
+            self._db.execute('DELETE FROM modules WHERE id NOT IN (SELECT module FROM provides)'
+                             ' AND id NOT IN (SELECT module FROM requires)')
+        self._modules.clear()
+        return bool(removed)
+
+    def _cleanup(self, package_id):
+        self._db.execute('DELETE FROM files WHERE package = ? AND id NOT IN (SELECT file FROM provides)'
+                         ' AND id NOT IN (SELECT file FROM requires)', (package_id,))
+
+    def _query(self, kind, module, prefix):
+        if kind not in KINDS:
+            raise ValueError(f'py3index: unknown kind of records:{kind}')
+        condition = 'm.name = ?'
+        params = [module]
+        if prefix:
+            condition += ' OR (m.name > ? AND m.name < ?)'
+            params += _prefix_range(module)
+        return self._db.execute('SELECT m.name, p.name, f.path FROM modules m'
+                                f' JOIN {kind} k ON k.module = m.id JOIN files f ON f.id = k.file'
+                                f' JOIN packages p ON p.id = f.package WHERE {condition}'
+                                ' ORDER BY m.name, p.name, f.path', params).fetchall()
+
+    def what_provides(self, module, prefix=False):
+        '''
+        Find files, which provide module
+
+        :param module: name of module
+        :type module: str
+        :param prefix: find also files, which provide submodules of module
+        :type prefix: Bool
+        :return: sorted triples of provided module, package and file
+        :rtype: list[tuple[str, str, str]]
+        '''
+        return self._query('provides', module, prefix)
+
+    def what_depends(self, module, prefix=False):
+        '''
+        Find files, which require module
+
+        :param module: name of module
+        :type module: str
+        :param prefix: find also files, which require submodules of module
+        :type prefix: Bool
+        :return: sorted triples of required module, package and file
+        :rtype: list[tuple[str, str, str]]
+        '''
+        return self._query('requires', module, prefix)
+
+    def packages(self):
+        '''
+        List packages in the index
+
+        :return: sorted names of packages
+        :rtype: list[str]
+        '''
+        return [row[0] for row in self._db.execute('SELECT name FROM packages ORDER BY name')]
+
+    def close(self):
+        '''
+        Close database
+        '''
+        self._db.close()
+
+
+def _expand_ndjson(inputs):
+    for path in map(Path, inputs):
+        if path.is_dir():
+            yield from sorted(path.glob('*.ndjson'))
+        else:
+            yield path
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description='Build persistent reverse index of provides and requirements '
+                                   'of many packages and query it')
+    args.add_argument('--index', default=None,
+                      help=f'Path to the index. By default set to {default_index().as_posix()}')
+    args.add_argument('--package', default=None,
+                      help='Name of package for input files. By default taken from file name '
+                      '(<name>.ndjson as py3batch writes)')
+    args.add_argument('--remove', action='append', default=[],
+                      help='Remove package from the index (can be repeated)')
+    args.add_argument('--whatprovides', action='append', default=[],
+                      help='List packages and files which provide module. Example: --whatprovides foo')
+    args.add_argument('--whatdepends', action='append', default=[],
+                      help='List packages and files which require module. Example: --whatdepends foo')
+    args.add_argument('--prefix', action='store_true',
+                      help='Queries match also submodules: foo matches foo, foo.bar, foo.bar.baz')
+    args.add_argument('--format', choices=['text', 'ndjson'], default='text',
+                      help='Output format of queries')
+    args.add_argument('--verbose', action='store_true', help='Turn on verbose mode')
+    args.add_argument('input', nargs='*', default=[],
+                      help='ndjson outputs of py3prov, py3req or py3batch (files or directories) to add to the index')
+    args = args.parse_args(argv)
+
+    try:
+        index = ReverseIndex(args.index or default_index(), verbose=args.verbose)
+    except (OSError, ValueError, sqlite3.Error) as err:
+        print(f'py3index:ERROR: Failed to open index:{err}', file=sys.stderr)
+        return 1
+
+    with index:
+        for package in args.remove:
+            if not index.remove(package) and args.verbose:
+                print(f'py3index:WARNING: Package {package} is not in the index', file=sys.stderr)
+
+        for path in _expand_ndjson(args.input):
+            try:
+                kind, count = index.add_ndjson(path, package=args.package)
+            except (OSError, ValueError, KeyError, TypeError) as err:
+                print(f'py3index:ERROR: Failed to add {path}:{err}', file=sys.stderr)
+                return 1
+            if args.verbose:
+                print(f'py3index:INFO: Indexed {kind} of {count} files from {path}', file=sys.stderr)
+
+        results = [('provides', row) for module in args.whatprovides
+                   for row in index.what_provides(module, args.prefix)]
+        results += [('requires', row) for module in args.whatdepends
+                    for row in index.what_depends(module, args.prefix)]
+        if args.format == 'ndjson':
+            write_ndjson({kind: module, 'package': package, 'file': file} for kind, (module, package, file) in results)
+        else:
+            for kind, (module, package, file) in results:
+                print(f'{package}:{file}:{module}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,10 +4,16 @@ import os
 import re
 import sys
 import csv
+import fnmatch
+import json
+import sqlite3
+import time
 import argparse
 import sysconfig
 from pathlib import Path
-from functools import reduce
+from bisect import bisect_left
+from functools import reduce, lru_cache
+from .py3cache import EnvIndex
 
 
 so_suffix = sysconfig.get_config_var('EXT_SUFFIX')
@@ -15,6 +21,147 @@ shlib_suffix = sysconfig.get_config_var('SHLIB_SUFFIX')
 soabi = f'.{sysconfig.get_config_var("SOABI")}{shlib_suffix}'
 soabi3 = f'.{sysconfig.get_config_var("SOABI3")}{shlib_suffix}'
 abi3 = f'.abi3{shlib_suffix}'
+module_suffixes = (so_suffix, shlib_suffix, soabi, soabi3, '.py', abi3)
+# Directories, which are skipped by walk by default
+default_exclude = ('__pycache__', '.git', '.hg', '.svn')
+
+
+class PrefixTable:
+    '''
+    Compiled list of prefixes and module suffixes. Prefixes are stored in a trie of path components,
+    so each path is matched against all prefixes by one lookup of the longest prefix.
+
+    :param prefixes: list of prefixes by which the path will be trimmed
+    :type prefixes: list[str]
+    :param suffixes: list of suffixes for modules (.py, extension modules suffixes)
+    :type suffixes: list[str]
+    '''
+    __slots__ = ('prefixes', 'suffixes', '_root')
+
+    def __init__(self, prefixes, suffixes=module_suffixes):
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(sorted(set(suffixes), key=lambda p: len(p), reverse=True))
+        self._root = {}
+        for pref in self.prefixes:
+            if isinstance(pref, Path):
+                pref = pref.as_posix()
+            if not pref or (pref := os.path.normpath(pref)) in ('.', '/'):
+                continue
+            node = self._root
+            for part in Path(pref).parts:
+                node = node.setdefault(part, {})
+            node[None] = pref
+
+    def match(self, parts):
+        '''
+        Search for the longest prefix, which is a parent of the path
+
+        :param parts: parts of the path (as in pathlib.Path.parts)
+        :type parts: tuple[str]
+        :return: pair of prefix and number of its parts
+        :rtype: (str, int) or (None, 0)
+        '''
+        node = self._root
+        pref, length = None, 0
+        for num, part in enumerate(parts[:-1], start=1):
+            if (node := node.get(part)) is None:
+                break
+            if None in node:
+                pref, length = node[None], num
+        return pref, length
+
+    def trim(self, path):
+        '''
+        Trim path by prefixes
+
+        :param path: path to trim
+        :type path: str or pathlib.Path
+        :return: trimmed path
+        :rtype: pathlib.Path
+        '''
+        path = Path(path)
+        while (length := self.match(path.parts)[1]):
+            path = Path(*path.parts[length:])
+        return path
+
+    def detect_module(self, path):
+        '''
+        Detect top module according to prefixes
+
+        :param path: path to the potentional module
+        :type path: str or pathlib.Path
+        :return: pair of detected prefix and top module
+        :rtype: (str, str) or (None, None)
+        '''
+        parts = Path(path).parts
+        pref, length = self.match(parts)
+        if pref is None:
+            return None, None
+        return pref, parts[length]
+
+    def strip_suffix(self, name):
+        '''
+        Remove module suffix from the name of file
+
+        :param name: name of file
+        :type name: str
+        :return: name without suffix and flag, which is set if name had suffix of module
+        :rtype: (str, Bool)
+        '''
+        for suffix in self.suffixes:
+            if name.endswith(suffix):
+                return name.replace(suffix, '', 1), True
+        return name, False
+
+    def resolve(self, path):
+        '''
+        Map path to prefix, top module and parts of module name
+
+        :param path: path to the module
+        :type path: str or pathlib.Path
+        :return: detected prefix (or None), top module (or None) and parts of name (without module suffix)
+        :rtype: (str, str, tuple[str])
+        '''
+        pref, module = self.detect_module(path)
+        trash, *parts = self.trim(path).parts
+        if trash != '/':
+            parts.insert(0, trash)
+        if parts:
+            parts[-1] = self.strip_suffix(parts[-1])[0]
+        return pref, module, tuple(parts)
+
+    def resolve_all(self, paths):
+        '''
+        Map each path from given list to prefix, top module and parts of module name
+
+        :param paths: list of paths
+        :type paths: list[str] or list[pathlib.Path]
+        :return: generator of (path, (prefix, top module, parts))
+        :rtype: generator
+        '''
+        for path in paths:
+            yield path, self.resolve(path)
+
+
+@lru_cache(maxsize=64)
+def _compile_prefixes(prefixes, suffixes):
+    return PrefixTable(prefixes, suffixes)
+
+
+def compile_prefixes(prefixes, suffixes=module_suffixes):
+    '''
+    Returns PrefixTable for given prefixes, tables are cached, so it's cheap to call it for each file
+
+    :param prefixes: list of prefixes (or already compiled PrefixTable)
+    :type prefixes: list[str] or PrefixTable
+    :param suffixes: list of suffixes for modules
+    :type suffixes: list[str]
+    :return: compiled prefixes
+    :rtype: PrefixTable
+    '''
+    if isinstance(prefixes, PrefixTable):
+        return prefixes
+    return _compile_prefixes(tuple(p.as_posix() if isinstance(p, Path) else p for p in prefixes), tuple(suffixes))
 
 
 def processing_pth(path):
@@ -43,6 +190,20 @@ def processing_pth(path):
         return []
 
 
+def _processing_pth_cached(path, _cache={}):
+    # Content of .pth file is reused while its mtime is not changed
+    try:
+        st = os.stat(path)
+    except OSError:
+        return processing_pth(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    if key not in _cache:
+        if len(_cache) >= 1024:
+            _cache.clear()
+        _cache[key] = processing_pth(path)
+    return list(_cache[key])
+
+
 def create_provides_from_path(path, prefixes=sys.path, abs_mode=False,
                               pkg_mode=False, skip_wrong_names=True, skip_namespace_pkgs=True, verbose=False,
                               _bad_provides=set()):
@@ -52,7 +213,7 @@ def create_provides_from_path(path, prefixes=sys.path, abs_mode=False,
     :param path: path from which provides will be created
     :type path: str or pathlib.Path
     :param prefixes: list of prefixes by which the path will be trimmed
-    :type prefixes: list[str]
+    :type prefixes: list[str] or PrefixTable
     :param abs_mode: create provide only for absolute import (['A.B'] instead of ['B', 'A.B'])
     :type abs_mode: Bool
     :param pkg_mode: create provide even for directory
@@ -66,7 +227,12 @@ def create_provides_from_path(path, prefixes=sys.path, abs_mode=False,
     :return: list of provides created from given path
     :rtype: list[str]
     '''
+    abs_provides, full_provides = _create_provides_pair(path, prefixes, pkg_mode, skip_wrong_names,
+                                                        skip_namespace_pkgs, verbose, _bad_provides)
+    return abs_provides if abs_mode else full_provides
+
 
+def _create_provides_pair(path, prefixes, pkg_mode, skip_wrong_names, skip_namespace_pkgs, verbose, _bad_provides):
     if isinstance(path, str):
         path = Path(path)
     elif isinstance(path, Path):
@@ -74,11 +240,10 @@ def create_provides_from_path(path, prefixes=sys.path, abs_mode=False,
     else:
         raise TypeError(f'Wrong type:{type(path)} of variable <<path>>, use str or pathlib.Path instead')
 
-    provides = []
-    for pref in sorted(prefixes, key=lambda p: (len(p.split('/')), p), reverse=True):
-        if pref and (pref := os.path.normpath(pref)) and path.as_posix() != pref\
-           and pref in map(lambda x: x.as_posix(), path.parents):
-            path = Path(path.as_posix().replace(pref + '/', ''))
+    abs_provides = []
+    full_provides = []
+    table = compile_prefixes(prefixes)
+    path = table.trim(path)
 
     if not path:
         raise ValueError('py3prov.create_provides_from_path: path cannot be empty (possibly it was cut by prefix)')
@@ -89,13 +254,7 @@ def create_provides_from_path(path, prefixes=sys.path, abs_mode=False,
     if trash != '/':
         parts.insert(0, trash)
 
-    for suffix in sorted([so_suffix, shlib_suffix, soabi, soabi3, '.py', abi3], key=lambda p: len(p), reverse=True):
-        if parts[-1].endswith(suffix):
-            parts[-1] = parts[-1].replace(suffix, '', 1)
-            module = True
-            break
-    else:
-        module = False
+    parts[-1], module = table.strip_suffix(parts[-1])
 
     if module or pkg_mode:
         if parts[-1] == '__init__':
@@ -106,25 +265,98 @@ def create_provides_from_path(path, prefixes=sys.path, abs_mode=False,
                 print(f'py3prov:INFO: bad name for provides from path:{path}', file=sys.stderr)
                 _bad_provides.add(parts[-1])
 
-        if abs_mode and (all([part.isidentifier() for part in parts]) or not skip_wrong_names):
-            provides.append('.'.join(parts))
-        elif not abs_mode:
-            while parts:
-                if not parts[-1].isidentifier() and skip_wrong_names:
-                    break
-                if len(provides) > 0:
-                    provides.append(f'{parts.pop()}.{provides[-1]}')
-                else:
-                    provides.append(parts.pop())
+        if all([part.isidentifier() for part in parts]) or not skip_wrong_names:
+            abs_provides.append('.'.join(parts))
+
+        while parts:
+            if not parts[-1].isidentifier() and skip_wrong_names:
+                break
+            if len(full_provides) > 0:
+                full_provides.append(f'{parts.pop()}.{full_provides[-1]}')
+            else:
+                full_provides.append(parts.pop())
 
     parent = path.parent
 
     if (top_package_flag or not skip_namespace_pkgs) and parent.as_posix() != '.':
-        provides += create_provides_from_path(parent, prefixes,
-                                              pkg_mode=True, abs_mode=abs_mode, skip_wrong_names=skip_wrong_names,
-                                              verbose=verbose, _bad_provides=_bad_provides)
+        parent_abs, parent_full = _create_provides_pair(parent, table, True, skip_wrong_names, True,
+                                                        verbose, _bad_provides)
+        abs_provides += parent_abs
+        full_provides += parent_full
+
+    return abs_provides, full_provides
+
+
+@lru_cache(maxsize=64)
+def _compile_globs(patterns):
+    return re.compile('|'.join(map(fnmatch.translate, patterns))).match if patterns else None
+
+
+def walk(path, include=(), exclude=default_exclude, follow_symlinks=False, verbose=False):
+    '''
+    Iteratively walk through directory tree with os.scandir. Entries of directory are yielded before entries
+    of its subdirectories (like pathlib.Path.rglob("*") does). Globs are matched against name of entry
+    and its path relative to the given one, excluded directories are pruned with their whole subtree.
+
+    :param path: path to the directory
+    :type path: str or pathlib.Path
+    :param include: globs of files to yield (all files if empty), directories are not filtered by them
+    :type include: iterable[str]
+    :param exclude: globs of files and directories to skip
+    :type exclude: iterable[str]
+    :param follow_symlinks: walk into symlinks to directories (each directory is visited once, so loops are cut)
+    :type follow_symlinks: Bool
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: generator of entries (files, directories and symlinks)
+    :rtype: generator[os.DirEntry]
+    '''
+    included = _compile_globs(tuple(include))
+    excluded = _compile_globs(tuple(exclude))
+    visited = set()
+    if follow_symlinks:
+        try:
+            st = os.stat(path)
+            visited.add((st.st_dev, st.st_ino))
+        except OSError:
+            pass
+
+    stack = [(os.fspath(path), '')]
+    while stack:
+        dirpath, relpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError as err:
+            if verbose:
+                print(f'py3prov:WARNING: Failed to list {dirpath} due to {err}', file=sys.stderr)
+            continue
 
-    return provides
+        subdirs = []
+        for entry in entries:
+            entry_relpath = relpath + entry.name
+            if excluded and (excluded(entry.name) or excluded(entry_relpath)):
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if follow_symlinks and entry.is_symlink():
+                    st = entry.stat()
+                    if (st.st_dev, st.st_ino) in visited:
+                        if verbose:
+                            print(f'py3prov:WARNING: Directory {entry.path} is already visited, skip it',
+                                  file=sys.stderr)
+                        continue
+                    visited.add((st.st_dev, st.st_ino))
+                elif follow_symlinks:
+                    visited.add((entry.stat().st_dev, entry.inode()))
+                subdirs.append((entry.path, entry_relpath + '/'))
+            elif included and not (included(entry.name) or included(entry_relpath)):
+                continue
+            yield entry
+        stack.extend(reversed(subdirs))
 
 
 def search_for_provides(path, prefixes=sys.path, abs_mode=False,
@@ -148,18 +380,28 @@ def search_for_provides(path, prefixes=sys.path, abs_mode=False,
     :return: list of provides created from given path
     :rtype: list[str]
     '''
-    provides = []
+    abs_provides, full_provides = _search_for_provides_pair(path, prefixes, skip_wrong_names, skip_namespace_pkgs,
+                                                            verbose, _bad_provides)
+    return abs_provides if abs_mode else full_provides
+
+
+def _search_for_provides_pair(path, prefixes, skip_wrong_names, skip_namespace_pkgs, verbose, _bad_provides):
+    abs_provides = []
+    full_provides = []
+    prefixes = compile_prefixes(prefixes)
     path = Path(path)
 
     if path.is_file() or path.is_symlink():
-        return create_provides_from_path(path.as_posix(), prefixes, abs_mode=abs_mode,
-                                         skip_wrong_names=skip_wrong_names, skip_namespace_pkgs=skip_namespace_pkgs,
-                                         verbose=verbose, _bad_provides=_bad_provides)
+        return _create_provides_pair(path.as_posix(), prefixes, False, skip_wrong_names, skip_namespace_pkgs,
+                                     verbose, _bad_provides)
     elif path.is_dir() and '__pycache__' not in path.as_posix():
-        for subpath in path.iterdir():
-            provides += search_for_provides(subpath, prefixes, abs_mode, skip_wrong_names, skip_namespace_pkgs,
-                                            verbose=verbose, _bad_provides=_bad_provides)
-    return provides
+        for entry in walk(path, verbose=verbose):
+            if entry.is_symlink() or entry.is_file():
+                sub_abs, sub_full = _create_provides_pair(entry.path, prefixes, False, skip_wrong_names,
+                                                          skip_namespace_pkgs, verbose, _bad_provides)
+                abs_provides += sub_abs
+                full_provides += sub_full
+    return abs_provides, full_provides
 
 
 def module_detector(path, prefixes, modules=[], verbose_mode=True):
@@ -170,22 +412,17 @@ def module_detector(path, prefixes, modules=[], verbose_mode=True):
     :type path: str or pathlib.Path
     :param prefixes: list of prefixes by which the path will be trimmed
     :type prefixes: list[str]
-    :param modules: list of already detected modules (usefull with verbose_mode to ignore already detected modules)
-    :type modules: list[str]
+    :param modules: already detected modules (usefull with verbose_mode to ignore already detected modules)
+    :type modules: list[str] or set[str]
     :param verbose_mode: turn on verbose mode (print detected modules to the stderr)
     :type verbose_mode: Bool
     :return: pair of detected prefix and top module
     :rtype: (str, str) or (None, None)
     '''
-    if isinstance(path, Path):
-        path = path.as_posix()
-    for pref in sorted(prefixes, key=lambda p: (len(p.split('/')), p), reverse=True):
-        if pref and (pref := os.path.normpath(pref)) and path.startswith(pref + '/') and pref != os.path.normpath(path):
-            module = re.match(r'%s\/([^\/]+)' % re.escape(pref), path).groups()[0]
-            if verbose_mode and module not in modules:
-                print(f'py3prov:INFO: detected potential module:{module}', file=sys.stderr)
-            return pref, module
-    return None, None
+    pref, module = compile_prefixes(prefixes).detect_module(path)
+    if module is not None and verbose_mode and module not in modules:
+        print(f'py3prov:INFO: detected potential module:{module}', file=sys.stderr)
+    return pref, module
 
 
 def pth_detector(pathes, verbose_mode=False):
@@ -209,12 +446,13 @@ def pth_detector(pathes, verbose_mode=False):
         if path.suffix == '.pth':
             if verbose_mode:
                 print(f'py3prov:INFO: Detected .pth file:{path.absolute().as_posix()}', file=sys.stderr)
-            new_prefixes += processing_pth(path.absolute().as_posix())
+            new_prefixes += _processing_pth_cached(path.absolute().as_posix())
         elif path.is_dir():
             for item in path.iterdir():
                 if item.suffix == '.pth':
-                    print(f'py3prov:INFO: Detected .pth file:{item.absolute().as_posix()}', file=sys.stderr)
-                    new_prefixes += processing_pth(item.absolute().as_posix())
+                    if verbose_mode:
+                        print(f'py3prov:INFO: Detected .pth file:{item.absolute().as_posix()}', file=sys.stderr)
+                    new_prefixes += _processing_pth_cached(item.absolute().as_posix())
         else:
             if verbose_mode:
                 print(f'py3prov:INFO: Path {path} is not a directory or .pth file, skip it', file=sys.stderr)
@@ -242,21 +480,23 @@ def files_filter(files, prefixes=sys.path, only_prefix=False,
 
     files_dict = {}
 
-    modules = []
-    for file in sorted(files, reverse=True):
-        if isinstance(file, Path):
-            file = file.as_posix()
+    files = [file.as_posix() if isinstance(file, Path) else file for file in sorted(files, reverse=True)]
+    # With deep_search files of detected module are grouped, they are found as a range of sorted index
+    index = sorted(files) if deep_search else []
+    grouped = set()
+    modules = set()
+    for file in files:
+        if file in grouped:
+            continue
 
         pref, module = module_detector(file, prefixes, modules, verbose_mode)
         if pref and module:
             module_path = re.match(r'%s\/%s(\.py|%s|%s|\/|$)'
                                    % (re.escape(pref), re.escape(module),
                                       re.escape(so_suffix), re.escape(shlib_suffix)), file).group()
-            modules.append(module)
+            modules.add(module)
             if deep_search:
-                for f in files:
-                    if f.startswith(module_path):
-                        files.remove(f)
+                grouped.update(index[bisect_left(index, module_path):bisect_left(index, module_path + '\U0010ffff')])
                 files_dict[module_path] = module
             else:
                 files_dict[file] = module
@@ -285,7 +525,7 @@ def _genprov_from_recs(record, verbose=False):
                        recs), start=[])
 
 
-def genprov_from_env(paths=[], verbose=False):
+def genprov_from_env(paths=[], verbose=False, index=None):
     """
     Generate provides from installed to environment wheels according to their .dist-info/RECORD file
 
@@ -294,30 +534,245 @@ def genprov_from_env(paths=[], verbose=False):
     :type paths: list()
     :param verbose: make it verbose
     :type verbose: Bool
+    :param index: path to the persistent index of installed distributions,
+    only new or changed distributions are rescanned (None means no index)
+    :type index: str or pathlib.Path or None
     :return: dictionary from package name, package version and its provides
     :rtype: dict
     """
     paths = set([sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib']]) if paths == [] else paths
-    pattern = re.compile("([^/]+)-([^-]+)\.dist-info")
+    pattern = re.compile(r"([^/]+)-([^-]+)\.dist-info")
     pkg_ver_provs = {}
-    for dist_inf, recs in _find_dist_info_recs(paths, verbose):
-        if (fnd := pattern.search(dist_inf.name)) is not None:
-            pkg, ver = fnd.groups()
-            provs = set(_genprov_from_recs(recs, verbose=verbose))
-            pkg_ver_provs[(pkg, ver)] = provs
+
+    env_index = None
+    if index:
+        try:
+            env_index = EnvIndex(index, verbose=verbose)
+        except (OSError, sqlite3.Error) as err:
+            if verbose:
+                print(f'py3prov:WARNING: Failed to open index {index} due to {err}', file=sys.stderr)
+
+    try:
+        for dist_inf, recs in _find_dist_info_recs(paths, verbose, env_index):
+            if (fnd := pattern.search(dist_inf.name)) is not None:
+                pkg, ver = fnd.groups()
+                if env_index is None or (provs := env_index.get(dist_inf)) is None:
+                    provs = set(_genprov_from_recs(recs, verbose=verbose))
+                    if env_index is not None:
+                        env_index.put(dist_inf, provs)
+                pkg_ver_provs[(pkg, ver)] = provs
+    finally:
+        if env_index is not None:
+            env_index.close()
     return pkg_ver_provs
 
 
-def _find_dist_info_recs(paths, verbose=False):
+def _find_dist_info_recs(paths, verbose=False, env_index=None):
     for direc in paths:
-        for pkg in Path(direc).iterdir():
-            if (dist_inf := Path(pkg)).is_dir() and dist_inf.name.endswith(".dist-info"):
-                if (rec := dist_inf.joinpath("RECORD")).exists():
-                    yield dist_inf, rec
-                elif verbose:
-                    print("py3prov:WARNING: Found dist-info, which does not"
-                          f" provide RECORD file:{dist_inf.absolute().as_posix()}",
-                          file=sys.stderr)
+        if env_index is not None:
+            dist_infos = env_index.list_dir(direc)
+        else:
+            dist_infos = filter(lambda p: p.is_dir() and p.name.endswith(".dist-info"), Path(direc).iterdir())
+        for dist_inf in dist_infos:
+            if (rec := dist_inf.joinpath("RECORD")).exists():
+                yield dist_inf, rec
+            elif verbose:
+                print("py3prov:WARNING: Found dist-info, which does not"
+                      f" provide RECORD file:{dist_inf.absolute().as_posix()}",
+                      file=sys.stderr)
+
+
+def _provided_parent(provides, name):
+    # Parents are checked from the longest one, there are only few of them, so no index is needed
+    while (name := name.rpartition('.')[0]):
+        if name in provides:
+            return name
+    return None
+
+
+class ProvidesSet:
+    '''
+    Immutable set of provides built once from several collections of provides. Names are kept
+    in frozenset, provided parent modules of name are found by looking up its dotted prefixes.
+
+    :param provides: collections of provides, which are united
+    :type provides: iterable[str]
+    '''
+    __slots__ = ('_names',)
+
+    def __init__(self, *provides):
+        self._names = frozenset().union(*provides)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def parent(self, name):
+        '''
+        Search for the longest provided parent module of the name (the name itself is not considered)
+
+        :param name: dotted name of module
+        :type name: str
+        :return: provided parent module or None
+        :rtype: str or None
+        '''
+        return _provided_parent(self._names, name)
+
+
+class LazyProvides:
+    '''
+    Provides combined from tiers, which are loaded on demand: the next tier is loaded only when name
+    is not found in already loaded ones, so expensive sources (like walk over additional pathes)
+    are not touched, if all dependencies are resolved earlier. Tiers should be ordered from the cheapest.
+
+    :param tiers: sets of provides or functions without arguments returning them (share memoized functions
+    between several LazyProvides to load tier once), other collections are converted to frozenset
+    :type tiers: set[str] or frozenset[str] or ProvidesSet or callable
+    '''
+    __slots__ = ('_loaded', '_pending')
+
+    def __init__(self, *tiers):
+        self._loaded = []
+        self._pending = list(reversed(tiers))
+
+    def _load(self):
+        tier = self._pending.pop()
+        tier = tier() if callable(tier) else tier
+        if not isinstance(tier, (set, frozenset, ProvidesSet)):
+            tier = frozenset(tier)
+        self._loaded.append(tier)
+        return tier
+
+    def __contains__(self, name):
+        if any(name in tier for tier in self._loaded):
+            return True
+        while self._pending:
+            if name in self._load():
+                return True
+        return False
+
+    def parent(self, name):
+        '''
+        Search for the longest provided parent module of the name (all tiers are loaded)
+
+        :param name: dotted name of module
+        :type name: str
+        :return: provided parent module or None
+        :rtype: str or None
+        '''
+        while self._pending:
+            self._load()
+        return _provided_parent(self, name)
+
+
+class ProvidersIndex:
+    '''
+    Reverse index from module name to distributions, which provide it.
+    Build it once to match requirements of many files against one environment.
+
+    :param env_provides: dictionary from package name, package version and its provides (see genprov_from_env)
+    :type env_provides: dict
+    '''
+    __slots__ = ('_providers', '_owners')
+
+    def __init__(self, env_provides):
+        providers = {}
+        owners = {}
+        for pkg_ver in sorted(env_provides):
+            provides = env_provides[pkg_ver]
+            parents = {prov.rpartition('.')[0] for prov in provides}
+            for prov in provides:
+                providers.setdefault(prov, []).append(pkg_ver)
+                # Distribution owns package with __init__ or module, but not namespace of its modules
+                if prov + '.__init__' in provides or prov not in parents:
+                    owners.setdefault(prov, []).append(pkg_ver)
+        self._providers = {prov: tuple(dists) for prov, dists in providers.items()}
+        self._owners = {prov: dists[0] for prov, dists in owners.items() if len(dists) == 1}
+
+    @classmethod
+    def from_env(cls, paths=[], verbose=False, index=None, _memo={}):
+        '''
+        Build index for distributions installed to environment (arguments are the same as for genprov_from_env).
+        Index is kept in memory and reused while mtimes of site directories are not changed
+        (distribution is installed or removed), so long-running processes do not rescan environment.
+
+        :return: index of providers
+        :rtype: ProvidersIndex
+        '''
+        mtimes = []
+        for path in sorted(Path(path).as_posix() for path in paths):
+            try:
+                mtimes.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                mtimes.append((path, None))
+        key = (tuple(mtimes), Path(index).as_posix() if index else None)
+
+        if (providers := _memo.get(key)) is None:
+            providers = cls(genprov_from_env(paths=paths, verbose=verbose, index=index))
+            if len(_memo) >= 8:
+                _memo.clear()
+            _memo[key] = providers
+        return providers
+
+    def resolve(self, name):
+        '''
+        Find module, which provides name, and its distributions: the module itself or its nearest provided
+        parent module (for a.b.c: a.b or a), if this parent is package or module owned by one distribution.
+        Submodules of namespace, which is shared by several distributions, are not matched to them.
+
+        :param name: module name
+        :type name: str
+        :return: provided module (or None) and sorted pairs of package name and version
+        :rtype: (str or None, tuple[(str, str)])
+        '''
+        if (dists := self._providers.get(name)):
+            return name, dists
+        while (name := name.rpartition('.')[0]):
+            if name in self._providers:
+                return (name, (self._owners[name],)) if name in self._owners else (None, ())
+        return None, ()
+
+    def providers(self, name):
+        '''
+        Get distributions, which provide module or its nearest parent module (see resolve)
+
+        :param name: module name
+        :type name: str
+        :return: sorted pairs of package name and version
+        :rtype: tuple[(str, str)]
+        '''
+        return self.resolve(name)[1]
+
+    def match(self, deps):
+        '''
+        Match dependencies to distributions. If dependency is provided by several distributions,
+        the one, which satisfies other dependencies, is preferred, otherwise the first in sorted order is used.
+
+        :param deps: dependencies
+        :type deps: iterable[str]
+        :return: dict {(package, version):matched deps} and set of unmatched deps
+        :rtype: ({(str, str):set[str]}, set[str])
+        '''
+        matched = {}
+        ambiguous = []
+        unmatched = set()
+        for dep in sorted(deps):
+            if not (dists := self.providers(dep)):
+                unmatched.add(dep)
+            elif len(dists) == 1:
+                matched.setdefault(dists[0], set()).add(dep)
+            else:
+                ambiguous.append((dep, dists))
+
+        for dep, dists in ambiguous:
+            dist = next((dist for dist in dists if dist in matched), dists[0])
+            matched.setdefault(dist, set()).add(dep)
+        return dict(sorted(matched.items())), unmatched
 
 
 def generate_provides(files, prefixes=sys.path, skip_pth=False, only_prefix=False,
@@ -346,38 +801,159 @@ def generate_provides(files, prefixes=sys.path, skip_pth=False, only_prefix=Fals
     :return: dict {file:[provides]}
     :rtype: {str:[str]}
     '''
-    provides = {}
+    if skip_pth:
+        return dict(_iter_provides(files, prefixes, only_prefix, deep_search, abs_mode, verbose,
+                                   skip_wrong_names, skip_namespace_pkgs))
+    return dict(_iter_provides_with_pth(files, prefixes, only_prefix, deep_search, abs_mode, verbose,
+                                        skip_wrong_names, skip_namespace_pkgs))
+
+
+def _iter_provides_with_pth(files, prefixes=sys.path, only_prefix=False, deep_search=False, abs_mode=False,
+                            verbose=True, skip_wrong_names=True, skip_namespace_pkgs=True):
+    '''
+    Generate provides taking into account prefixes added by .pth files. Provides are built with
+    the extended prefixes, only files related to the added prefixes are processed with original ones too:
+    in abs_mode both results are merged, otherwise the original one is kept.
+    '''
+    pth = [os.path.normpath(p) for p in dict.fromkeys(pth_detector(prefixes, verbose))]
+    if not pth:
+        yield from _iter_provides(files, prefixes, only_prefix, deep_search, abs_mode, verbose,
+                                  skip_wrong_names, skip_namespace_pkgs)
+        return
+
+    orig_table = compile_prefixes(prefixes)
+    table = compile_prefixes(list(prefixes) + pth)
+    orig_files = files_filter(files, prefixes=orig_table, only_prefix=only_prefix,
+                              deep_search=deep_search, verbose_mode=verbose)
+    files_dict = files_filter(files, prefixes=table, only_prefix=only_prefix,
+                              deep_search=deep_search, verbose_mode=verbose)
+
+    def search(path, prefixes):
+        return search_for_provides(path, prefixes, abs_mode=abs_mode, skip_wrong_names=skip_wrong_names,
+                                   skip_namespace_pkgs=skip_namespace_pkgs, _bad_provides=set(), verbose=verbose)
+
+    def is_affected(path):
+        path = os.path.normpath(path)
+        return any(path == p or path.startswith(p + '/') or p.startswith(path + '/') for p in pth)
+
+    for path, package in orig_files.items():
+        if path not in files_dict:
+            yield path, {'provides': search(path, orig_table), 'package': package}
+            continue
+
+        new_provides = search(path, table)
+        provides = search(path, orig_table) if is_affected(path) else list(new_provides)
+        if abs_mode:
+            known = set(provides)
+            provides += [new for new in new_provides if new not in known and not known.add(new)]
+        yield path, {'provides': provides, 'package': package or files_dict[path]}
+
+    for path, package in files_dict.items():
+        if path not in orig_files:
+            yield path, {'provides': search(path, table), 'package': package}
+
+
+def _iter_provides(files, prefixes=sys.path, only_prefix=False, deep_search=False, abs_mode=False, verbose=True,
+                   skip_wrong_names=True, skip_namespace_pkgs=True):
+    prefixes = compile_prefixes(prefixes)
     files_dict = files_filter(files.copy(), prefixes=prefixes, only_prefix=only_prefix,
                               deep_search=deep_search, verbose_mode=verbose)
 
     for path, module_name in files_dict.items():
-        provides[path] = {'provides': search_for_provides(path, prefixes, abs_mode=abs_mode,
-                                                          skip_wrong_names=skip_wrong_names,
-                                                          skip_namespace_pkgs=skip_namespace_pkgs,
-                                                          _bad_provides=set(), verbose=verbose),
-                          'package': module_name}
-
-    if not skip_pth:
-        pth = set()
-        for path in files:
-            pth |= set(pth_detector(prefixes, verbose))
-        prefixes += list(pth)
-        new_provides = generate_provides(files, prefixes, True, only_prefix, deep_search, abs_mode, verbose,
-                                         skip_wrong_names, skip_namespace_pkgs)
-        for key, new_provs in new_provides.items():
-            if key in provides:
-                if abs_mode:
-                    provides[key]['provides'] += [new for new in new_provs['provides']
-                                                  if new not in provides[key]['provides']]
-                if not provides[key]['package']:
-                    provides[key]['package'] = new_provs['package']
-            else:
-                provides.update({key: new_provs})
+        yield path, {'provides': search_for_provides(path, prefixes, abs_mode=abs_mode,
+                                                     skip_wrong_names=skip_wrong_names,
+                                                     skip_namespace_pkgs=skip_namespace_pkgs,
+                                                     _bad_provides=set(), verbose=verbose),
+                     'package': module_name}
+
+
+def write_ndjson(records, stream=None, flush_interval=0.5, buffer_size=1 << 16):
+    '''
+    Write records as newline delimited json. Records are buffered, but buffer is flushed
+    at least every flush_interval seconds, so consumers get them without waiting for the end
+
+    :param records: iterable of json-serializable records
+    :type records: iterable
+    :param stream: output stream (sys.stdout by default)
+    :type stream: io
+    :param flush_interval: maximum time in seconds between flushes
+    :type flush_interval: float
+    :param buffer_size: maximum size of buffer
+    :type buffer_size: int
+    '''
+    stream = sys.stdout if stream is None else stream
+    buffer = []
+    size = 0
+    last_flush = time.monotonic()
+    for record in records:
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size or time.monotonic() - last_flush >= flush_interval:
+            stream.write(''.join(buffer))
+            stream.flush()
+            buffer = []
+            size = 0
+            last_flush = time.monotonic()
+    stream.write(''.join(buffer))
+    stream.flush()
+
+
+def generate_provides_sets(files, prefixes=sys.path, only_prefix=False, deep_search=False, verbose=True,
+                           skip_wrong_names=True, skip_namespace_pkgs=True):
+    '''
+    Generate absolute and full provides for given list of files in one pass (.pth files are not processed).
+
+    :param files: list of files
+    :type files: list[str]
+    :param prefixes: list of prefixes by which the path will be trimmed
+    :type prefixes: list[str]
+    :only_prefix: create provides only for files with prefix from prefixes
+    :type only_prefix: Bool
+    :param deep_search: with this option py3prov will try to find all provides according
+    to potential module (if it exists). Not fully tested.
+    :param verbose: turn on verbose mode
+    :param skip_wrong_names: skip provide if they are not an identifier
+    :type skip_wrong_names: Bool
+    :param skip_namespace_pkgs: do not build provides for namespace packages
+    :type skip_namespace_pkgs: Bool
+    :return: absolute provides, full provides and dict {file:package} for files from detected packages
+    :rtype: (set[str], set[str], {str:str})
+    '''
+    abs_provides = set()
+    full_provides = set()
+    packages = {}
+    for path, path_abs, path_full, module_name in _iter_provides_sets(files, prefixes, only_prefix, deep_search,
+                                                                      verbose, skip_wrong_names,
+                                                                      skip_namespace_pkgs):
+        abs_provides.update(path_abs)
+        full_provides.update(path_full)
+        if module_name is not None:
+            packages[path] = module_name
+
+    return abs_provides, full_provides, packages
+
+
+def _iter_provides_sets(files, prefixes=sys.path, only_prefix=False, deep_search=False, verbose=True,
+                        skip_wrong_names=True, skip_namespace_pkgs=True):
+    files_dict = files_filter(files.copy(), prefixes=prefixes, only_prefix=only_prefix,
+                              deep_search=deep_search, verbose_mode=verbose)
+    for path, module_name in files_dict.items():
+        path_abs, path_full = _search_for_provides_pair(path, prefixes, skip_wrong_names, skip_namespace_pkgs,
+                                                        verbose, set())
+        yield path, path_abs, path_full, module_name
 
-    return provides
+
+def _provides_records(path_provides, what_provides=set()):
+    for path, provides in path_provides:
+        if what_provides:
+            if (provs := what_provides.intersection(provides['provides'])):
+                yield {'file': path, 'provides': sorted(provs)}
+        else:
+            yield {'file': path, 'provides': provides['provides'], 'package': provides['package']}
 
 
-def main():
+def main(argv=None):
     args = argparse.ArgumentParser(description='Search provides for module')
     args.add_argument('--prefixes', help='List of prefixes')
     args.add_argument('--full_mode', action='store_true',
@@ -388,22 +964,31 @@ def main():
     args.add_argument("--whatprovides", action="append", default=[],
                       help="List files which provides specified dependencies."
                            " Example: --whatprovides foo --whatprovides sys")
+    args.add_argument('--format', choices=['text', 'ndjson'], default='text',
+                      help='Output format, ndjson writes one json record per file as soon as it is processed')
     args.add_argument('--verbose', action='store_true', help='Turn on verbose mode')
     args.add_argument('input', nargs='*', default=[],
                       help='List of files from which provides will be created')
-    args = args.parse_args()
+    args = args.parse_args(argv)
 
     if not args.input:
         args.input = sys.stdin.read().split()
 
     prefixes = args.prefixes.split(',') if args.prefixes else sys.path
 
-    path_provides = generate_provides(files=args.input, prefixes=prefixes,
-                                      skip_pth=args.skip_pth, abs_mode=not args.full_mode,
-                                      only_prefix=args.only_prefix, verbose=args.verbose)
+    options = dict(files=args.input, prefixes=prefixes, abs_mode=not args.full_mode,
+                   only_prefix=args.only_prefix, verbose=args.verbose)
+    if args.skip_pth:
+        path_provides = _iter_provides(**options)
+    else:
+        path_provides = _iter_provides_with_pth(**options)
 
     what_provides = set(args.whatprovides)
-    for path, provides in path_provides.items():
+    if args.format == 'ndjson':
+        write_ndjson(_provides_records(path_provides, what_provides))
+        return
+
+    for path, provides in path_provides:
         if what_provides:
             if (provs := what_provides.intersection(provides["provides"])):
                 print(f"{path}:{provs}")
@@ -412,6 +997,5 @@ def main():
         else:
             print(*[prov for prov in provides['provides'] if isinstance(prov, str)], sep='\n')
 
-
 if __name__ == '__main__':
     sys.exit(main())
@@ -1,16 +1,57 @@
 #! /usr/bin/env python3
 
 
+import io
 import os
 import re
 import sys
 import ast
+import json
 import shlex
+import sqlite3
+import hashlib
+import time
 import argparse
+import tokenize
+import unicodedata
 import pathlib
 import sysconfig
-from functools import reduce
-from .py3prov import generate_provides, search_for_provides, genprov_from_env
+from typing import NamedTuple
+from functools import reduce, partial, cache
+from itertools import chain, islice
+from contextlib import redirect_stderr
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .py3prov import (generate_provides_sets, search_for_provides, compile_prefixes, write_ndjson, ProvidersIndex,
+                      LazyProvides, walk, default_exclude, _iter_provides_sets)
+from .py3cache import cache_dir, load_json_cache, save_json_cache, ImportsCache
+from .py3stats import Stats
+from .py3elf import read_elf, is_elf, ElfInfo, ELF_MAGIC
+
+
+_no_deps = frozenset()
+
+
+class Requirements(NamedTuple):
+    '''
+    Requirements of one file: tuple of absolute, relative, advanced (__import__ stmt) and ABI dependencies.
+    Record has no instance dictionary, fields are frozensets of interned names (empty ones are shared),
+    so requirements of many files are kept compact. It unpacks and compares as the former 4-tuple of sets,
+    but fields are read-only: copy them with set() before modifying.
+    '''
+    absolute: frozenset = _no_deps
+    relative: frozenset = _no_deps
+    advanced: frozenset = _no_deps
+    abi: frozenset = _no_deps
+
+    @classmethod
+    def from_sets(cls, *deps):
+        '''
+        Create record from four collections of dependencies
+
+        :rtype: Requirements
+        '''
+        return cls._make(frozenset(map(sys.intern, dep)) if dep else _no_deps for dep in deps)
 
 
 def _remove_reduntant_args(func):
@@ -58,12 +99,8 @@ def build_full_qualified_name(path, level, dependency=None, prefixes=[]):
     :return: dependency name
     :rtype: str
     '''
-    parent_path = pathlib.Path(path).absolute().parts[1:-level]
-    parent_path = ''.join(f'/{p}' for p in parent_path)
-    for pref in sorted(prefixes, key=lambda k: len(k.split('/')), reverse=True):
-        if pref and (path_pref := re.match(r'%s/' % re.escape(pref), parent_path)):
-            parent_path = re.sub(re.escape(path_pref.group()), '', parent_path)
-    parent = '.'.join(name for name in parent_path.split('/') if name)
+    parent_path = pathlib.Path('/', *pathlib.Path(path).absolute().parts[1:-level])
+    parent = '.'.join(name for name in compile_prefixes(prefixes).trim(parent_path).parts if name != '/')
 
     if dependency:
         return f'{parent}.{dependency}' if parent else f'{dependency}'
@@ -96,6 +133,80 @@ def _form_std_provides():
     return pathes
 
 
+def _std_provides_key(pathes):
+    mtimes = {}
+    for path in sorted(pathes):
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            mtimes[path] = None
+
+    return {'python': sys.version,
+            'soabi': sysconfig.get_config_var('SOABI'),
+            'stdlib': sysconfig.get_paths()['stdlib'],
+            'platstdlib': sysconfig.get_paths()['platstdlib'],
+            'mtimes': mtimes}
+
+
+def default_std_cache():
+    '''
+    Returns default path to the standard library provides cache for current interpreter
+
+    :return: path to the cache file
+    :rtype: pathlib.Path
+    '''
+    return cache_dir().joinpath(f'stdlib-provides-{sysconfig.get_config_var("SOABI") or "unknown"}.json')
+
+
+def get_std_provides(cache_path=None, rebuild=False, verbose=False):
+    '''
+    Generate provides of python3 standard library. If cache_path is set, provides are loaded from this cache
+    and cache is (re)built when it is missing or outdated (interpreter, stdlib paths or their mtimes changed).
+    Provides are also kept in memory, so long-running processes do not scan standard library (or read cache)
+    again while it is up to date
+
+    :param cache_path: path to the cache file, None means no caching
+    :type cache_path: str or pathlib.Path or None
+    :param rebuild: rebuild cache even if it is up to date
+    :type rebuild: Bool
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: standard library provides
+    :rtype: set[str]
+    '''
+    return set(_get_std_provides(cache_path, rebuild, verbose))
+
+
+def _get_std_provides(cache_path=None, rebuild=False, verbose=False, _memo={}):
+    # Returns memoized frozenset, so it is shared by all runs of long-running process without copying
+    pathes = _form_std_provides()
+    key = _std_provides_key(pathes)
+
+    memo_key = json.dumps(key, sort_keys=True)
+    if not rebuild:
+        if memo_key in _memo and (not cache_path or os.path.exists(cache_path)):
+            return _memo[memo_key]
+        if cache_path and (cached := load_json_cache(cache_path, key, verbose=verbose)) is not None:
+            if len(_memo) >= 8:
+                _memo.clear()
+            _memo[memo_key] = frozenset(cached)
+            return _memo[memo_key]
+
+    provides = set()
+    for path in pathes:
+        provides.update(search_for_provides(path, abs_mode=False, skip_wrong_names=False,
+                                            skip_namespace_pkgs=False, verbose=verbose))
+    # This module is provided by different real modules which are platform specific, such as posixpath.py
+    provides.add('os.path')
+
+    if cache_path:
+        save_json_cache(cache_path, key, sorted(provides), verbose=verbose)
+    if len(_memo) >= 8:
+        _memo.clear()
+    _memo[memo_key] = frozenset(provides)
+    return _memo[memo_key]
+
+
 def get_text(path, size=-1, verbose=False):
     '''
     Returns text for giving path
@@ -125,6 +236,87 @@ def get_text(path, size=-1, verbose=False):
         return None
 
 
+def _read_input(path, stderr=None):
+    # File is opened once: ELF is parsed through mmap without reading it, content of other files is read.
+    # None is returned, if file can not be read or ELF is broken (error is reported to stderr, if it is set)
+    try:
+        with open(path, mode='rb') as f:
+            if (code := f.read(len(ELF_MAGIC))) == ELF_MAGIC:
+                return read_elf(f)
+            return code + f.read()
+    except ValueError as err:
+        if stderr is not None:
+            print(f'py3req.py:Catched error for ELF:{path}:{err}', file=stderr)
+        return None
+    except OSError:
+        return None
+
+
+def _read_ahead_text(path):
+    # Extension modules are processed by suffix, so they are not opened ahead
+    return None if path.endswith('.so') else _read_input(path)
+
+
+def _read_ahead_size(path):
+    if path.endswith('.so'):
+        return 0
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def read_ahead(files, depth=16, memory_limit=64 << 20):
+    '''
+    Read files in background threads ahead of consumer, so I/O is overlapped with parsing.
+    No more than depth files are read ahead and their total size (taken when file is submitted)
+    does not exceed memory_limit bytes, but at least one file is read. Single file is not read ahead.
+    ELF files are not read, they are parsed (see py3dephell.py3elf), content is None for files,
+    which were not read (.so files, unreadable files and etc.), they should be processed as usual.
+
+    :param files: list of files
+    :type files: iterable[str]
+    :param depth: maximum number of files read ahead (0 turns off reading ahead)
+    :type depth: int
+    :param memory_limit: maximum size of read but not consumed files in bytes
+    :type memory_limit: int
+    :return: pairs of file and its content (or information about ELF) in order of files
+    :rtype: iterator[(str, bytes or py3dephell.py3elf.ElfInfo or None)]
+    '''
+    files = iter(files)
+    head = list(islice(files, 2))
+    if depth <= 0 or len(head) < 2:
+        yield from ((file, None) for file in chain(head, files))
+        return
+
+    files = chain(head, files)
+    pending = deque()
+    reserved = 0
+    waiting = None
+    with ThreadPoolExecutor(max_workers=min(depth, 8)) as executor:
+        try:
+            while True:
+                while len(pending) < depth:
+                    if waiting is None:
+                        if (file := next(files, None)) is None:
+                            break
+                        waiting = file, _read_ahead_size(file)
+                    if pending and reserved + waiting[1] > memory_limit:
+                        break
+                    file, size = waiting
+                    waiting = None
+                    pending.append((file, size, executor.submit(_read_ahead_text, file)))
+                    reserved += size
+                if not pending:
+                    return
+                file, size, future = pending.popleft()
+                reserved -= size
+                yield file, future.result()
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
 def catch_so(path, stderr):
     '''
     Process ELF and returns python3-ABI dependency
@@ -135,13 +327,16 @@ def catch_so(path, stderr):
     :return: python3-ABI dependency
     :rtype: str or None
     '''
-    dep_version = os.getenv('RPM_PYTHON3_VERSION', '%s.%s' % sys.version_info[0:2])
     try:
         bit_depth = get_text(path, size=5)[4]
     except IndexError:
         print(f'py3req.py:Catched error for ELF:{path}, possibly file is empty or broken', file=stderr)
         bit_depth = None
+    return _abi_dependency(path, bit_depth, stderr)
+
 
+def _abi_dependency(path, bit_depth, stderr):
+    dep_version = os.getenv('RPM_PYTHON3_VERSION', '%s.%s' % sys.version_info[0:2])
     match bit_depth:
         case 1:
             return f'python{dep_version}-ABI'
@@ -152,53 +347,101 @@ def catch_so(path, stderr):
             return None
 
 
+def catch_elf(path, shared_libs=False, stderr=sys.stderr, info=None):
+    '''
+    Process file, if it is ELF (detected by magic), and returns its requirements: python3-ABI dependency
+    for extension modules (files with .so suffix or exporting PyInit_* function) and, optionally,
+    shared libraries from DT_NEEDED entries (as "lib.so.1()(64bit)" for 64bit ELF)
+
+    :param path: path to the file
+    :type path: str
+    :param shared_libs: add required shared libraries
+    :type shared_libs: Bool
+    :param stderr: stderr (io)
+    :type stderr: io
+    :param info: already parsed ELF, file is not opened then
+    :type info: py3dephell.py3elf.ElfInfo or None
+    :return: requirements or None if file is not ELF (or it is broken extension module)
+    :rtype: list[str] or None
+    '''
+    if info is None:
+        if path.endswith('.so') and not shared_libs:
+            return [dep] if (dep := catch_so(path, stderr)) else None
+        if path.endswith('.py') or not is_elf(path):
+            return None
+
+        try:
+            info = read_elf(path)
+        except (OSError, ValueError) as err:
+            print(f'py3req.py:Catched error for ELF:{path}:{err}', file=stderr)
+            return None
+
+    deps = []
+    if path.endswith('.so') or info.pyinit:
+        if (dep := _abi_dependency(path, info.elf_class, stderr)) is None:
+            return None
+        deps.append(dep)
+    if shared_libs:
+        deps += [f'{lib}()(64bit)' if info.is_64bit else lib for lib in info.needed]
+    return deps
+
+
+def _add_line(deps, dep, lineno):
+    deps.setdefault(dep, []).append(lineno)
+
+
+def _add_dep(deps, dep, lineno):
+    deps[dep] = None
+
+
 def _find_imports_in_ast(path, code, Node, prefixes, only_external_deps,
-                         skip_subs, stderr, verbose):
+                         skip_subs, stderr, verbose, _resolve=build_full_qualified_name, skip_lines=False):
     abs_deps = {}
     rel_deps = {}
     adv_deps = {}
     skip_deps = {}
+    # Without line numbers dictionaries are used as ordered sets
+    add = _add_dep if skip_lines else _add_line
 
     for node in ast.parse(code).body if code else ast.iter_child_nodes(Node):
         if isinstance(node, ast.Import):
             for name in node.names:
-                abs_deps.setdefault(name.name, []).append(name.lineno)
+                add(abs_deps, name.name, name.lineno)
         elif isinstance(node, ast.ImportFrom):
             if node.level == 0:
                 module = node.module
                 if skip_subs:
-                    abs_deps.setdefault(module, []).append(node.lineno)
+                    add(abs_deps, module, node.lineno)
                 else:
                     for name in node.names:
-                        mod_name = f'{module}.{name.name}'
-                        abs_deps.setdefault(mod_name, []).append(name.lineno)
+                        add(abs_deps, f'{module}.{name.name}', name.lineno)
             else:
-                module = build_full_qualified_name(path, node.level, node.module, prefixes)
+                module = _resolve(path, node.level, node.module, prefixes)
                 if skip_subs:
-                    rel_deps.setdefault(module, []).append(node.lineno)
+                    add(rel_deps, module, node.lineno)
                 else:
                     for name in node.names:
-                        mod_name = f'{module}.{name.name}'
-                        rel_deps.setdefault(mod_name, []).append(node.lineno)
+                        add(rel_deps, f'{module}.{name.name}', node.lineno)
 
         elif (dep := is_import_stmt(node)) or (dep := is_importlib_call(node)):
-            if dep.value in adv_deps:
-                adv_deps[dep.value].append(node.lineno)
-            else:
-                adv_deps[dep.value] = [node.lineno]
+            add(adv_deps, dep.value, node.lineno)
 
         elif only_external_deps:
+            # Skipped dependencies are used only for messages, so they are not searched without line numbers
+            if skip_lines:
+                continue
             for tmp in _find_imports_in_ast(path=path, code=None, Node=node, prefixes=prefixes,
                                             only_external_deps=only_external_deps,
                                             skip_subs=skip_subs, stderr=stderr,
-                                            verbose=verbose):
+                                            verbose=verbose, _resolve=_resolve):
                 for dep, line in tmp.items():
                     skip_deps.setdefault(dep, []).append(line)
         else:
             tmp_abs, tmp_rel, tmp_adv, tp =\
                 _find_imports_in_ast(path=path, code=None, Node=node, prefixes=prefixes,
                                      only_external_deps=only_external_deps,
-                                     skip_subs=skip_subs, stderr=stderr, verbose=verbose)
+                                     skip_subs=skip_subs, stderr=stderr, verbose=verbose,
+                                     _resolve=_resolve, skip_lines=skip_lines)
             abs_deps.update(tmp_abs)
             rel_deps.update(tmp_rel)
             adv_deps.update(tmp_adv)
@@ -206,7 +449,7 @@ def _find_imports_in_ast(path, code, Node, prefixes, only_external_deps,
 
 
 def read_ast_tree(path, code=None, prefixes=[], only_external_deps=False,
-                  skip_subs=True, stderr=sys.stderr, verbose=True):
+                  skip_subs=True, stderr=sys.stderr, verbose=True, skip_lines=False):
     '''
     Read AST for code from given path or even code and detect dependencies
 
@@ -224,14 +467,24 @@ def read_ast_tree(path, code=None, prefixes=[], only_external_deps=False,
     :type stderr: io
     :param verbose: turn on verbose flag
     :type verbose: Bool
+    :param skip_lines: do not collect line numbers (values of dictionaries are None) and skipped dependencies
+    :type skip_lines: Bool
     :return: tuple of dictionaries for absolute, relative, advanced (__import__ stmt) and skipped dependncies
     :rtype: tuple({}, {}, {}, {})
     '''
     if not code and not (code := get_text(path)):
         return {}, {}, {}, {}
+    if (deps := _read_ast_tree(path, code, prefixes, only_external_deps, skip_subs, stderr, verbose,
+                               skip_lines=skip_lines)) is None:
+        return {}, {}, {}, {}
+    return deps
+
+
+def _read_ast_tree(path, code, prefixes, only_external_deps, skip_subs, stderr, verbose,
+                   _resolve=build_full_qualified_name, skip_lines=False):
     try:
         return _find_imports_in_ast(path, code, None, prefixes, only_external_deps,
-                                    skip_subs, stderr, verbose)
+                                    skip_subs, stderr, verbose, _resolve, skip_lines)
     except (SyntaxError, ValueError) as msg:
         if verbose:
             print(f'py3req: error:{path}: invalid syntax', file=stderr)
@@ -241,11 +494,167 @@ def read_ast_tree(path, code=None, prefixes=[], only_external_deps=False,
             else:
                 print(f'py3req:{path}: possibly not pythonish file',
                       file=stderr)
-        return {}, {}, {}, {}
+        return None
+
+
+def _has_import_token(code):
+    '''
+    Checks if code may contain any import construction (import statement, __import__ or importlib call),
+    all of them need "import" token, so code without it can be skipped without parsing
+    '''
+    if b'import' in code:
+        return True
+    if code.isascii():
+        return False
+    # Identifiers are NFKC-normalized by parser, so "import" can be written with non-ASCII symbols
+    try:
+        encoding, lines = tokenize.detect_encoding(io.BytesIO(code).readline)
+        return 'import' in unicodedata.normalize('NFKC', code.decode(encoding))
+    except (SyntaxError, LookupError, UnicodeDecodeError):
+        return True
+
+
+_compound_stmts = frozenset(['if', 'elif', 'else', 'for', 'while', 'try', 'except', 'finally',
+                             'with', 'def', 'class', 'async'])
+
+
+def _parse_dotted_name(tokens, pos):
+    name = []
+    while pos < len(tokens) and tokens[pos].type == tokenize.NAME:
+        name.append(tokens[pos].string)
+        if tokens[pos + 1].string != '.':
+            return '.'.join(name), pos + 1
+        pos += 2
+    raise SyntaxError('invalid syntax', (None, tokens[pos - 1].start[0], None, None))
+
+
+def _find_imports_in_tokens(path, code, prefixes, skip_subs, _resolve=build_full_qualified_name, skip_lines=False):
+    abs_deps = {}
+    rel_deps = {}
+    add = _add_dep if skip_lines else _add_line
+    skip_types = (tokenize.ENCODING, tokenize.COMMENT, tokenize.NL)
+    tokens = [tok for tok in tokenize.tokenize(io.BytesIO(code).readline) if tok.type not in skip_types]
+
+    depth = 0
+    stmt_start = True
+    nested_line = False
+    pos = 0
+    while pos < len(tokens):
+        tok = tokens[pos]
+        pos += 1
+        if tok.type == tokenize.INDENT:
+            depth += 1
+            continue
+        elif tok.type == tokenize.DEDENT:
+            depth -= 1
+            continue
+        elif tok.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+            stmt_start = True
+            nested_line = False
+            continue
+        elif tok.type == tokenize.OP and tok.string == ';':
+            stmt_start = True
+            continue
+        elif not stmt_start:
+            continue
+
+        stmt_start = False
+        if tok.type != tokenize.NAME:
+            continue
+        elif depth or nested_line or tok.string in _compound_stmts:
+            nested_line = True
+            continue
+
+        if tok.string == 'import':
+            while True:
+                lineno = tokens[pos].start[0]
+                name, pos = _parse_dotted_name(tokens, pos)
+                add(abs_deps, name, lineno)
+                if tokens[pos].string == 'as':
+                    pos += 2
+                if tokens[pos].string != ',':
+                    break
+                pos += 1
+
+        elif tok.string == 'from':
+            level = 0
+            while tokens[pos].string in ('.', '...'):
+                level += len(tokens[pos].string)
+                pos += 1
+            module = None
+            if tokens[pos].string != 'import':
+                module, pos = _parse_dotted_name(tokens, pos)
+            if tokens[pos].string != 'import':
+                raise SyntaxError('invalid syntax', (None, tokens[pos].start[0], None, None))
+            pos += 1
+
+            names = []
+            parens = tokens[pos].string == '('
+            pos += parens
+            while tokens[pos].type == tokenize.NAME or tokens[pos].string == '*':
+                names.append((tokens[pos].string, tokens[pos].start[0]))
+                pos += 1
+                if tokens[pos].string == 'as':
+                    pos += 2
+                if tokens[pos].string != ',':
+                    break
+                pos += 1
+            if parens and tokens[pos].string != ')' or not names:
+                raise SyntaxError('invalid syntax', (None, tokens[pos].start[0], None, None))
+
+            if level == 0:
+                if skip_subs:
+                    add(abs_deps, module, tok.start[0])
+                else:
+                    for name, lineno in names:
+                        add(abs_deps, f'{module}.{name}', lineno)
+            else:
+                module = _resolve(path, level, module, prefixes)
+                if skip_subs:
+                    add(rel_deps, module, tok.start[0])
+                else:
+                    for name, lineno in names:
+                        add(rel_deps, f'{module}.{name}', tok.start[0])
+    return abs_deps, rel_deps, {}, {}
+
+
+def _read_tokens(path, code, prefixes, skip_subs, stderr, verbose, _resolve=build_full_qualified_name,
+                 skip_lines=False):
+    try:
+        return _find_imports_in_tokens(path, code, prefixes, skip_subs, _resolve, skip_lines)
+    except (SyntaxError, tokenize.TokenError, IndexError) as msg:
+        if verbose:
+            print(f'py3req: error:{path}: invalid syntax', file=stderr)
+            head, ext = os.path.splitext(path)
+            if ext == '.py':
+                print(f'py3req:{path}:{msg.msg if isinstance(msg, SyntaxError) else msg}', file=stderr)
+            else:
+                print(f'py3req:{path}: possibly not pythonish file',
+                      file=stderr)
+        return None
+
+
+def _relative_placeholder(path, level, dependency=None, prefixes=[]):
+    # Relative imports are cached without path, so they are resolved by _resolve_relative after loading
+    return f'\0{level}\0{dependency or ""}\0'
+
+
+def _resolve_relative(deps, path, prefixes):
+    resolved = {}
+    for dep, lines in deps.items():
+        if dep.startswith('\0'):
+            trash, level, module, rest = dep.split('\0', 3)
+            dep = build_full_qualified_name(path, int(level), module or None, prefixes) + rest
+        if dep in resolved and lines is not None:
+            resolved[dep] += lines
+        else:
+            resolved[dep] = lines
+    return resolved
 
 
 def process_file(path, only_external_deps=False, skip_subs=False, prefixes=[],
-                 stderr=sys.stderr, verbose=False):
+                 stderr=sys.stderr, verbose=False, cache=None, prescan=True, engine='ast', stats=None, code=None,
+                 skip_lines=False):
     '''
     Generate dependencies for given path to file
 
@@ -261,14 +670,182 @@ def process_file(path, only_external_deps=False, skip_subs=False, prefixes=[],
     :type stderr: io
     :param verbose: turn on verbose flag
     :type verbose: Bool
+    :param cache: cache of extracted imports
+    :type cache: py3dephell.py3cache.ImportsCache or None
+    :param prescan: skip parsing of files, which do not contain "import" token
+    :type prescan: Bool
+    :param engine: "ast" or "tokenize", the last one is faster, but detects only top-level import statements
+    (like only_external_deps does) and does not report skipped dependencies
+    :type engine: str
+    :param stats: statistics to update (files and bytes read, ASTs built, syntax errors, cache hits)
+    :type stats: py3dephell.py3stats.Stats or None
+    :param code: content of the file, if it is already read (see read_ahead), otherwise file is read from path
+    :type code: bytes or None
+    :param skip_lines: do not collect line numbers (values of dictionaries are None) and skipped dependencies,
+    they are used only by verbose messages
+    :type skip_lines: Bool
     :return: tuple of dictionaries for absolute, relative, advanced (__import__ stmt) and skipped dependncies
     :rtype: tuple({}, {}, {}, {})
     '''
-    if (code := get_text(path, verbose=verbose)):
-        return read_ast_tree(path, code, prefixes=prefixes,
-                             only_external_deps=only_external_deps,
-                             skip_subs=skip_subs, stderr=stderr, verbose=verbose)
-    return {}, {}, {}, {}
+    if code is None:
+        code = get_text(path, verbose=verbose)
+    if stats is not None and code is not None:
+        stats.count('files_read')
+        stats.count('bytes_read', len(code))
+    if not code or (prescan and not _has_import_token(code)):
+        if stats is not None and code:
+            stats.count('files_without_imports')
+        return {}, {}, {}, {}
+
+    if engine == 'tokenize':
+        read = partial(_read_tokens, path, code, prefixes, skip_subs, stderr, verbose, skip_lines=skip_lines)
+    elif engine == 'ast':
+        read = partial(_read_ast_tree, path, code, prefixes, only_external_deps, skip_subs, stderr, verbose,
+                       skip_lines=skip_lines)
+    else:
+        raise ValueError(f'py3req.process_file: unknown engine:{engine}')
+
+    if stats is not None:
+        read = partial(_counted_read, read, stats, 'asts_built' if engine == 'ast' else 'files_tokenized')
+
+    if cache is None:
+        return deps if (deps := read()) is not None else ({}, {}, {}, {})
+
+    # Entries with line numbers keep their keys, so they are reused after upgrade
+    key = cache.key(code, only_external_deps=only_external_deps, skip_subs=skip_subs, engine=engine,
+                    **({'skip_lines': True} if skip_lines else {}))
+    if (deps := cache.get(key)) is None:
+        if stats is not None:
+            stats.count('cache_misses')
+        if (deps := read(_resolve=_relative_placeholder)) is None:
+            return {}, {}, {}, {}
+        cache.put(key, deps)
+    elif stats is not None:
+        stats.count('cache_hits')
+    return tuple(_resolve_relative(dep, path, prefixes) for dep in deps)
+
+
+def _counted_read(read, stats, counter, **kwargs):
+    if (deps := read(**kwargs)) is None:
+        stats.count('syntax_errors')
+    else:
+        stats.count(counter)
+    return deps
+
+
+def _open_imports_cache(path, max_size, verbose):
+    try:
+        return ImportsCache(path, max_size=max_size, verbose=verbose)
+    except (OSError, sqlite3.Error) as err:
+        if verbose:
+            print(f'py3req:WARNING: Failed to open cache {path} due to {err}', file=sys.stderr)
+        return None
+
+
+def _extract_file(file, prefixes, only_external_deps, skip_subs, engine, stderr, verbose, cache=None, stats=None,
+                  shared_libs=False, code=None, skip_lines=False):
+    start = time.perf_counter()
+    elf_deps = None
+    if code is None and file.endswith('.so') and not shared_libs:
+        # Only ELF class of extension module is needed, so ELF is not parsed
+        elf_deps = catch_elf(file, shared_libs, stderr)
+    elif code is None and not file.endswith('.py'):
+        # Magic is checked on read content, so file is opened once
+        code = _read_input(file, stderr)
+    if isinstance(code, ElfInfo):
+        elf_deps, code = catch_elf(file, shared_libs, stderr, info=code), None
+    if elf_deps is not None:
+        result = elf_deps, ({}, {}, {}, {})
+    else:
+        result = None, process_file(file, prefixes=prefixes, only_external_deps=only_external_deps,
+                                    skip_subs=skip_subs, stderr=stderr, verbose=verbose, cache=cache,
+                                    engine=engine, stats=stats, code=code, skip_lines=skip_lines)
+    if stats is not None:
+        stats.add_file(file, time.perf_counter() - start)
+    return result
+
+
+def _extract_chunk(files, cache_options=None, stats_top=None, **kwargs):
+    # Cache is opened per chunk, so workers do not keep connections, old entries are evicted by parent
+    cache = _open_imports_cache(*cache_options, verbose=kwargs['verbose']) if cache_options else None
+    stats = Stats(top=stats_top) if stats_top is not None else None
+    results = []
+    try:
+        # Files are not read ahead in workers: reading is already overlapped with parsing in other workers
+        for file in files:
+            with io.StringIO() as stderr, redirect_stderr(stderr):
+                elf_deps, deps = _extract_file(file, stderr=stderr, cache=cache, stats=stats, **kwargs)
+                results.append((file, elf_deps, deps, stderr.getvalue()))
+    finally:
+        if cache is not None:
+            cache.close(evict=False)
+    return results, stats.as_dict() if stats is not None else None
+
+
+def _chunk_files(files, chunk_size=1 << 18, max_files=256):
+    chunk = []
+    size = 0
+    for file in files:
+        try:
+            size += os.path.getsize(file)
+        except OSError:
+            pass
+        chunk.append(file)
+        if size >= chunk_size or len(chunk) >= max_files:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+
+def _bounded_map(executor, func, items, window):
+    '''
+    Like executor.map, but no more than window items are submitted ahead of consumer,
+    so results are not piled up in memory and items are taken from iterator on demand
+    '''
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _extract_imports(files, jobs=1, prefixes=[], only_external_deps=False, skip_subs=True, engine='ast',
+                     shared_libs=False, cache_options=None, read_ahead_options=(0, 0), stderr=sys.stderr,
+                     verbose=False, stats=None, skip_lines=False):
+    kwargs = {'prefixes': prefixes, 'only_external_deps': only_external_deps, 'skip_subs': skip_subs,
+              'engine': engine, 'shared_libs': shared_libs, 'verbose': verbose, 'skip_lines': skip_lines}
+    cache = _open_imports_cache(*cache_options, verbose=verbose) if cache_options else None
+    try:
+        if jobs == 1 or len(files) < 2:
+            for file, code in read_ahead(files, *read_ahead_options):
+                yield file, *_extract_file(file, stderr=stderr, cache=cache, stats=stats, code=code, **kwargs)
+            return
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # Two chunks per worker are in flight: one is parsed, the next one is ready to be taken
+            for results, chunk_stats in _bounded_map(executor,
+                                                     partial(_extract_chunk, cache_options=cache_options,
+                                                             stats_top=stats.top if stats is not None else None,
+                                                             **kwargs),
+                                                     _chunk_files(files), 2 * jobs):
+                if chunk_stats is not None:
+                    stats.merge(chunk_stats)
+                for file, elf_deps, deps, messages in results:
+                    if messages:
+                        stderr.write(messages)
+                    yield file, elf_deps, deps
+    finally:
+        # Entries added by workers are evicted through the same connection
+        if cache is not None:
+            cache.close()
 
 
 def filter_requirements(file, deps, provides=[], only_top_module=[], ignore_list=[],
@@ -279,10 +856,11 @@ def filter_requirements(file, deps, provides=[], only_top_module=[], ignore_list
 
     :param file: name of file, which contains dependencies
     :type file: str
-    :param deps: list of dependencies
-    :type deps: {str:[]}
-    :param provides: list of provides (there can be self-provides)
-    :type provides: list[str]
+    :param deps: dependencies with their line numbers (or None) or just dependencies
+    :type deps: {str:[int]} or iterable[str]
+    :param provides: provides (there can be self-provides), ProvidesSet or LazyProvides to avoid building
+    unions per file
+    :type provides: list[str] or set[str] or py3dephell.py3prov.ProvidesSet or py3dephell.py3prov.LazyProvides
     :param only_top_module: for dependencies like a.b skip b
     :type only_top_module: Bool
     :param ignore_list: list of dependencies to be ignored
@@ -298,21 +876,22 @@ def filter_requirements(file, deps, provides=[], only_top_module=[], ignore_list
     '''
     dependencies = set()
 
-    for dep, lines in deps.items():
+    for dep, lines in deps.items() if isinstance(deps, dict) else ((dep, None) for dep in deps):
+        where = f' lines:{lines}' if lines is not None else ''
         if dep in ignore_list:
             if verbose:
-                print(f'py3req:{file}: skipping "{dep}" lines:{lines}', file=stderr)
+                print(f'py3req:{file}: skipping "{dep}"{where}', file=stderr)
         elif dep in provides:
             if verbose:
-                print(f'py3req:{file}: "{dep}" lines:{lines} is possibly a '
+                print(f'py3req:{file}: "{dep}"{where} is possibly a '
                       'self-providing dependency, skip it', file=stderr)
         elif skip_flag:
             if verbose:
-                print(f'py3req:{file}: "{dep}" lines:{lines}: Ignore', file=stderr)
+                print(f'py3req:{file}: "{dep}"{where}: Ignore', file=stderr)
         else:
             if only_top_module:
                 dep = dep.split('.')[0]
-            dependencies.add(dep)
+            dependencies.add(sys.intern(dep))
 
     return dependencies
 
@@ -321,7 +900,10 @@ def filter_requirements(file, deps, provides=[], only_top_module=[], ignore_list
 def generate_requirements(files, add_prov_path=[], prefixes=sys.path,
                           ignore_list=sys.builtin_module_names, read_prov_from_file=None,
                           skip_subs=True, only_external_deps=False, only_top_module=False,
-                          exclude_stdlib=False, inspect_env=False, env_path=[], stderr=sys.stderr, verbose=True):
+                          exclude_stdlib=False, stdlib_cache=None, inspect_env=False, env_path=[], env_index=None,
+                          env_providers=None, jobs=1, imports_cache=None, imports_cache_size=256 << 20, engine='ast',
+                          shared_libs=False, read_ahead=16, read_ahead_memory=64 << 20, stats=None, stderr=sys.stderr,
+                          verbose=True):
     '''
     Generate dependencies for given file-list, filter them through detected provides and return in specified format.
 
@@ -343,117 +925,375 @@ def generate_requirements(files, add_prov_path=[], prefixes=sys.path,
     :type only_top_module: Bool
     :param exclude_stdlib: exclude from dependencies standard lib provides
     :type exclude_stdlib: Bool
+    :param stdlib_cache: path to the cache file for standard lib provides (None means no caching)
+    :type stdlib_cache: str or pathlib.Path or None
     :param inspect_env: inspect environment for installed packages and match with them requirements
     :type inspect_env: Bool
     :param env_path: path to the environment (useful for inspect_env option)
     :type env_path: [str]
+    :param env_index: path to the persistent index of installed distributions (useful for inspect_env option)
+    :type env_index: str or pathlib.Path or None
+    :param env_providers: prebuilt index of environment providers, env_path and env_index are ignored if it is set
+    :type env_providers: py3dephell.py3prov.ProvidersIndex or None
+    :param jobs: number of processes used to parse files (None or 0 means number of CPUs)
+    :type jobs: int or None
+    :param imports_cache: path to the persistent cache of imports extracted from files (None means no caching)
+    :type imports_cache: str or pathlib.Path or None
+    :param imports_cache_size: maximum size of imports cache in bytes
+    :type imports_cache_size: int
+    :param engine: "ast" or "tokenize", the last one is faster, but detects only top-level import statements,
+    so it can be used only with only_external_deps
+    :type engine: str
+    :param shared_libs: add shared libraries required by ELF files (DT_NEEDED entries) to the ABI dependencies
+    :type shared_libs: Bool
+    :param read_ahead: number of files read in background threads ahead of parser (0 turns off reading ahead)
+    :type read_ahead: int
+    :param read_ahead_memory: maximum size of files read ahead in bytes
+    :type read_ahead_memory: int
+    :param stats: statistics to fill: time per phase, counters of files, bytes, ASTs, provides and etc.
+    :type stats: py3dephell.py3stats.Stats or None
     :param stderr: messages output
     :type stderr: io
     :param verbose: verbose flag
     :type verbose: Bool
-    :return: tuple of dictionaries for absolute, relative, advanced (__import__ stmt) and skipped dependncies
-    :rtype: tuple({}, {}, {}, {})
+    :return: requirements of each file or set of matched distributions for inspect_env. Requirements
+    of file are Requirements records of frozensets (they were mutable sets before), copy fields to modify them
+    :rtype: {str:Requirements} or set[str]
     '''
-    full_provides = set()
-    abs_provides = set()
-    add_provides = set()
-    modules = {}
+    stats = stats if stats is not None else Stats(top=0)
+    self_provides = _generate_self_provides(files, prefixes, stats, verbose) if inspect_env else None
+    requirements = iter_requirements(files, add_prov_path=add_prov_path, prefixes=prefixes, ignore_list=ignore_list,
+                                     read_prov_from_file=read_prov_from_file, skip_subs=skip_subs,
+                                     only_external_deps=only_external_deps, only_top_module=only_top_module,
+                                     exclude_stdlib=exclude_stdlib, stdlib_cache=stdlib_cache, jobs=jobs,
+                                     imports_cache=imports_cache, imports_cache_size=imports_cache_size,
+                                     engine=engine, shared_libs=shared_libs, read_ahead=read_ahead,
+                                     read_ahead_memory=read_ahead_memory, stats=stats, stderr=stderr,
+                                     verbose=verbose, _self_provides=self_provides)
     if not inspect_env:
-        dependencies = {}
-    else:
-        dependencies = set()
-        tmp_dependencies = set()
-
-    if read_prov_from_file:
-        with open(read_prov_from_file) as f:
-            full_provides |= set([prov.rstrip() for prov in f.readlines()])
-
-    for module, prov in generate_provides(files, skip_pth=True, deep_search=False, prefixes=prefixes,
-                                          abs_mode=False, verbose=verbose, skip_wrong_names=False,
-                                          skip_namespace_pkgs=False).items():
-        if prov['package'] is not None:
-            modules[module] = prov['package']
-        full_provides |= set(prov['provides'])
-
-    for module, prov in generate_provides(files, skip_pth=True, deep_search=False, prefixes=prefixes,
-                                          abs_mode=True, verbose=verbose, skip_wrong_names=False,
-                                          skip_namespace_pkgs=False).items():
-        if prov['package'] is not None:
-            modules[module] = prov['package']
-        abs_provides |= set(prov['provides'])
-
-    for path in filter(lambda p: p, add_prov_path):
-        prov = search_for_provides(path, abs_mode=False, skip_wrong_names=False, skip_namespace_pkgs=False,
-                                   verbose=verbose)
-        add_provides |= set(prov)
-
-    if exclude_stdlib:
-        add_provides |= set(sum([search_for_provides(p, abs_mode=False,
-                                                     skip_wrong_names=False, skip_namespace_pkgs=False, verbose=verbose)
-                                 for p in _form_std_provides()], start=[]))
-        # This module is provided by different real modules which are platform specific, such as posixpath.py
-        add_provides.add("os.path")
-
-    if inspect_env:
+        return dict(requirements)
+
+    dependencies = set()
+    tmp_dependencies = set()
+    for file, (abs_deps, rel_deps, adv_deps, so_deps) in requirements:
+        tmp_dependencies |= abs_deps | rel_deps | adv_deps
+
+    if not tmp_dependencies:
+        return dependencies
+
+    if env_providers is None:
         env_path = set([sysconfig.get_paths()['purelib'],
                         sysconfig.get_paths()['platlib']]) if env_path == [] else env_path
-        env_provides = genprov_from_env(paths=env_path, verbose=verbose)
+        with stats.phase('env_provides'):
+            env_providers = ProvidersIndex.from_env(paths=env_path, verbose=verbose, index=env_index)
+
+    with stats.phase('env_match'):
+        # Unresolved submodules of input package should not be matched to its installed copy through parent
+        for dep in sorted(tmp_dependencies):
+            if (module := env_providers.resolve(dep)[0]) not in (None, dep) and module in self_provides[0]:
+                tmp_dependencies.discard(dep)
+                if verbose:
+                    print(f'py3req: "{dep}" is possibly a self-providing dependency, skip it', file=stderr)
+        matched, unmatched = env_providers.match(tmp_dependencies)
+    for pkg_ver, deps in matched.items():
+        dependencies.add("==".join(pkg_ver))
+        if verbose:
+            print(f"The following deps:{",".join(sorted(deps))} was satisfied by package:{"==".join(pkg_ver)}",
+                  file=sys.stderr)
+    if verbose and unmatched:
+        print("WARNING! Dependencies not matched to any package"
+              f" in your environment:{",".join(sorted(unmatched))}",
+              file=sys.stderr)
 
-    for file in files:
-        if file.endswith('.so'):
-            if (dep := catch_so(file, stderr)):
-                if not inspect_env:
-                    dependencies[file] = set(), set(), set(), set([dep])
-                continue
+    return dependencies
 
-        abs_deps, rel_deps, adv_deps, skip =\
-            process_file(file, prefixes=prefixes, only_external_deps=only_external_deps,
-                         skip_subs=skip_subs, stderr=stderr, verbose=verbose)
 
-        if file in modules.keys() and '-' not in modules[file]:
-            abs_deps = filter_requirements(file, abs_deps, abs_provides | add_provides,
-                                           only_top_module, ignore_list,
-                                           stderr=stderr, verbose=verbose)
-        else:
-            abs_deps = filter_requirements(file, abs_deps, full_provides | add_provides,
-                                           only_top_module, ignore_list,
-                                           stderr=stderr, verbose=verbose)
+def iter_requirements(files, add_prov_path=[], prefixes=sys.path, ignore_list=sys.builtin_module_names,
+                      read_prov_from_file=None, skip_subs=True, only_external_deps=False, only_top_module=False,
+                      exclude_stdlib=False, stdlib_cache=None, jobs=1, imports_cache=None,
+                      imports_cache_size=256 << 20, engine='ast', shared_libs=False, read_ahead=16,
+                      read_ahead_memory=64 << 20, stats=None, stderr=sys.stderr, verbose=True, _self_provides=None):
+    '''
+    Generate dependencies for given file-list and yield them for each file as soon as it is processed.
+    Self-provides are prepared before the first file, then only a small window of files is in flight
+    (read ahead and parsed in worker processes), so memory does not grow with number of files.
+    Arguments are the same as for generate_requirements.
+
+    :return: pairs of file and its requirements (absolute, relative, advanced (__import__ stmt) and ABI
+    dependencies) in order of files, fields of Requirements are frozensets
+    :rtype: iterator[(str, Requirements)]
+    '''
+    if engine == 'tokenize' and not only_external_deps:
+        raise ValueError('py3req.generate_requirements: tokenize engine can be used only with only_external_deps')
+
+    stats = stats if stats is not None else Stats(top=0)
+    if _self_provides is None:
+        _self_provides = _generate_self_provides(files, prefixes, stats, verbose)
+    abs_provides, self_provides, modules = _self_provides
+
+    # Other sources of provides are loaded only when dependency is not resolved by the cheaper ones
+    read_tiers, tiers = _provides_tiers(add_prov_path, read_prov_from_file, exclude_stdlib, stdlib_cache, stats,
+                                        verbose)
+    abs_provides = LazyProvides(abs_provides, *tiers)
+    full_provides = LazyProvides(self_provides, *read_tiers, *tiers)
+    ignore_list = frozenset(ignore_list)
+
+    extracted = _extract_imports(files, jobs or os.cpu_count(), prefixes=prefixes,
+                                 only_external_deps=only_external_deps, skip_subs=skip_subs, engine=engine,
+                                 shared_libs=shared_libs,
+                                 cache_options=(imports_cache, imports_cache_size) if imports_cache else None,
+                                 read_ahead_options=(read_ahead, read_ahead_memory),
+                                 stderr=stderr, verbose=verbose, stats=stats, skip_lines=not verbose)
+    for file, elf_deps, deps in stats.iterate('parse', extracted):
+        if elf_deps is not None:
+            stats.count('abi_requirements', len(elf_deps))
+            yield file, Requirements.from_sets((), (), (), elf_deps)
+            continue
+
+        with stats.phase('filter'):
+            deps = _filter_file(file, deps, abs_provides if _uses_abs_provides(modules.get(file)) else full_provides,
+                                full_provides, only_top_module, ignore_list, stderr, verbose)
+        yield file, deps
+
+
+def _generate_self_provides(files, prefixes, stats, verbose):
+    with stats.phase('self_provides'):
+        provides = generate_provides_sets(files, deep_search=False, prefixes=prefixes, verbose=verbose,
+                                          skip_wrong_names=False, skip_namespace_pkgs=False)
+    stats.count('self_provides', len(provides[1]))
+    return provides
+
+
+def _provides_tiers(add_prov_path, read_prov_from_file, exclude_stdlib, stdlib_cache, stats, verbose):
+    # Memoized loaders of provides, which are not self-provides: tiers of full provides only and shared ones.
+    # Each tier is frozen once, the same object is used by abs and full provides
+    @cache
+    def read_provides():
+        with stats.phase('read_prov_from_file'), open(read_prov_from_file) as f:
+            return frozenset([prov.rstrip() for prov in f.readlines()])
+
+    @cache
+    def std_provides():
+        with stats.phase('stdlib_provides'):
+            provides = _get_std_provides(stdlib_cache, verbose=verbose)
+        stats.count('stdlib_provides', len(provides))
+        return provides
+
+    @cache
+    def add_provides():
+        add_provides = set()
+        with stats.phase('add_prov_path'):
+            for path in filter(lambda p: p, add_prov_path):
+                prov = search_for_provides(path, abs_mode=False, skip_wrong_names=False, skip_namespace_pkgs=False,
+                                           verbose=verbose)
+                add_provides |= set(prov)
+        stats.count('add_provides', len(add_provides))
+        return frozenset(add_provides)
+
+    return (([read_provides] if read_prov_from_file else []),
+            ([std_provides] if exclude_stdlib else []) + ([add_provides] if any(add_prov_path) else []))
+
+
+def _external_provides_key(add_prov_path, read_prov_from_file, exclude_stdlib):
+    '''
+    Fingerprint of provides, which are not self-provides, built without loading them: key of standard library
+    provides (see get_std_provides) and mtimes of file with provides and additional pathes (so provides added
+    to subdirectories of additional pathes are not noticed)
+
+    :rtype: str
+    '''
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
 
-        rel_deps = filter_requirements(file, rel_deps, full_provides | add_provides,
-                                       only_top_module=False, ignore_list=ignore_list,
-                                       stderr=stderr, verbose=verbose)
+    key = {'read_prov_from_file': mtime(read_prov_from_file) if read_prov_from_file else None,
+           'stdlib': _std_provides_key(_form_std_provides()) if exclude_stdlib else None,
+           'add_prov_path': [mtime(path) for path in add_prov_path if path]}
+    return hashlib.blake2b(json.dumps(key, sort_keys=True).encode(), digest_size=16).hexdigest()
 
-        adv_deps = filter_requirements(file, adv_deps, full_provides | add_provides,
-                                       only_top_module=False, ignore_list=ignore_list,
-                                       stderr=stderr, verbose=verbose)
 
-        filter_requirements(file, skip, skip_flag=True, stderr=stderr, verbose=verbose)
+def _uses_abs_provides(package):
+    # Absolute dependencies of files from packages with correct names are filtered only through absolute provides
+    return package is not None and '-' not in package
 
-        if not inspect_env:
-            dependencies[file] = abs_deps, rel_deps, adv_deps, set()
-        else:
-            tmp_dependencies |= abs_deps | rel_deps | adv_deps
 
-    if inspect_env:
-        for pkg_ver, provs in env_provides.items():
-            if (matched := provs.intersection(tmp_dependencies)):
-                tmp_dependencies.difference_update(matched)
-                dependencies.add("==".join(pkg_ver))
-                if verbose:
-                    print(f"The following deps:{",".join(matched)} was satisfied by package:{"==".join(pkg_ver)}",
-                          file=sys.stderr)
-                if not tmp_dependencies:
-                    break
+def _filter_file(file, deps, abs_provides, full_provides, only_top_module, ignore_list, stderr, verbose):
+    abs_deps, rel_deps, adv_deps, skip = deps
+    abs_deps = filter_requirements(file, abs_deps, abs_provides, only_top_module, ignore_list,
+                                   stderr=stderr, verbose=verbose)
+
+    rel_deps = filter_requirements(file, rel_deps, full_provides,
+                                   only_top_module=False, ignore_list=ignore_list,
+                                   stderr=stderr, verbose=verbose)
+
+    adv_deps = filter_requirements(file, adv_deps, full_provides,
+                                   only_top_module=False, ignore_list=ignore_list,
+                                   stderr=stderr, verbose=verbose)
+
+    filter_requirements(file, skip, skip_flag=True, stderr=stderr, verbose=verbose)
+    return Requirements.from_sets(abs_deps, rel_deps, adv_deps, ())
+
+
+def generate_requirements_incremental(snapshot=None, added=[], changed=[], removed=[], add_prov_path=[],
+                                     prefixes=sys.path, ignore_list=sys.builtin_module_names, read_prov_from_file=None,
+                                     skip_subs=True, only_external_deps=False, only_top_module=False,
+                                     exclude_stdlib=False, stdlib_cache=None, engine='ast', shared_libs=False, jobs=1,
+                                     read_ahead=16, read_ahead_memory=64 << 20, stats=None, stderr=sys.stderr,
+                                     verbose=True):
+    '''
+    Generate requirements incrementally: snapshot of the previous run keeps extracted (not filtered) imports,
+    provides and requirements of each file and fingerprint of other provides (standard library, additional
+    pathes and file with provides). Only added and changed files are parsed, their provides are recomputed,
+    and other files are filtered again only if some of their imports is in the changed part of provides.
+    Fingerprint is built from sources of other provides (see _external_provides_key), so they are loaded
+    only if some file is filtered. If snapshot is missing or it was made with other options (verbose too,
+    line numbers are kept only in verbose mode), all files are processed.
+    Options are the same as for generate_requirements.
+
+    :param snapshot: snapshot of the previous run
+    :type snapshot: dict or None
+    :param added: new files (files, which are already in snapshot, are not processed again, if they are not changed)
+    :type added: list[str]
+    :param changed: changed files
+    :type changed: list[str]
+    :param removed: removed files
+    :type removed: list[str]
+    :return: requirements (as generate_requirements returns) and new json-serializable snapshot
+    :rtype: ({str:Requirements}, dict)
+    '''
+    if engine == 'tokenize' and not only_external_deps:
+        raise ValueError('py3req.generate_requirements: tokenize engine can be used only with only_external_deps')
+
+    stats = stats if stats is not None else Stats(top=0)
+    options = {'add_prov_path': [pathlib.Path(p).as_posix() for p in add_prov_path if p],
+               'prefixes': [pathlib.Path(p).as_posix() for p in prefixes],
+               'ignore_list': sorted(set(ignore_list)),
+               'read_prov_from_file': pathlib.Path(read_prov_from_file).as_posix() if read_prov_from_file else None,
+               'skip_subs': skip_subs, 'only_external_deps': only_external_deps, 'only_top_module': only_top_module,
+               'exclude_stdlib': exclude_stdlib, 'engine': engine, 'shared_libs': shared_libs, 'verbose': verbose}
+    old_files = {}
+    old_external = None
+    if snapshot is not None and snapshot.get('options') == options:
+        old_files = snapshot['files']
+        old_external = snapshot['external']
+    elif snapshot is not None:
+        if verbose:
+            print('py3req:INFO: Snapshot was made with other options, all files are processed', file=sys.stderr)
+        added = list(snapshot['files']) + list(added)
+
+    def absolute(files):
+        return [pathlib.Path(file).absolute().as_posix() for file in files]
+
+    removed = set(absolute(removed))
+    files = list(dict.fromkeys(file for file in list(old_files) + absolute(added) if file not in removed))
+    fresh = set(absolute(changed)).union(file for file in files if file not in old_files).intersection(files)
+    stats.count('changed_files', len(fresh))
+
+    new_files = {file: dict(old_files[file]) for file in files if file not in fresh}
+    with stats.phase('self_provides'):
+        # Provides of directories depend on their content, so they are always recomputed
+        reprovide = [file for file in files if file in fresh or os.path.isdir(file)]
+        for path, path_abs, path_full, package in _iter_provides_sets(reprovide,
+                                                                      prefixes=prefixes, verbose=verbose,
+                                                                      skip_wrong_names=False,
+                                                                      skip_namespace_pkgs=False):
+            new_files.setdefault(path, {}).update({'provides': [sorted(set(path_abs)), sorted(set(path_full))],
+                                                   'package': package})
+    new_files = {file: new_files[file] for file in files}
+
+    def provides_sets(files):
+        return (set().union(*(state['provides'][0] for state in files.values())),
+                set().union(*(state['provides'][1] for state in files.values())))
+
+    abs_provides, self_provides = provides_sets(new_files)
+    old_abs, old_full = provides_sets(old_files)
+    changed_abs, changed_full = abs_provides ^ old_abs, self_provides ^ old_full
+    stats.count('self_provides', len(self_provides))
+
+    read_tiers, tiers = _provides_tiers(add_prov_path, read_prov_from_file, exclude_stdlib, stdlib_cache, stats,
+                                        verbose)
+    external = _external_provides_key(add_prov_path, read_prov_from_file, exclude_stdlib)
+    abs_provides = LazyProvides(abs_provides, *tiers)
+    full_provides = LazyProvides(self_provides, *read_tiers, *tiers)
+    ignore_list = frozenset(ignore_list)
+
+    extracted = _extract_imports([file for file in files if file in fresh], jobs or os.cpu_count(),
+                                 prefixes=prefixes, only_external_deps=only_external_deps, skip_subs=skip_subs,
+                                 engine=engine, shared_libs=shared_libs,
+                                 read_ahead_options=(read_ahead, read_ahead_memory),
+                                 stderr=stderr, verbose=verbose, stats=stats, skip_lines=not verbose)
+    for file, elf_deps, deps in stats.iterate('parse', extracted):
+        new_files[file].update({'elf': elf_deps, 'imports': list(deps)})
+
+    requirements = {}
+    for file, state in new_files.items():
+        if state['elf'] is not None:
+            requirements[file] = Requirements.from_sets((), (), (), state['elf'])
+            state['requires'] = [[], [], [], sorted(state['elf'])]
+            continue
+
+        use_abs = _uses_abs_provides(state['package'])
+        abs_deps, rel_deps, adv_deps, skip = state['imports']
+        if (file not in fresh and external == old_external
+                and changed_full.isdisjoint(rel_deps) and changed_full.isdisjoint(adv_deps)
+                and (changed_abs if use_abs else changed_full).isdisjoint(abs_deps)):
+            requirements[file] = Requirements.from_sets(*state['requires'])
+            continue
+
+        stats.count('filtered_files')
+        with stats.phase('filter'):
+            deps = _filter_file(file, state['imports'], abs_provides if use_abs else full_provides, full_provides,
+                                only_top_module, ignore_list, stderr, verbose)
+        requirements[file] = deps
+        state['requires'] = [sorted(dep) for dep in deps]
+
+    return requirements, {'options': options, 'external': external, 'files': new_files}
+
+
+def expand_input(paths, include=(), exclude=default_exclude, verbose=False):
+    '''
+    Expand input list: add content of directories (see py3dephell.py3prov.walk) and make all pathes absolute
+
+    :param paths: list of files and directories
+    :type paths: list[str] or list[pathlib.Path]
+    :param include: globs of files to add from directories (all files if empty)
+    :type include: iterable[str]
+    :param exclude: globs of files and directories to skip in directories
+    :type exclude: iterable[str]
+    :param verbose: turn on verbose mode
+    :type verbose: Bool
+    :return: list of absolute pathes
+    :rtype: list[str]
+    '''
+    paths = list(paths)
+    for path in list(filter(lambda p: pathlib.Path(p).is_dir(), paths)):
+        paths += [entry.path for entry in walk(pathlib.Path(path), include=include, exclude=exclude,
+                                               verbose=verbose)]
+    return list(map(lambda p: pathlib.Path(p).absolute().as_posix(), paths))
+
+
+def _requirements_records(requirements, what_depends=set()):
+    for file, deps in requirements:
+        if what_depends:
+            if (reqs := reduce(lambda acc, r: acc.union(what_depends.intersection(r)), deps, set())):
+                yield {'file': file, 'requires': sorted(reqs)}
         else:
-            if verbose and tmp_dependencies:
-                print("WARNING! Dependencies not matched to any package"
-                      f" in your environment:{",".join(tmp_dependencies)}",
-                      file=sys.stderr)
+            abs_deps, rel_deps, adv_deps, so_deps = deps
+            yield {'file': file, 'requires': sorted(set().union(*deps)), 'absolute': sorted(abs_deps),
+                   'relative': sorted(rel_deps), 'advanced': sorted(adv_deps), 'abi': sorted(so_deps)}
 
-    return dependencies
+
+def _jobs(value):
+    if value == 'auto':
+        return 0
+    if (jobs := int(value)) < 0:
+        raise argparse.ArgumentTypeError(f'number of jobs should not be negative:{value}')
+    return jobs
 
 
-def main():
+def main(argv=None):
     description = 'Search for requiremnts for pyfile'
     args = argparse.ArgumentParser(description=description)
     args.add_argument('--add_prov_path', default="",
@@ -474,27 +1314,90 @@ def main():
                       help='For dependency like a.b skip b')
     args.add_argument('--include_stdlib', action='store_true',
                       help='Exclude dependencies that are provided by installed python3 standart library')
+    args.add_argument('--stdlib_cache', nargs='?', default=None, const=default_std_cache(),
+                      help='Cache provides of standard library in the given file. '
+                      + f'Without value set to {default_std_cache().as_posix()}')
+    args.add_argument('--rebuild_stdlib_cache', action='store_true',
+                      help='Rebuild cache of standard library provides (with no input just warm it up and exit), '
+                      'implies --stdlib_cache')
     args.add_argument("--inspect_env", action="store_true",
                       help="Inspect environment for installed packages and "
                       + "match required symbols to installed packages")
     args.add_argument("--env_path", default="",
                       help='Set path to the environment with installed packages (string separated by ":"). '
                       + "By default set to purelib and platlib")
+    args.add_argument("--env_index", nargs='?', default=None, const=cache_dir().joinpath('env.sqlite'),
+                      help='Keep index of installed distributions in the given database, so only new or changed '
+                      + f'distributions are rescanned. Without value set to {cache_dir().joinpath("env.sqlite")}')
     args.add_argument("--whatdepends", action="append", default=[],
                       help="List files which requires specified dependencies."
                            " Example: --whatdepends foo --whatdepends sys")
+    args.add_argument('--imports_cache', nargs='?', default=None, const=cache_dir().joinpath('imports.sqlite'),
+                      help='Cache imports extracted from files in the given database. '
+                      + f'Without value set to {cache_dir().joinpath("imports.sqlite").as_posix()}')
+    args.add_argument('--imports_cache_size', type=int, default=256,
+                      help='Maximum size of imports cache in MiB, least recently used entries are evicted')
+    args.add_argument('--engine', choices=['ast', 'tokenize'], default='ast',
+                      help='Engine for detecting imports, tokenize is faster, but it detects only top-level '
+                      'import statements, so it requires --exclude_hidden_deps')
+    args.add_argument('--shared_libs', action='store_true',
+                      help='Add shared libraries required by ELF files (DT_NEEDED) to the dependencies')
+    args.add_argument('--read_ahead', type=int, default=16,
+                      help='Number of files read in background threads ahead of parser (0 turns it off)')
+    args.add_argument('--read_ahead_memory', type=int, default=64,
+                      help='Maximum size of files read ahead in MiB')
+    args.add_argument('--jobs', type=_jobs, default=1,
+                      help='Number of processes used to parse files ("auto" or 0 means number of CPUs)')
+    args.add_argument('--format', choices=['text', 'ndjson'], default='text',
+                      help='Output format, ndjson writes one json record per file as soon as it is processed')
+    args.add_argument('--stats', action='store_true',
+                      help='Print wall and CPU time per phase, counters and the slowest files to stderr')
+    args.add_argument('--stats_json', default=None,
+                      help='Write statistics (see --stats) to the given json file')
+    args.add_argument('--stats_slowest', type=int, default=10,
+                      help='Number of the slowest files in statistics')
+    args.add_argument('--profile_dir', default=None,
+                      help='Dump cProfile statistics of each phase to <phase>.prof in the given directory')
+    args.add_argument('--snapshot', default=None,
+                      help='Incremental mode: reuse results of the previous run kept in the given snapshot, '
+                      'only input files, which are not in snapshot, and changed files are parsed. '
+                      'Snapshot is updated (or created) after the run')
+    args.add_argument('--changed', action='append', default=[],
+                      help='Changed file for incremental mode (can be repeated)')
+    args.add_argument('--removed', action='append', default=[],
+                      help='Removed file for incremental mode (can be repeated)')
+    args.add_argument('--include', action='append', default=[],
+                      help='Glob of files to take from input directories (can be repeated), by default all files')
+    args.add_argument('--exclude', action='append', default=[],
+                      help='Glob of files and directories to skip in input directories (can be repeated), '
+                      f'{", ".join(default_exclude)} are also skipped unless --no_default_exclude is set')
+    args.add_argument('--no_default_exclude', action='store_true',
+                      help=f'Do not skip {", ".join(default_exclude)} in input directories')
     args.add_argument('--verbose', action='store_true',
                       help='Verbose stderr')
     args.add_argument('input', nargs='*',
                       help='List of files from which deps will be created', default=[])
-    args = args.parse_args()
-
-    if not args.input:
+    parser = args
+    args = args.parse_args(argv)
+
+    if args.engine == 'tokenize' and not args.exclude_hidden_deps:
+        parser.error('--engine tokenize requires --exclude_hidden_deps')
+    if args.snapshot and args.inspect_env:
+        parser.error('--snapshot can not be used with --inspect_env')
+    if (args.changed or args.removed) and not args.snapshot:
+        parser.error('--changed and --removed require --snapshot')
+
+    stdlib_cache = args.stdlib_cache or (default_std_cache() if args.rebuild_stdlib_cache else None)
+    if args.rebuild_stdlib_cache:
+        get_std_provides(stdlib_cache, rebuild=True, verbose=args.verbose)
+        if not args.input:
+            return
+
+    if not args.input and not args.snapshot:
         args.input = shlex.split(sys.stdin.read())
 
-    dirs = filter(lambda p: pathlib.Path(p).is_dir(), args.input)
-    args.input += sum(map(lambda d: list(pathlib.Path(d).rglob("*")), dirs), start=[])
-    args.input = list(map(lambda p: pathlib.Path(p).absolute().as_posix(), args.input))
+    exclude = tuple(args.exclude) if args.no_default_exclude else default_exclude + tuple(args.exclude)
+    args.input = expand_input(args.input, include=args.include, exclude=exclude, verbose=args.verbose)
 
     prefixes = args.prefixes.split(':') if args.prefixes else sys.path
 
@@ -505,19 +1408,43 @@ def main():
 
     env_path = [p for p in args.env_path.split(":") if p]
 
-    dependencies = generate_requirements(files=args.input, add_prov_path=args.add_prov_path.split(":"),
-                                         ignore_list=ignore_list,
-                                         read_prov_from_file=args.read_prov_from_file,
-                                         skip_subs=True, prefixes=prefixes,
-                                         only_external_deps=args.exclude_hidden_deps,
-                                         only_top_module=args.only_top_module,
-                                         exclude_stdlib=not args.include_stdlib,
-                                         inspect_env=args.inspect_env, env_path=env_path,
-                                         verbose=args.verbose)
+    options = dict(files=args.input, add_prov_path=args.add_prov_path.split(":"),
+                   ignore_list=ignore_list,
+                   read_prov_from_file=args.read_prov_from_file,
+                   skip_subs=True, prefixes=prefixes,
+                   only_external_deps=args.exclude_hidden_deps,
+                   only_top_module=args.only_top_module,
+                   exclude_stdlib=not args.include_stdlib, stdlib_cache=stdlib_cache,
+                   jobs=args.jobs, imports_cache=args.imports_cache,
+                   imports_cache_size=args.imports_cache_size << 20, engine=args.engine,
+                   shared_libs=args.shared_libs, read_ahead=args.read_ahead,
+                   read_ahead_memory=args.read_ahead_memory << 20, verbose=args.verbose)
+    if args.stats or args.stats_json or args.profile_dir:
+        options['stats'] = Stats(top=args.stats_slowest, profile_dir=args.profile_dir)
 
     what_depends = set(args.whatdepends)
-    if not args.inspect_env:
-        for file, deps in dependencies.items():
+    if args.snapshot:
+        snapshot_key = {'py3req_snapshot': 1}
+        options = {k: v for k, v in options.items() if k not in ('files', 'imports_cache', 'imports_cache_size')}
+        requirements, snapshot = generate_requirements_incremental(
+            snapshot=load_json_cache(args.snapshot, snapshot_key, verbose=args.verbose), added=args.input,
+            changed=args.changed, removed=args.removed, **options)
+        save_json_cache(args.snapshot, snapshot_key, snapshot, verbose=args.verbose)
+        requirements = requirements.items()
+    else:
+        requirements = iter_requirements(**options)
+
+    if args.inspect_env:
+        dependencies = generate_requirements(**options, inspect_env=True, env_path=env_path,
+                                             env_index=args.env_index)
+        if args.format == 'ndjson':
+            write_ndjson({'requirement': dep} for dep in sorted(dependencies))
+        else:
+            print("\n".join(sorted(dependencies)))
+    elif args.format == 'ndjson':
+        write_ndjson(_requirements_records(requirements, what_depends))
+    else:
+        for file, deps in requirements:
             if any(deps) and what_depends:
                 reqs = reduce(lambda acc, r:
                               acc.union(what_depends.intersection(r)),
@@ -528,8 +1455,13 @@ def main():
                 print(f'{file}:{" ".join([" ".join(req) for req in deps if req])}')
             elif any(deps):
                 print('\n'.join(['\n'.join(req) for req in deps if req]))
-    else:
-        print("\n".join(dependencies))
+
+    if (stats := options.get('stats')) is not None:
+        if args.stats:
+            stats.report()
+        if args.stats_json:
+            stats.write_json(args.stats_json)
+        stats.dump_profiles()
 
 
 if __name__ == '__main__':
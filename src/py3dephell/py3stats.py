@@ -0,0 +1,183 @@
+#! /usr/bin/env python3
+
+import sys
+import json
+import time
+import heapq
+import cProfile
+from pathlib import Path
+from contextlib import contextmanager
+
+
+class Stats:
+    '''
+    Statistics of py3dephell run: wall and CPU time per phase, counters (files read, bytes read, ASTs built,
+    syntax errors, provides, cache hits and etc.) and the slowest files.
+
+    :param top: number of the slowest files to keep
+    :type top: int
+    :param profile_dir: directory for cProfile dumps (one per phase), None means no profiling
+    :type profile_dir: str or pathlib.Path or None
+    '''
+    def __init__(self, top=10, profile_dir=None):
+        self.top = top
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.phases = {}
+        self.counters = {}
+        self._slowest = []
+        self._profiles = {}
+        self._active = []
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        Measure phase, time of phases with the same name is summed up.
+        Phases can be nested: the outer phase is paused while the inner one runs,
+        so time is counted only once and only one profiler is active
+
+        :param name: name of phase
+        :type name: str
+        '''
+        if self._active:
+            self._pause(*self._active[-1], calls=0)
+        profile = self._profiles.setdefault(name, cProfile.Profile()) if self.profile_dir else None
+        self._active.append(self._start(name, profile))
+        try:
+            yield self
+        finally:
+            self._pause(*self._active.pop())
+            if self._active:
+                self._active[-1] = self._start(*self._active[-1][:2])
+
+    @staticmethod
+    def _start(name, profile):
+        if profile:
+            profile.enable()
+        return name, profile, time.perf_counter(), time.process_time()
+
+    def _pause(self, name, profile, start_wall, start_cpu, calls=1):
+        if profile:
+            profile.disable()
+        self.add_phase(name, time.perf_counter() - start_wall, time.process_time() - start_cpu, calls)
+
+    def iterate(self, name, iterable):
+        '''
+        Iterate over iterable and measure time spent in it as phase
+
+        :param name: name of phase
+        :type name: str
+        :param iterable: iterable to measure (generator, which does actual work)
+        :type iterable: iterable
+        '''
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_phase(self, name, wall, cpu, calls=1):
+        phase = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+        phase['wall'] += wall
+        phase['cpu'] += cpu
+        phase['calls'] += calls
+
+    def count(self, name, value=1):
+        '''
+        Increase counter
+
+        :param name: name of counter
+        :type name: str
+        :param value: value to add
+        :type value: int
+        '''
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_file(self, path, wall):
+        '''
+        Register time spent on file
+
+        :param path: path to the file
+        :type path: str
+        :param wall: wall time in seconds
+        :type wall: float
+        '''
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, (wall, path))
+        elif self._slowest and wall > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (wall, path))
+
+    @property
+    def slowest(self):
+        '''
+        The slowest files in descending order
+
+        :rtype: list[(str, float)]
+        '''
+        return [(path, wall) for wall, path in sorted(self._slowest, reverse=True)]
+
+    def merge(self, other):
+        '''
+        Merge counters and files from other stats (it can be created in other process)
+
+        :param other: stats or its dict representation
+        :type other: Stats or dict
+        '''
+        other = other.as_dict() if isinstance(other, Stats) else other
+        for name, phase in other['phases'].items():
+            self.add_phase(name, phase['wall'], phase['cpu'], phase['calls'])
+        for name, value in other['counters'].items():
+            self.count(name, value)
+        for path, wall in other['slowest']:
+            self.add_file(path, wall)
+
+    def as_dict(self):
+        '''
+        :return: json-serializable representation of stats
+        :rtype: dict
+        '''
+        return {'phases': self.phases, 'counters': self.counters,
+                'slowest': [list(file) for file in self.slowest]}
+
+    def dump_profiles(self):
+        '''
+        Write cProfile dumps of phases to profile_dir as <phase>.prof
+
+        :return: list of written files
+        :rtype: list[pathlib.Path]
+        '''
+        if not self.profile_dir:
+            return []
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        dumps = []
+        for name, profile in self._profiles.items():
+            dumps.append(self.profile_dir.joinpath(f'{name}.prof'))
+            profile.dump_stats(dumps[-1])
+        return dumps
+
+    def report(self, stream=sys.stderr):
+        '''
+        Print human readable report
+
+        :param stream: output stream
+        :type stream: io
+        '''
+        print('py3stats: phase wall(s) cpu(s) calls', file=stream)
+        for name, phase in self.phases.items():
+            print(f'py3stats: {name} {phase["wall"]:.3f} {phase["cpu"]:.3f} {phase["calls"]}', file=stream)
+        for name, value in sorted(self.counters.items()):
+            print(f'py3stats: {name}={value}', file=stream)
+        for path, wall in self.slowest:
+            print(f'py3stats: slow file {path} {wall:.3f}s', file=stream)
+
+    def write_json(self, path):
+        '''
+        Write stats as json
+
+        :param path: path to the output file
+        :type path: str or pathlib.Path
+        '''
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
@@ -1,5 +1,6 @@
 import csv
 import hashlib
+import struct
 import pathlib
 from shutil import rmtree
 
@@ -40,6 +41,46 @@ def generate_somodule(path, name, byte_code=b'\x7fELF\x02'):
     return [p]
 
 
+def generate_elf(path, name, needed=(), pyinit=(), elf_class=2, byteorder='<'):
+    """
+    Generate minimal ELF with dynamic section and dynamic symbols
+    """
+    formats = {1: ('16sHHIIIIIHHHHHH', 'IIIIIIIIII', 'iI', 'IIIBBH'),
+               2: ('16sHHIQQQIHHHHHH', 'IIQQQQIIQQ', 'qQ', 'IBBHQQ')}
+    ehdr, shdr, dyn, sym = (struct.Struct(byteorder + fmt) for fmt in formats[elf_class])
+
+    strtab = b'\0'
+    offsets = {}
+    for string in list(needed) + [f'PyInit_{mod}' for mod in pyinit] + ['PyInit_undefined', 'data']:
+        offsets[string] = len(strtab)
+        strtab += string.encode() + b'\0'
+
+    def symbol(name, info, shndx):
+        if elf_class == 1:
+            return sym.pack(offsets[name], 0, 0, info, 0, shndx)
+        return sym.pack(offsets[name], info, 0, shndx, 0, 0)
+
+    symtab = sym.pack(*[0] * 6)
+    symtab += b''.join(symbol(f'PyInit_{mod}', 0x12, 1) for mod in pyinit)
+    symtab += symbol('PyInit_undefined', 0x12, 0) + symbol('data', 0x11, 1)
+    dynamic = b''.join(dyn.pack(1, offsets[lib]) for lib in needed) + dyn.pack(0, 0)
+
+    strtab_off = ehdr.size
+    symtab_off = strtab_off + len(strtab)
+    dynamic_off = symtab_off + len(symtab)
+    shoff = dynamic_off + len(dynamic)
+    sections = [shdr.pack(*[0] * 10),
+                shdr.pack(0, 3, 0, 0, strtab_off, len(strtab), 0, 0, 1, 0),
+                shdr.pack(0, 11, 0, 0, symtab_off, len(symtab), 1, 1, 8, sym.size),
+                shdr.pack(0, 6, 0, 0, dynamic_off, len(dynamic), 1, 0, 8, dyn.size)]
+    ident = b'\x7fELF' + bytes([elf_class, 1 if byteorder == '<' else 2, 1])
+    header = ehdr.pack(ident, 3, 62, 1, 0, 0, shoff, 0, ehdr.size, 0, 0, shdr.size, len(sections), 0)
+
+    p = pathlib.Path(path).joinpath(name)
+    p.write_bytes(header + strtab + symtab + dynamic + b''.join(sections))
+    return [p]
+
+
 def generate_pymodule(path, name, text=None):
     if text is None:
         text = f'try:\n\tfrom . import {name}_lib\n'
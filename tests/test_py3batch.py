@@ -0,0 +1,65 @@
+import sys
+import json
+import pathlib
+import unittest
+import tempfile
+from shutil import rmtree
+from package import generate_pymodule
+from py3dephell import py3batch
+
+
+class TestPy3Batch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_batch(self):
+        for name, text in [('pkg_1', 'import os\nimport numpy\n'), ('pkg_2', 'import pytest\nfrom . import mod\n')]:
+            self.tests_packages.joinpath('src', name).mkdir(parents=True)
+            generate_pymodule(self.tests_packages.joinpath('src', name), 'mod', text=text)[1].unlink()
+
+        manifest = {'output_dir': 'results',
+                    'defaults': {'stdlib_cache': 'stdlib.json'},
+                    'packages': [{'name': 'pkg_1', 'files': ['src/pkg_1'], 'prefixes': ['src']},
+                                 {'name': 'pkg_2', 'files': ['src/pkg_2'], 'prefixes': ['src'],
+                                  'ignore_list': ['pytest']}]}
+        self.tests_packages.joinpath('manifest.json').write_text(json.dumps(manifest))
+        toml = ['output_dir = "results_toml"', '[defaults]', 'stdlib_cache = "stdlib.json"']
+        for package in manifest['packages']:
+            toml += ['[[packages]]'] + [f'{key} = {json.dumps(value)}' for key, value in package.items()]
+        self.tests_packages.joinpath('manifest.toml').write_text('\n'.join(toml))
+
+        for manifest_name, output_dir in [('manifest.json', 'results'), ('manifest.toml', 'results_toml')]:
+            if manifest_name.endswith('.toml') and py3batch.tomllib is None:
+                continue
+            with self.subTest(msg=f'Testing py3batch.main for {manifest_name}'):
+                self.assertEqual(py3batch.main([self.tests_packages.joinpath(manifest_name).as_posix()]), 0)
+                results = self.tests_packages.joinpath(output_dir)
+                self.assertEqual(results.joinpath('pkg_1.txt').read_text(), 'numpy\n')
+                self.assertEqual(results.joinpath('pkg_2.txt').read_text(), '')
+
+        self.assertEqual(py3batch.main(['--format', 'ndjson',
+                                        self.tests_packages.joinpath('manifest.json').as_posix()]), 0)
+        records = [json.loads(line) for line in
+                   self.tests_packages.joinpath('results', 'pkg_1.ndjson').read_text().splitlines()]
+        self.assertEqual([record['requires'] for record in records if record['requires']], [['numpy']])
+
+        test_cases = {'../escaped': 'escaped.txt', self.tests_packages.joinpath('absolute').as_posix(): 'absolute.txt',
+                      'sub/dir': 'results/sub/dir.txt', '..': 'results/...txt'}
+        for name, path in test_cases.items():
+            with self.subTest(msg=f'Testing py3batch.main for package name {name}'):
+                broken = {**manifest, 'packages': [*manifest['packages'], {'name': name, 'files': ['src/pkg_1']}]}
+                self.tests_packages.joinpath('manifest.json').write_text(json.dumps(broken))
+                self.assertEqual(py3batch.main([self.tests_packages.joinpath('manifest.json').as_posix()]), 1)
+                self.assertFalse(self.tests_packages.joinpath(path).exists())
+                self.assertEqual(self.tests_packages.joinpath('results', 'pkg_1.txt').read_text(), 'numpy\n')
+
+        manifest['packages'].append({'name': 'broken', 'files': ['src'], 'unknown_option': True})
+        self.tests_packages.joinpath('manifest.json').write_text(json.dumps(manifest))
+        self.assertEqual(py3batch.main([self.tests_packages.joinpath('manifest.json').as_posix()]), 1)
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import sys
+import pathlib
+import unittest
+import tempfile
+from shutil import rmtree
+from py3dephell import py3cache
+
+
+class TestPy3Cache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_json_cache(self):
+        cache = self.tests_packages.joinpath('subdir', 'cache.json')
+        key = {'python': '3.12', 'mtimes': {'/usr/lib/python3': 1}}
+        self.assertIsNone(py3cache.load_json_cache(cache, key))
+        self.assertTrue(py3cache.save_json_cache(cache, key, ['os', 'sys']))
+
+        test_cases = {}
+        test_cases[0] = [{'path': cache, 'key': key}, ['os', 'sys']]
+        test_cases[1] = [{'path': cache, 'key': {**key, 'python': '3.13'}}, None]
+        test_cases[2] = [{'path': self.tests_packages.joinpath('missing.json'), 'key': key}, None]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3cache.load_json_cache subTest:{subtest_num}'):
+                self.assertEqual(py3cache.load_json_cache(**inp_out[0]), inp_out[1],
+                                 msg=f'SubTest:{subtest_num} FAILED')
+
+        cache.write_text('broken')
+        self.assertIsNone(py3cache.load_json_cache(cache, key))
+        rmtree(self.tmp)
+
+    def test_imports_cache(self):
+        db = self.tests_packages.joinpath('imports.sqlite')
+        keys = [py3cache.ImportsCache.key(f'import mod_{num}'.encode(), skip_subs=True) for num in range(4)]
+        self.assertNotEqual(keys[0], py3cache.ImportsCache.key(b'import mod_0', skip_subs=False))
+
+        with py3cache.ImportsCache(db, max_size=1 << 20) as cache:
+            self.assertIsNone(cache.get(keys[0]))
+            for num, key in enumerate(keys):
+                cache.put(key, [{f'mod_{num}': [1]}, {}, {}, {}])
+            self.assertEqual(cache.get(keys[1]), [{'mod_1': [1]}, {}, {}, {}])
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # Entries are written on commit, so connections, which share the cache, do not block each other
+        with py3cache.ImportsCache(db) as first, py3cache.ImportsCache(db) as second:
+            first.put(b'first', [{}, {}, {}, {}])
+            second.put(b'second', [{}, {}, {}, {}])
+            self.assertEqual(first.get(b'first'), [{}, {}, {}, {}])
+            second.commit()
+        with py3cache.ImportsCache(db) as cache:
+            self.assertEqual((cache.get(b'first'), cache.get(b'second')), ([{}, {}, {}, {}], [{}, {}, {}, {}]))
+
+        # Workers only commit their changes, entries are evicted by the owner of cache
+        cache = py3cache.ImportsCache(db, max_size=40)
+        cache.close(evict=False)
+        with py3cache.ImportsCache(db) as cache:
+            self.assertEqual(cache.get(keys[0]), [{'mod_0': [1]}, {}, {}, {}])
+
+        with py3cache.ImportsCache(db, max_size=40) as cache:
+            cache.get(keys[3])
+        with py3cache.ImportsCache(db) as cache:
+            self.assertIsNone(cache.get(keys[0]))
+            self.assertEqual(cache.get(keys[3]), [{'mod_3': [1]}, {}, {}, {}])
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import pathlib
+import unittest
+import tempfile
+import threading
+from shutil import rmtree
+from contextlib import redirect_stdout
+from unittest import mock
+from package import generate_pymodule
+from py3dephell import py3daemon, py3prov
+
+
+class TestPy3Daemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_request(self):
+        sock = self.tests_packages.joinpath('daemon.sock')
+        self.assertIsNone(py3daemon.request('py3prov', [], path=sock))
+
+        module = generate_pymodule(self.tests_packages, 'module')[0].as_posix()
+        with io.StringIO() as f, redirect_stdout(f):
+            py3prov.main(['--prefixes', self.tmp, module])
+            expected = f.getvalue()
+
+        with mock.patch.dict(os.environ, {'PY3DEPHELL_CACHE_DIR': self.tmp}), py3daemon.Server(sock) as server:
+            self.assertEqual(sock.stat().st_mode & 0o777, 0o700)
+            # Cache of standard library provides is opt-in
+            self.assertListEqual(list(self.tests_packages.glob('stdlib-provides-*')), [])
+            thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1})
+            thread.start()
+            try:
+                test_cases = {}
+                test_cases[0] = [['--prefixes', self.tmp, module], 0, expected]
+                test_cases[1] = [['--unknown_option'], 2, '']
+
+                for subtest_num, inp_out in test_cases.items():
+                    with self.subTest(msg=f'Testing py3daemon.request subTest:{subtest_num}'):
+                        output = self.tests_packages.joinpath(f'output_{subtest_num}')
+                        with open(output, 'w') as f, redirect_stdout(f), open(self.tests_packages.joinpath('err'),
+                                                                              'w') as err:
+                            stderr, sys.stderr = sys.stderr, err
+                            try:
+                                code = py3daemon.request('py3prov', inp_out[0], path=sock)
+                            finally:
+                                sys.stderr = stderr
+                        self.assertEqual(code, inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+                        self.assertEqual(output.read_text(), inp_out[2], msg=f'SubTest:{subtest_num} FAILED')
+            finally:
+                server.shutdown()
+                thread.join()
+        self.assertFalse(sock.exists())
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
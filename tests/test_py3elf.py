@@ -0,0 +1,45 @@
+import sys
+import pathlib
+import unittest
+import tempfile
+from shutil import rmtree
+from package import generate_elf, generate_somodule, generate_pymodule
+from py3dephell import py3elf
+
+
+class TestPy3Elf(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_read_elf(self):
+        test_cases = {}
+        test_cases[0] = [{'needed': ['libc.so.6', 'libm.so.6'], 'pyinit': ['mod']},
+                         py3elf.ElfInfo(py3elf.ELFCLASS64, ['libc.so.6', 'libm.so.6'], ['mod'])]
+        test_cases[1] = [{**test_cases[0][0], 'elf_class': 1},
+                         py3elf.ElfInfo(py3elf.ELFCLASS32, ['libc.so.6', 'libm.so.6'], ['mod'])]
+        test_cases[2] = [{**test_cases[0][0], 'byteorder': '>'}, test_cases[0][1]]
+        test_cases[3] = [{'needed': ['libc.so.6']}, py3elf.ElfInfo(py3elf.ELFCLASS64, ['libc.so.6'])]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3elf.read_elf subTest:{subtest_num}'):
+                elf = generate_elf(self.tests_packages, f'elf_{subtest_num}', **inp_out[0])[0]
+                self.assertTrue(py3elf.is_elf(elf))
+                self.assertEqual(py3elf.read_elf(elf), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+                with open(elf, 'rb') as f:
+                    f.read(1)
+                    self.assertEqual(py3elf.read_elf(f), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+
+        py_module = generate_pymodule(self.tests_packages, 'module')[0]
+        self.assertFalse(py3elf.is_elf(py_module))
+        self.assertIsNone(py3elf.read_elf(py_module))
+        for num, byte_code in enumerate([b'\x7fELF\x02', b'\x7fELF\x03\x01' + b'\0' * 64]):
+            with self.subTest(msg=f'Testing py3elf.read_elf for broken ELF {num}'):
+                with self.assertRaises(ValueError):
+                    py3elf.read_elf(generate_somodule(self.tests_packages, f'broken_{num}', byte_code)[0])
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
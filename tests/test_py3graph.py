@@ -0,0 +1,81 @@
+import sys
+import json
+import pathlib
+import unittest
+import tempfile
+from io import StringIO
+from shutil import rmtree
+from contextlib import redirect_stdout
+from py3dephell import py3graph
+
+
+class TestPy3Graph(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_module_graph(self):
+        graph = py3graph.ModuleGraph(['a', 'b', 'c', 'd', 'e'], [(0, 1), (1, 2), (2, 0), (2, 3), (0, 1), (4, 4)])
+        self.assertEqual(graph.edge_count, 4)
+        self.assertEqual(list(graph.successors(2)), [0, 3])
+
+        test_cases = {}
+        test_cases[0] = [{'sources': [3]}, [3]]
+        test_cases[1] = [{'sources': [1]}, [0, 1, 2, 3]]
+        test_cases[2] = [{'sources': [3], 'reverse': True}, [0, 1, 2, 3]]
+        test_cases[3] = [{'sources': [4, 3]}, [3, 4]]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing ModuleGraph.reachable subTest:{subtest_num}'):
+                self.assertEqual(graph.reachable(**inp_out[0]), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+
+        self.assertEqual(graph.strongly_connected_components(), [[3], [0, 1, 2], [4]])
+        components, component_of, dag = graph.condensation()
+        self.assertEqual(components, [[4], [0, 1, 2], [3]])
+        self.assertEqual(list(dag.edges()), [(1, 2)])
+        self.assertEqual(graph.weakly_connected_components(), [[0, 1, 2, 3], [4]])
+
+        # Long chain does not hit recursion limit
+        chain = py3graph.ModuleGraph([f'm{i}' for i in range(50000)], [(i, i + 1) for i in range(49999)] + [(49999, 0)])
+        self.assertEqual(len(chain.strongly_connected_components()), 1)
+
+    def test_build_graph(self):
+        sources = {'pkg/__init__.py': 'from . import core\n',
+                   'pkg/core.py': 'import os\n',
+                   'pkg/a.py': 'from . import b\n',
+                   'pkg/b.py': 'from .a import func\n',
+                   'pkg/cli.py': 'import pkg.core\nimport pkg.a\n',
+                   'pkg/tests/__init__.py': '',
+                   'pkg/tests/test_x.py': 'from pkg import core\n',
+                   'pkg/tests/test_y.py': 'from ..a import func\n'}
+        for path, text in sources.items():
+            self.tests_packages.joinpath(path).parent.mkdir(parents=True, exist_ok=True)
+            self.tests_packages.joinpath(path).write_text(text)
+
+        files = [self.tests_packages.joinpath(path).as_posix() for path in sources]
+        graph = py3graph.build_graph(files, prefixes=[self.tmp], verbose=False)
+        self.assertEqual(sorted(graph.names), ['pkg', 'pkg.a', 'pkg.b', 'pkg.cli', 'pkg.core', 'pkg.tests',
+                                               'pkg.tests.test_x', 'pkg.tests.test_y'])
+        # Submodule imports its package implicitly, so pkg and pkg.core import each other
+        self.assertEqual(sorted(sorted(graph.names[node] for node in component)
+                                for component in graph.strongly_connected_components() if len(component) > 1),
+                         [['pkg', 'pkg.core'], ['pkg.a', 'pkg.b']])
+        self.assertEqual(sorted(graph.names[node] for node in graph.reachable([graph.node('pkg.b')])),
+                         ['pkg', 'pkg.a', 'pkg.b', 'pkg.core'])
+
+        splits = sorted(graph.propose_splits(), key=lambda split: split['name'])
+        self.assertEqual([(split['name'], split['modules'], split['requires'], split['shared']) for split in splits],
+                         [('pkg', ['pkg', 'pkg.a', 'pkg.b', 'pkg.core'], [], True),
+                          ('pkg.cli', ['pkg.cli'], ['pkg'], False),
+                          ('pkg.tests', ['pkg.tests', 'pkg.tests.test_x', 'pkg.tests.test_y'], ['pkg'], False)])
+
+        with redirect_stdout(StringIO()) as stdout:
+            self.assertEqual(py3graph.main(['--format', 'ndjson', '--prefixes', self.tmp, self.tmp]), 0)
+        self.assertEqual(sorted(json.loads(line)['name'] for line in stdout.getvalue().splitlines()),
+                         ['pkg', 'pkg.cli', 'pkg.tests'])
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
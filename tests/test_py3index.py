@@ -0,0 +1,59 @@
+import sys
+import json
+import pathlib
+import unittest
+import tempfile
+from shutil import rmtree
+from py3dephell import py3index
+
+
+class TestPy3Index(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_reverse_index(self):
+        dump = self.tests_packages.joinpath('dump')
+        dump.mkdir()
+        records = {'foo': [{'file': '/usr/lib/foo/__init__.py', 'provides': ['foo'], 'package': None},
+                           {'file': '/usr/lib/foo/bar/baz.py', 'provides': ['foo.bar.baz'], 'package': 'foo'}],
+                   'foo-tools': [{'file': '/usr/lib/foo_tools/cli.py', 'requires': ['foo.bar.baz', 'os']},
+                                 {'file': '/usr/lib/foo_tools/empty.py', 'requires': []}],
+                   'food': [{'file': '/usr/lib/food.py', 'provides': ['food']}]}
+        for package, package_records in records.items():
+            dump.joinpath(f'{package}.ndjson').write_text(''.join(json.dumps(r) + '\n' for r in package_records))
+        index_path = self.tests_packages.joinpath('index.sqlite')
+        self.assertEqual(py3index.main(['--index', index_path.as_posix(), dump.as_posix()]), 0)
+
+        index = py3index.ReverseIndex(index_path)
+        self.assertEqual(index.packages(), ['foo', 'foo-tools', 'food'])
+
+        test_cases = {}
+        test_cases[0] = [{'module': 'foo'}, [('foo', 'foo', '/usr/lib/foo/__init__.py')]]
+        test_cases[1] = [{'module': 'foo', 'prefix': True}, [('foo', 'foo', '/usr/lib/foo/__init__.py'),
+                                                             ('foo.bar.baz', 'foo', '/usr/lib/foo/bar/baz.py')]]
+        test_cases[2] = [{'module': 'foo.bar', 'prefix': True}, [('foo.bar.baz', 'foo', '/usr/lib/foo/bar/baz.py')]]
+        test_cases[3] = [{'module': 'foo.bar'}, []]
+        test_cases[4] = [{'module': 'foo.bar.baz.qux', 'prefix': True}, []]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing ReverseIndex.what_provides subTest:{subtest_num}'):
+                self.assertEqual(index.what_provides(**inp_out[0]), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+
+        self.assertEqual(index.what_depends('foo', prefix=True),
+                         [('foo.bar.baz', 'foo-tools', '/usr/lib/foo_tools/cli.py')])
+        self.assertEqual(index.what_depends('foo.bar.baz'), index.what_depends('foo', prefix=True))
+
+        index.add('foo', 'provides', [('/usr/lib/foo/__init__.py', ['foo'])])
+        self.assertEqual(index.what_provides('foo.bar.baz'), [])
+        self.assertTrue(index.remove('foo-tools'))
+        self.assertFalse(index.remove('foo-tools'))
+        self.assertEqual(index.what_depends('os'), [])
+        self.assertEqual(index.packages(), ['foo', 'food'])
+        index.close()
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import io
+import os
 import sys
 import pathlib
 import unittest
@@ -91,6 +93,50 @@ class TestPy3Prov(unittest.TestCase):
                 self.assertEqual(py3prov.module_detector(**inp_out[0], verbose_mode=False), inp_out[1],
                                  msg=f'SubTest:{subtest_num} FAILED')
 
+    def test_prefix_table(self):
+        rmtree(self.tmp)
+        table = py3prov.compile_prefixes(['/sys_path/', '/sys_path/lib', '/', '', 'src'])
+        self.assertIs(table, py3prov.compile_prefixes(['/sys_path/', '/sys_path/lib', '/', '', 'src']))
+        self.assertIs(table, py3prov.compile_prefixes(table))
+
+        test_cases = {}
+        test_cases[0] = ['/sys_path/pkg/mod1.py', ('/sys_path', 'pkg', ('pkg', 'mod1'))]
+        test_cases[1] = ['/sys_path/lib/pkg/__init__.py', ('/sys_path/lib', 'pkg', ('pkg', '__init__'))]
+        test_cases[2] = ['/sys_path/lib', ('/sys_path', 'lib', ('lib',))]
+        test_cases[3] = ['/sys_path', (None, None, ('sys_path',))]
+        test_cases[4] = ['src/pkg/mod%s' % py3prov.so_suffix, ('src', 'pkg', ('pkg', 'mod'))]
+        test_cases[5] = ['/other/mod.py', (None, None, ('other', 'mod'))]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(f"Testing PrefixTable.resolve subTest:{subtest_num}"):
+                self.assertEqual(table.resolve(inp_out[0]), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+        self.assertEqual(list(table.resolve_all([inp_out[0] for inp_out in test_cases.values()])),
+                         [(inp_out[0], inp_out[1]) for inp_out in test_cases.values()])
+
+    def test_walk(self):
+        root = self.tests_packages
+        for path in ['pkg/mod.py', 'pkg/__pycache__/mod.cpython-312.pyc', 'pkg/sub/data.txt', 'pkg/sub/mod.py',
+                     '.git/HEAD', 'tests/test_mod.py', 'top.py']:
+            root.joinpath(path).parent.mkdir(parents=True, exist_ok=True)
+            root.joinpath(path).write_text('')
+        root.joinpath('pkg', 'sub', 'loop').symlink_to(root.joinpath('pkg'))
+
+        test_cases = {}
+        test_cases[0] = [{}, ['pkg', 'tests', 'top.py', 'pkg/mod.py', 'pkg/sub', 'pkg/sub/data.txt',
+                              'pkg/sub/loop', 'pkg/sub/mod.py', 'tests/test_mod.py']]
+        test_cases[1] = [{'include': ['*.py'], 'exclude': py3prov.default_exclude + ('tests',)},
+                         ['pkg', 'top.py', 'pkg/mod.py', 'pkg/sub', 'pkg/sub/mod.py']]
+        test_cases[2] = [{'exclude': ['pkg/sub', '.git', 'tests', '__pycache__']}, ['pkg', 'top.py', 'pkg/mod.py']]
+        test_cases[3] = [{'include': ['*.py'], 'exclude': ['.*', '__pycache__', 'tests'], 'follow_symlinks': True},
+                         ['pkg', 'top.py', 'pkg/mod.py', 'pkg/sub', 'pkg/sub/mod.py']]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3prov.walk subTest:{subtest_num}'):
+                self.assertListEqual(sorted(pathlib.Path(entry.path).relative_to(root).as_posix()
+                                            for entry in py3prov.walk(root, **inp_out[0])),
+                                     sorted(inp_out[1]), msg=f'SubTest:{subtest_num} FAILED')
+        rmtree(self.tmp)
+
     def test_processing_pth(self):
         prepare_package(self.tests_packages, 'pkg_for_pth', w_pth=True, level=1)
         self.assertEqual(py3prov.processing_pth(self.tests_packages.joinpath('pkg_for_pth.pth').as_posix()),
@@ -116,12 +162,22 @@ class TestPy3Prov(unittest.TestCase):
                           '/pkgs_pref/package/': 'package',
                           '/pkgs_pref/package/module.py': 'package'}]
 
+        # Deep search groups files by module
+        test_cases[3] = [{**test_cases[2][0], 'only_prefix': False, 'deep_search': True},
+                         {'/pkgs_pref/package/': 'package',
+                          '/non_pref/top_mod.py': None,
+                          '/non_pref/pkg/mod.py': None,
+                          '/non_pref/pkg': None,
+                          '/libs_pref/top_pkg': 'top_pkg',
+                          '/libs_pref/top_module.py': 'top_module.py'}]
+
         for subtest_num, inp_out in test_cases.items():
             with self.subTest(f"Testing files_filter subTest:{subtest_num}"):
                 self.assertEqual(py3prov.files_filter(**inp_out[0]), inp_out[1],
                                  msg=f'SubTest:{subtest_num} FAILED')
                 self.assertEqual(py3prov.files_filter(**inp_out[0], verbose_mode=False), inp_out[1],
                                  msg=f'SubTest:{subtest_num} FAILED')
+                self.assertListEqual(inp_out[0]['files'], non_pref + under_pref, msg=f'SubTest:{subtest_num} FAILED')
 
     def test_search_for_provides(self):
         prepare_package(self.tests_packages, 'pkg_for_searching', w_pth=True, level=1)
@@ -192,8 +248,47 @@ class TestPy3Prov(unittest.TestCase):
             with self.subTest(f"Testing generate_provides subTest:{subtest_num}"):
                 self.assertDictEqual(py3prov.generate_provides(**inp_out[0]), inp_out[1],
                                      msg=f'SubTest:{subtest_num} FAILED')
+
+        # Prefixes from .pth files are not added to the passed prefixes
+        prefixes = [self.tests_packages.as_posix()]
+        py3prov.generate_provides(**test_cases[5][0] | {'prefixes': prefixes})
+        self.assertEqual(prefixes, [self.tests_packages.as_posix()])
         rmtree(self.tmp)
 
+    def test_generate_provides_sets(self):
+        files = [p.as_posix() for p in prepare_package(self.tests_packages, 'pkg_for_sets', level=3)]
+
+        test_cases = {}
+        test_cases[0] = {'files': files, 'prefixes': [self.tests_packages.as_posix()], 'verbose': False,
+                         'skip_wrong_names': False, 'skip_namespace_pkgs': False}
+        test_cases[1] = {**test_cases[0], 'prefixes': []}
+        test_cases[2] = {**test_cases[0], 'skip_wrong_names': True, 'skip_namespace_pkgs': True}
+
+        for subtest_num, inp in test_cases.items():
+            with self.subTest(f"Testing generate_provides_sets subTest:{subtest_num}"):
+                abs_provides, full_provides, packages = py3prov.generate_provides_sets(**inp)
+                for provides, abs_mode in ((abs_provides, True), (full_provides, False)):
+                    expected = py3prov.generate_provides(**inp, skip_pth=True, abs_mode=abs_mode)
+                    self.assertSetEqual(provides, set(sum((p['provides'] for p in expected.values()), start=[])),
+                                        msg=f'SubTest:{subtest_num} FAILED')
+                    self.assertDictEqual(packages, {f: p['package'] for f, p in expected.items() if p['package']},
+                                         msg=f'SubTest:{subtest_num} FAILED')
+        rmtree(self.tmp)
+
+    def test_write_ndjson(self):
+        rmtree(self.tmp)
+        test_cases = {}
+        test_cases[0] = [{'records': []}, '']
+        test_cases[1] = [{'records': [{'file': 'mod.py', 'provides': ['mod']}, {'file': 'pkg'}]},
+                         '{"file":"mod.py","provides":["mod"]}\n{"file":"pkg"}\n']
+        test_cases[2] = [{**test_cases[1][0], 'buffer_size': 1, 'flush_interval': 0}, test_cases[1][1]]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(f"Testing write_ndjson subTest:{subtest_num}"):
+                stream = io.StringIO()
+                py3prov.write_ndjson(**inp_out[0], stream=stream)
+                self.assertEqual(stream.getvalue(), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+
     def test_genprov_from_env(self):
         pkg_name = "pkg_for_wheel"
         pkg_version = "5.5.5"
@@ -212,6 +307,98 @@ class TestPy3Prov(unittest.TestCase):
                                      msg=f'SubTest:{subtest_num} FAILED')
         rmtree(self.tmp)
 
+    def test_genprov_from_env_with_index(self):
+        pkg_name = "pkg_for_wheel"
+        index = self.tests_packages.joinpath('env.sqlite')
+        env = self.tests_packages.joinpath('env')
+        generate_install_wheel(env, pkg_name, "5.5.5")
+        expected = py3prov.genprov_from_env(paths=[env])
+
+        self.assertDictEqual(py3prov.genprov_from_env(paths=[env], index=index), expected)
+        self.assertDictEqual(py3prov.genprov_from_env(paths=[env], index=index), expected)
+
+        # RECORD is changed, but mtime of .dist-info is the same, so index is used
+        dist_info = env.joinpath(f"{pkg_name}-5.5.5.dist-info")
+        stat = dist_info.stat()
+        dist_info.joinpath("RECORD").write_text(f"{pkg_name}/__init__.py,,\n")
+        os.utime(dist_info, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertDictEqual(py3prov.genprov_from_env(paths=[env], index=index), expected)
+
+        os.utime(dist_info, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertDictEqual(py3prov.genprov_from_env(paths=[env], index=index),
+                             {(pkg_name, "5.5.5"): {pkg_name, f"{pkg_name}.__init__"}})
+
+        # New distribution changes mtime of site directory
+        generate_install_wheel(env, "other_pkg", "1.0")
+        self.assertDictEqual(py3prov.genprov_from_env(paths=[env], index=index), py3prov.genprov_from_env(paths=[env]))
+        self.assertIn(("other_pkg", "1.0"), py3prov.genprov_from_env(paths=[env], index=index))
+        rmtree(self.tmp)
+
+    def test_providers_index(self):
+        env_provides = {('b_pkg', '2.0'): {'common', 'b_mod', 'b_mod.sub'},
+                        ('a_pkg', '1.0'): {'common', 'a_mod'},
+                        ('c_pkg', '3.0'): {'shared', 'c_mod'},
+                        ('d_pkg', '4.0'): {'shared'},
+                        ('ns_a', '1.0'): {'ns', 'ns.a', 'ns.a.__init__'},
+                        ('ns_b', '1.0'): {'ns', 'ns.b', 'ns.b.mod'}}
+        index = py3prov.ProvidersIndex(env_provides)
+        test_cases = {'common': (('a_pkg', '1.0'), ('b_pkg', '2.0')),
+                      'b_mod.sub.attr': (('b_pkg', '2.0'),),
+                      'a_mod.x.y': (('a_pkg', '1.0'),),
+                      'common.x': (),
+                      'ns.a.x': (('ns_a', '1.0'),),
+                      'ns.b.x': (),
+                      'ns.c': (),
+                      'unknown': (),
+                      'unknown.common': ()}
+        for name, exp_res in test_cases.items():
+            with self.subTest(name=name):
+                self.assertEqual(index.providers(name), exp_res)
+
+        # Ambiguous "shared" goes to the package, which is already required
+        self.assertEqual(index.match({'c_mod', 'shared', 'common', 'b_mod', 'missing'}),
+                         ({('b_pkg', '2.0'): {'common', 'b_mod'}, ('c_pkg', '3.0'): {'c_mod', 'shared'}},
+                          {'missing'}))
+        self.assertEqual(index.match({'shared'}), ({('c_pkg', '3.0'): {'shared'}}, set()))
+
+    def test_provides_set(self):
+        rmtree(self.tmp)
+        provides = py3prov.ProvidesSet(['os', 'os.path', 'xml.etree'], {'pkg.mod', 'os'})
+        self.assertEqual(len(provides), 4)
+        self.assertEqual(set(provides), {'os', 'os.path', 'xml.etree', 'pkg.mod'})
+        test_cases = {'os': [True, None],
+                      'os.path.join': [False, 'os.path'],
+                      'xml': [False, None],
+                      'xml.etree.ElementTree': [False, 'xml.etree'],
+                      'pkg.mod': [True, None],
+                      'pkg.other': [False, None]}
+        for name, (contains, parent) in test_cases.items():
+            with self.subTest(name=name):
+                self.assertEqual(name in provides, contains)
+                self.assertEqual(provides.parent(name), parent)
+
+    def test_lazy_provides(self):
+        rmtree(self.tmp)
+        loaded = []
+
+        def tier(name, provides):
+            def load():
+                loaded.append(name)
+                return provides
+            return load
+
+        provides = py3prov.LazyProvides({'self'}, tier('cheap', {'os', 'os.path'}), tier('expensive', {'numpy'}))
+        self.assertIn('self', provides)
+        self.assertEqual(loaded, [])
+        self.assertIn('os', provides)
+        self.assertEqual(loaded, ['cheap'])
+        self.assertIn('os.path', provides)
+        self.assertEqual(loaded, ['cheap'])
+        self.assertNotIn('missing', provides)
+        self.assertNotIn('missing', provides)
+        self.assertEqual(loaded, ['cheap', 'expensive'])
+        self.assertEqual(provides.parent('numpy.linalg'), 'numpy')
+
 
 if __name__ == '__main__':
     unittest.main()
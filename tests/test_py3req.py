@@ -1,13 +1,18 @@
+import io
 import os
 import sys
 import ast
+import json
 import pathlib
 import tempfile
 import unittest
 from shutil import rmtree
 from functools import reduce
-from package import generate_somodule, generate_pymodule, generate_install_wheel
-from py3dephell import py3req
+from contextlib import redirect_stdout, redirect_stderr
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from package import prepare_package, generate_somodule, generate_pymodule, generate_install_wheel, generate_elf
+from py3dephell import py3req, py3cache, py3stats, py3elf
 
 
 class TestPy3Req(unittest.TestCase):
@@ -73,6 +78,34 @@ class TestPy3Req(unittest.TestCase):
                     self.assertEqual(py3req.catch_so(module, stderr), inp_out[1])
         os.unlink(module)
 
+    def test_catch_elf(self):
+        dep_version = os.getenv('RPM_PYTHON3_VERSION', '%s.%s' % sys.version_info[0:2])
+        generate_elf(self.tests_packages, 'ext.so', needed=['libc.so.6'])
+        generate_elf(self.tests_packages, 'ext_wo_suffix', needed=['libc.so.6'], pyinit=['ext_wo_suffix'])
+        generate_elf(self.tests_packages, 'tool', needed=['libc.so.6'], elf_class=1)
+        generate_pymodule(self.tests_packages, 'module')
+
+        test_cases = {}
+        test_cases[0] = [{'path': 'ext.so'}, [f'python{dep_version}-ABI(64bit)']]
+        test_cases[1] = [{'path': 'ext.so', 'shared_libs': True},
+                         [f'python{dep_version}-ABI(64bit)', 'libc.so.6()(64bit)']]
+        test_cases[2] = [{'path': 'ext_wo_suffix'}, [f'python{dep_version}-ABI(64bit)']]
+        test_cases[3] = [{'path': 'tool'}, []]
+        test_cases[4] = [{'path': 'tool', 'shared_libs': True}, ['libc.so.6']]
+        test_cases[5] = [{'path': 'module.py', 'shared_libs': True}, None]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3req.catch_elf subTest:{subtest_num}'):
+                path = self.tests_packages.joinpath(inp_out[0]['path']).as_posix()
+                self.assertEqual(py3req.catch_elf(**inp_out[0] | {'path': path}), inp_out[1],
+                                 msg=f'SubTest:{subtest_num} FAILED')
+
+        requirements = py3req.generate_requirements(files=[self.tests_packages.joinpath('tool').as_posix()],
+                                                    shared_libs=True, verbose=False)
+        self.assertEqual(requirements, {self.tests_packages.joinpath('tool').as_posix():
+                                        (set(), set(), set(), {'libc.so.6'})})
+        rmtree(self.tmp)
+
     def test_find_imports_in_ast(self):
         rmtree(self.tmp)
         test_cases = {}
@@ -87,6 +120,10 @@ class TestPy3Req(unittest.TestCase):
         test_cases[3] = [{**test_cases[2][0], 'code': 'try:\n\timport os\nexcept:\n\timport sys',
                          'only_external_deps': True},
                          ({}, {}, {}, {'os': [[2]], 'sys': [[[4]]]})]
+        test_cases[4] = [{**test_cases[1][0], 'skip_lines': True},
+                         ({'os.path': None}, {'subpkg.requests': None}, {'os': None, 'ast': None}, {})]
+        test_cases[5] = [{**test_cases[3][0], 'code': 'import ast\n' + test_cases[3][0]['code'], 'skip_lines': True},
+                         ({'ast': None}, {}, {}, {})]
 
         for subtest_num, inp_out in test_cases.items():
             with self.subTest(msg=f'Testing py3req.find_import_in_ast subTest:{subtest_num}'):
@@ -94,6 +131,207 @@ class TestPy3Req(unittest.TestCase):
                     self.assertTupleEqual(py3req._find_imports_in_ast(**inp_out[0], stderr=stderr), inp_out[1],
                                           msg=f'SubTest:{subtest_num} FAILED')
 
+    def test_process_file_with_cache(self):
+        text = 'from . import mod\nfrom .. import pkg\nimport os\ntry:\n\tfrom .sub import name\nexcept:\n\tpass\n'
+        pathes = []
+        for pkg in ('pkg_1', 'pkg_2'):
+            self.tests_packages.joinpath(pkg).mkdir()
+            pathes += generate_pymodule(self.tests_packages.joinpath(pkg), 'module', text=text)[:1]
+
+        with py3cache.ImportsCache(self.tests_packages.joinpath('imports.sqlite')) as cache:
+            for path in pathes * 2:
+                for only_external_deps in (False, True):
+                    with self.subTest(msg=f'Testing py3req.process_file with cache for {path}'):
+                        kwargs = {'path': path, 'prefixes': [self.tmp], 'only_external_deps': only_external_deps}
+                        self.assertTupleEqual(py3req.process_file(**kwargs, cache=cache),
+                                              py3req.process_file(**kwargs))
+            self.assertEqual((cache.hits, cache.misses), (6, 2))
+            for path in pathes:
+                with self.subTest(msg=f'Testing py3req.process_file with cache and skip_lines for {path}'):
+                    kwargs = {'path': path, 'prefixes': [self.tmp], 'only_external_deps': True}
+                    expected = py3req.process_file(**kwargs)
+                    self.assertTupleEqual(py3req.process_file(**kwargs, skip_lines=True, cache=cache),
+                                          tuple(dict.fromkeys(deps) for deps in expected[:3]) + ({},))
+            self.assertEqual((cache.hits, cache.misses), (7, 3))
+        rmtree(self.tmp)
+
+    def test_requirements_record(self):
+        rmtree(self.tmp)
+        name = ''.join(['num', 'py'])
+        record = py3req.Requirements.from_sets({name}, set(), ['os'], ())
+        self.assertEqual(record, ({'numpy'}, set(), {'os'}, set()))
+        self.assertEqual(record.absolute, {'numpy'})
+        self.assertIs(next(iter(record.absolute)), sys.intern(name))
+        self.assertIs(record.relative, record.abi)
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(py3req.Requirements(), (set(), set(), set(), set()))
+        # Fields are read-only, callers modify their copies
+        self.assertRaises(AttributeError, getattr, record.absolute, 'add')
+        self.assertRaises(AttributeError, setattr, record, 'absolute', set())
+
+    def test_read_ahead(self):
+        files = [generate_pymodule(self.tests_packages, f'module_{num}', text=f'import mod_{num}\n' * 100)[0]
+                 for num in range(10)]
+        files += generate_elf(self.tests_packages, 'tool')
+        files = [f.as_posix() for f in files] + [self.tests_packages.joinpath('missing.py').as_posix()]
+
+        test_cases = {0: {'depth': 0}, 1: {'depth': 4}, 2: {'depth': 4, 'memory_limit': 1}}
+        for subtest_num, kwargs in test_cases.items():
+            with self.subTest(msg=f'Testing py3req.read_ahead subTest:{subtest_num}'):
+                result = list(py3req.read_ahead(files, **kwargs))
+                self.assertListEqual([file for file, code in result], files)
+                expected = [None] * len(files) if not kwargs['depth'] else \
+                    [pathlib.Path(f).read_bytes() for f in files[:10]] + [py3elf.read_elf(files[10]), None]
+                self.assertListEqual([code for file, code in result], expected)
+                for file, code in result[:10]:
+                    self.assertTupleEqual(py3req.process_file(file, code=code), py3req.process_file(file))
+
+        # Single file is not read ahead
+        self.assertListEqual(list(py3req.read_ahead(files[:1], depth=4)), [(files[0], None)])
+
+        # Sizes of files in flight are counted, so the next file is read only after the previous one is consumed
+        events = []
+
+        def read(path):
+            events.append(('read', path))
+            return py3req._read_input(path)
+
+        with mock.patch.object(py3req, '_read_ahead_text', read):
+            for file, code in py3req.read_ahead(files[:4], depth=4, memory_limit=1):
+                events.append(('consume', file))
+        self.assertListEqual(events, [(event, file) for file in files[:4] for event in ('read', 'consume')])
+        rmtree(self.tmp)
+
+    def test_default_exclude(self):
+        self.tests_packages.joinpath('.git').mkdir()
+        self.tests_packages.joinpath('.git', 'hook.py').write_text('import hook_dep\n')
+        self.tests_packages.joinpath('mod.py').write_text('import mod_dep\n')
+
+        test_cases = {}
+        test_cases[0] = [[], 'mod_dep\n']
+        test_cases[1] = [['--no_default_exclude'], 'mod_dep\nhook_dep\n']
+        test_cases[2] = [['--no_default_exclude', '--exclude', 'mod.py'], 'hook_dep\n']
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3req.main subTest:{subtest_num}'):
+                with io.StringIO() as f, redirect_stdout(f):
+                    py3req.main(['--prefixes', self.tmp] + inp_out[0] + [self.tmp])
+                    self.assertEqual(f.getvalue(), inp_out[1], msg=f'SubTest:{subtest_num} FAILED')
+        rmtree(self.tmp)
+
+    def test_generate_requirements_incremental(self):
+        pkg = self.tests_packages.joinpath('pkg')
+        pkg.mkdir()
+        files = []
+        for name, text in [('__init__', ''), ('mod_a', 'import os\nimport pkg.mod_b\n'),
+                           ('mod_b', 'import numpy\n'), ('mod_c', 'from . import mod_a\nimport pkg.mod_d\n')]:
+            files += generate_pymodule(pkg, name, text=text)[:1]
+        files = [f.as_posix() for f in files]
+        options = {'prefixes': [self.tmp], 'exclude_stdlib': True, 'verbose': False}
+
+        def check(snapshot, **kwargs):
+            requirements, snapshot = py3req.generate_requirements_incremental(snapshot=snapshot, **kwargs,
+                                                                              **options)
+            current = [f for f in files if pathlib.Path(f).exists()]
+            self.assertDictEqual(requirements, py3req.generate_requirements(files=current, **options))
+            return json.loads(json.dumps(snapshot))
+
+        snapshot = check(None, added=files)
+        stats = py3stats.Stats()
+        self.assertEqual(check(snapshot, stats=stats), snapshot)
+        self.assertEqual(stats.counters['changed_files'], 0)
+        self.assertNotIn('filtered_files', stats.counters)
+        # Other provides are not loaded, if no file is filtered
+        self.assertNotIn('stdlib_provides', stats.counters)
+
+        # New provides are filtered only in files, which import them
+        files.append(generate_pymodule(pkg, 'mod_d', text='import requests\n')[0].as_posix())
+        stats = py3stats.Stats()
+        snapshot = check(snapshot, added=[files[-1]], stats=stats)
+        self.assertEqual((stats.counters['changed_files'], stats.counters['filtered_files']), (1, 2))
+
+        pkg.joinpath('mod_b.py').write_text('import numpy\nimport scipy\n')
+        snapshot = check(snapshot, changed=[pkg.joinpath('mod_b.py')])
+        pkg.joinpath('mod_b.py').unlink()
+        snapshot = check(snapshot, removed=[pkg.joinpath('mod_b.py').as_posix()])
+        self.assertNotIn(pkg.joinpath('mod_b.py').as_posix(), snapshot['files'])
+
+        # Snapshot made with other options is not reused
+        stats = py3stats.Stats()
+        py3req.generate_requirements_incremental(snapshot=snapshot, only_top_module=True, stats=stats, **options)
+        self.assertEqual(stats.counters['changed_files'], len(snapshot['files']))
+
+        # Snapshot made without verbose has no line numbers for verbose messages
+        stats = py3stats.Stats()
+        with open('/dev/null', 'w') as stderr, redirect_stderr(stderr):
+            py3req.generate_requirements_incremental(snapshot=snapshot, stats=stats, stderr=stderr,
+                                                     **options | {'verbose': True})
+        self.assertEqual(stats.counters['changed_files'], len(snapshot['files']))
+        rmtree(self.tmp)
+
+    def test_generate_requirements_stats(self):
+        files = prepare_package(self.tmp, 'pkg', level=2)
+        generate_pymodule(self.tests_packages, 'broken', text='import os\ndef (:\n')
+        files = [f.as_posix() for f in files] + [self.tests_packages.joinpath('broken.py').as_posix()]
+        stats = py3stats.Stats(top=3)
+        py3req.generate_requirements(files=files, prefixes=[self.tmp], exclude_stdlib=True, stats=stats,
+                                     verbose=False)
+
+        py_files = [f for f in files if f.endswith('.py')]
+        self.assertEqual(stats.counters['files_read'], len(py_files))
+        self.assertEqual(stats.counters['asts_built'], len(py_files) - 1)
+        self.assertEqual(stats.counters['syntax_errors'], 1)
+        self.assertEqual(stats.counters['bytes_read'], sum(pathlib.Path(f).stat().st_size for f in py_files))
+        self.assertTrue({'self_provides', 'stdlib_provides', 'parse', 'filter'}.issubset(stats.phases))
+        self.assertEqual(len(stats.slowest), 3)
+
+        # Tiers of provides are loaded lazily inside of filter phase, so phases are nested
+        prof = self.tests_packages.joinpath('prof')
+        nested = generate_pymodule(self.tests_packages, 'nested', text='import os\nimport numpy\n')[0]
+        with io.StringIO() as f, redirect_stdout(f):
+            py3req.main(['--prefixes', self.tmp, '--profile_dir', prof.as_posix(), '--stats_json',
+                         self.tests_packages.joinpath('stats.json').as_posix(), nested.as_posix()])
+            self.assertEqual(f.getvalue(), 'numpy\n')
+        phases = json.loads(self.tests_packages.joinpath('stats.json').read_text())['phases']
+        self.assertTrue({'stdlib_provides', 'filter'}.issubset(phases))
+        self.assertTrue({'stdlib_provides.prof', 'filter.prof'}.issubset(p.name for p in prof.iterdir()))
+        rmtree(self.tmp)
+
+    def test_has_import_token(self):
+        rmtree(self.tmp)
+        test_cases = {}
+        test_cases[0] = [b'DATA = [1, 2, 3]\n', False]
+        test_cases[1] = [b'from os import path\n', True]
+        test_cases[2] = [b'm = __import__("os")\n', True]
+        test_cases[3] = ['TEXT = "\u043f\u0440\u0438\u0432\u0435\u0442"\n'.encode(), False]
+        test_cases[4] = ['\uff49mport os\n'.encode(), True]
+        test_cases[5] = [b'# -*- coding: latin-1 -*-\nTEXT = "\xe9"\n', False]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3req._has_import_token subTest:{subtest_num}'):
+                self.assertEqual(py3req._has_import_token(inp_out[0]), inp_out[1],
+                                 msg=f'SubTest:{subtest_num} FAILED')
+
+    def test_tokenize_engine(self):
+        test_cases = {}
+        test_cases[0] = 'import os, os.path as p\nfrom . import (mod_1 as m,\n mod_2,)\nfrom ..sub import *\n'
+        test_cases[1] = 'import a; import b\nif a: import c\nclass A:\n\timport d\ntry:\n\timport e\nexcept:\n\tpass\n'
+        test_cases[2] = 'def f():\n\timport a\nx = (\n\timport_b)\n__import__("c")\nfrom a.b import c\n'
+        test_cases[3] = 'import\n'
+        path = self.tests_packages.joinpath('pkg', 'module.py')
+        path.parent.mkdir()
+
+        for subtest_num, text in test_cases.items():
+            path.write_text(text)
+            for skip_subs in (True, False):
+                with self.subTest(msg=f'Testing py3req tokenize engine subTest:{subtest_num}'):
+                    with open('/dev/null', 'w') as stderr:
+                        kwargs = {'path': path, 'prefixes': [self.tmp], 'skip_subs': skip_subs,
+                                  'only_external_deps': True, 'stderr': stderr, 'verbose': True}
+                        self.assertTupleEqual(py3req.process_file(**kwargs, engine='tokenize')[:3],
+                                              py3req.process_file(**kwargs)[:3], msg=f'SubTest:{subtest_num} FAILED')
+        rmtree(self.tmp)
+
     def test_filter_requirements(self):
         rmtree(self.tmp)
 
@@ -108,6 +346,10 @@ class TestPy3Req(unittest.TestCase):
                          set(['os.path', 'ast'])]
         test_cases[4] = [{**test_cases[3][0], 'only_top_module': True},
                          set(['os', 'ast'])]
+        test_cases[5] = [{**test_cases[3][0], 'deps': ['os.path', 'sys', 'ast', 'friend']},
+                         set(['os.path', 'ast'])]
+        test_cases[6] = [{**test_cases[5][0], 'deps': dict.fromkeys(test_cases[5][0]['deps']), 'verbose': True},
+                         set(['os.path', 'ast'])]
 
         for subtest_num, inp_out in test_cases.items():
             with self.subTest(msg=f'Testing py3req.filter_requirements subTest:{subtest_num}'):
@@ -115,6 +357,33 @@ class TestPy3Req(unittest.TestCase):
                     self.assertSetEqual(py3req.filter_requirements(**inp_out[0], stderr=stderr), inp_out[1],
                                         msg=f'SubTest:{subtest_num} FAILED')
 
+    def test_get_std_provides(self):
+        cache = self.tests_packages.joinpath('stdlib.json')
+        provides = py3req.get_std_provides(verbose=False)
+        self.assertTrue({'os', 'os.path', 'json.decoder'}.issubset(provides))
+        # Tier of standard library provides is frozen once and shared by runs
+        self.assertIs(py3req._get_std_provides(), py3req._get_std_provides())
+
+        test_cases = {}
+        test_cases[0] = [{'cache_path': cache}, provides, True]
+        test_cases[1] = [{'cache_path': cache}, provides, True]
+        test_cases[2] = [{'cache_path': cache, 'rebuild': True}, provides, True]
+
+        for subtest_num, inp_out in test_cases.items():
+            with self.subTest(msg=f'Testing py3req.get_std_provides subTest:{subtest_num}'):
+                self.assertSetEqual(py3req.get_std_provides(**inp_out[0], verbose=False), inp_out[1],
+                                    msg=f'SubTest:{subtest_num} FAILED')
+                self.assertEqual(cache.exists(), inp_out[2], msg=f'SubTest:{subtest_num} FAILED')
+
+        # Key of cache does not depend on sys.path, so runs with other PYTHONPATH share it
+        key = py3req._std_provides_key(py3req._form_std_provides())
+        sys.path.insert(0, self.tmp)
+        try:
+            self.assertEqual(py3req._std_provides_key(py3req._form_std_provides()), key)
+        finally:
+            sys.path.remove(self.tmp)
+        rmtree(self.tmp)
+
     def test_generate_requirements(self):
         dep_version = os.getenv('RPM_PYTHON3_VERSION', '%s.%s' % sys.version_info[0:2])
         so_dep = f'python{dep_version}-ABI(64bit)'
@@ -127,6 +396,19 @@ class TestPy3Req(unittest.TestCase):
         module_2 = generate_pymodule(self.tmp, "module_2", text="import sys\n__import__('unmet')\nimport importlib")
         module_3 = generate_pymodule(self.tmp, "module_3", text="import pkg_for_wheel")
         files = list(map(lambda x: x.absolute().as_posix(), module_1 + module_2 + module_3))
+        # Unresolved submodule of package should not make it depend on its installed copy
+        self.tests_packages.joinpath(pkg_name, 'module_4.py').write_text(f'import {pkg_name}.missing\n')
+        pkg_files = py3req.expand_input([self.tests_packages.joinpath(pkg_name)])
+        # Other distributions in namespace of package are matched exactly, namespace itself is not matched
+        env = self.tests_packages.joinpath('env')
+        env.joinpath('backports', 'ssl').mkdir(parents=True)
+        env.joinpath('backports', 'ssl', '__init__.py').write_text('')
+        env.joinpath('backports.ssl-1.0.dist-info').mkdir()
+        env.joinpath('backports.ssl-1.0.dist-info', 'RECORD').write_text('backports/ssl/__init__.py,,0\n')
+        self.tests_packages.joinpath('src', 'backports').mkdir(parents=True)
+        self.tests_packages.joinpath('src', 'backports', 'functools_lru_cache.py').write_text(
+            'import backports.ssl\nimport backports.zoneinfo\n')
+        ns_files = py3req.expand_input([self.tests_packages.joinpath('src', 'backports')])
 
         test_cases = {}
         test_cases[0] = [{'files': files},
@@ -136,11 +418,16 @@ class TestPy3Req(unittest.TestCase):
                          list(map(lambda dep: f"{dep}", ['requests', 'unmet', "pkg_for_wheel"])) + [so_dep]]
         test_cases[2] = [{**test_cases[1][0], "inspect_env": True, 'exclude_stdlib': True, "env_path": [self.tmp]},
                          ["pkg_for_wheel==5.5.5"]]
+        test_cases[3] = [{'files': pkg_files, 'prefixes': [self.tmp], "inspect_env": True, 'exclude_stdlib': True,
+                          "env_path": [self.tmp]}, []]
+        test_cases[4] = [{'files': ns_files, 'prefixes': [self.tests_packages.joinpath('src').as_posix()],
+                          "inspect_env": True, 'exclude_stdlib': True, "env_path": [env.as_posix()]},
+                         ['backports.ssl==1.0']]
 
         for subtest_num, inp_out in test_cases.items():
             with self.subTest(msg=f'Testing py3req.filter_requirements subTest:{subtest_num}'):
                 with open('/dev/null', 'w') as stderr:
-                    if subtest_num != 2:
+                    if subtest_num < 2:
                         got = reduce(lambda d1, d2: d1 | d2,
                                      reduce(lambda d1, d2: d1 + d2,
                                             (py3req.generate_requirements(**inp_out[0],
@@ -151,6 +438,45 @@ class TestPy3Req(unittest.TestCase):
                                         msg=f'SubTest:{subtest_num} FAILED')
         rmtree(self.tmp)
 
+    def test_generate_requirements_jobs(self):
+        files = []
+        for num in range(10):
+            files += generate_pymodule(self.tmp, f"module_{num}",
+                                       text=f"from . import module_{num + 1}\nimport os\nimport requests_{num}")
+        files = list(map(lambda x: x.absolute().as_posix(), files))
+
+        with open('/dev/null', 'w') as stderr:
+            serial = py3req.generate_requirements(files=files, stderr=stderr)
+            for jobs in (2, None):
+                with self.subTest(msg=f'Testing py3req.generate_requirements with jobs:{jobs}'):
+                    parallel = py3req.generate_requirements(files=files, jobs=jobs, stderr=stderr)
+                    self.assertEqual(list(parallel.items()), list(serial.items()))
+        rmtree(self.tmp)
+
+    def test_iter_requirements(self):
+        files = []
+        for num in range(10):
+            files += generate_pymodule(self.tmp, f'module_{num}', text=f'import os\nimport requests_{num}\n')[:1]
+        files = [f.as_posix() for f in files]
+
+        with open('/dev/null', 'w') as stderr:
+            serial = py3req.generate_requirements(files=files, stderr=stderr)
+            for jobs in (1, 2):
+                with self.subTest(msg=f'Testing py3req.iter_requirements with jobs:{jobs}'):
+                    requirements = py3req.iter_requirements(files, jobs=jobs, stderr=stderr)
+                    self.assertEqual(next(requirements), (files[0], serial[files[0]]))
+                    self.assertEqual(list(requirements), list(serial.items())[1:])
+
+        # Items are taken from iterator only when there is room in window
+        taken = []
+        items = (taken.append(num) or num for num in range(100))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = py3req._bounded_map(executor, lambda num: num * 2, items, 4)
+            self.assertEqual(next(results), 0)
+            self.assertLessEqual(len(taken), 5)
+            self.assertEqual(list(results), [num * 2 for num in range(1, 100)])
+        rmtree(self.tmp)
+
 
 if __name__ == '__main__':
     unittest.main()
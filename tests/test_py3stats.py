@@ -0,0 +1,52 @@
+import sys
+import time
+import pathlib
+import unittest
+import tempfile
+from shutil import rmtree
+from py3dephell import py3stats
+
+
+class TestPy3Stats(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        print(f'Created directory for test:{self.tmp}', file=sys.stderr)
+        self.tests_packages = pathlib.Path(self.tmp)
+
+    def test_stats(self):
+        stats = py3stats.Stats(top=2, profile_dir=self.tests_packages.joinpath('prof'))
+        for _ in range(2):
+            with stats.phase('parse'):
+                stats.count('files_read')
+        self.assertListEqual(list(stats.iterate('filter', range(3))), [0, 1, 2])
+        for path, wall in [('a.py', 0.5), ('b.py', 0.1), ('c.py', 0.7)]:
+            stats.add_file(path, wall)
+
+        other = py3stats.Stats(top=2)
+        other.count('files_read', 3)
+        other.add_file('d.py', 0.6)
+        stats.merge(other.as_dict())
+
+        self.assertEqual(stats.phases['parse']['calls'], 2)
+        self.assertEqual(stats.phases['filter']['calls'], 4)
+        self.assertDictEqual(stats.counters, {'files_read': 5})
+        self.assertListEqual(stats.slowest, [('c.py', 0.7), ('d.py', 0.6)])
+        self.assertListEqual(sorted(p.name for p in stats.dump_profiles()), ['filter.prof', 'parse.prof'])
+        rmtree(self.tmp)
+
+    def test_nested_phases(self):
+        stats = py3stats.Stats(profile_dir=self.tests_packages)
+        with stats.phase('outer'):
+            with stats.phase('inner'):
+                time.sleep(0.05)
+            with stats.phase('inner'):
+                pass
+        self.assertEqual(stats.phases['outer']['calls'], 1)
+        self.assertEqual(stats.phases['inner']['calls'], 2)
+        self.assertLess(stats.phases['outer']['wall'], stats.phases['inner']['wall'])
+        self.assertListEqual(sorted(p.name for p in stats.dump_profiles()), ['inner.prof', 'outer.prof'])
+        rmtree(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()